@@ -0,0 +1,209 @@
+"""
+Streaming accumulators for the model scores of haxml.evaluation.score_model.
+
+An accumulator takes batches of kicks as (match, y, xg) arrays, keeps only
+counts and sums, and can be merged with accumulators filled in other
+processes, so models can be scored on any number of kicks without holding
+them in memory.
+"""
+
+import numpy as np
+
+
+# Number of XG bins for the histogram ROC AUC. Pairs of a goal and a non-goal
+# in the same bin count as ties, so the error is about half the share of such
+# pairs. Most kicks have XG near 0, so bins are equal width on a log scale
+# above AUC_XG_SCALE and close to equal width below it: about 1% of the XG
+# wide from 0.001 up, and 1e-6 wide near 0.
+AUC_BINS = 1000
+AUC_XG_SCALE = 1e-4
+
+
+class MetricAccumulator:
+    """
+    Accumulates the scores of score_model over batches of kicks.
+    Args:
+        n_bins: Number of XG bins for the ROC AUC (int).
+        threshold: Kicks with XG above this are predicted as goals (float).
+    """
+
+    def __init__(self, n_bins=AUC_BINS, threshold=0.5):
+        self.n_bins = n_bins
+        self.threshold = threshold
+        # Confusion matrix counts.
+        self.tp = 0
+        self.fp = 0
+        self.tn = 0
+        self.fn = 0
+        # Histograms of XG for positive and negative kicks.
+        self.pos_hist = np.zeros(n_bins, dtype=np.int64)
+        self.neg_hist = np.zeros(n_bins, dtype=np.int64)
+        # Count, mean, and sum of squared differences from the mean of XG.
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        # Sums of actual goals and XG per match.
+        self.matches = {}
+
+    def update(self, match, y, xg, ag=None):
+        """
+        Adds a batch of kicks. Kicks of one match may be split over batches.
+        Args:
+            match: Match ID of each kick (array-like).
+            y: Actual label of each kick, 0 or 1 (array-like).
+            xg: Predicted probability of a goal for each kick (array-like).
+            ag: Actual goals of each kick, if not the same as y (array-like).
+        """
+        y = np.asarray(y).astype(bool)
+        xg = np.asarray(xg, dtype=np.float64)
+        if len(xg) == 0:
+            return
+        yp = xg > self.threshold
+        self.tp += int(np.sum(y & yp))
+        self.fp += int(np.sum(~y & yp))
+        self.tn += int(np.sum(~y & ~yp))
+        self.fn += int(np.sum(y & ~yp))
+        bins = get_bins(xg, self.n_bins)
+        self.pos_hist += np.bincount(bins[y], minlength=self.n_bins)
+        self.neg_hist += np.bincount(bins[~y], minlength=self.n_bins)
+        self.add_moments(len(xg), np.mean(xg), np.sum((xg - np.mean(xg)) ** 2))
+        ag = y if ag is None else np.asarray(ag)
+        codes, uniques = get_codes(match)
+        ag_sums = np.bincount(codes, weights=ag, minlength=len(uniques))
+        xg_sums = np.bincount(codes, weights=xg, minlength=len(uniques))
+        for mid, ag_sum, xg_sum in zip(uniques, ag_sums, xg_sums):
+            self.add_match(mid, ag_sum, xg_sum)
+
+    def add_moments(self, count, mean, m2):
+        # Combines means and squared differences of two sets of values (Chan et
+        # al.), which is stable where sums of squares are not.
+        total = self.count + count
+        delta = mean - self.mean
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+    def add_match(self, mid, ag_sum, xg_sum):
+        sums = self.matches.get(mid)
+        if sums is None:
+            self.matches[mid] = [float(ag_sum), float(xg_sum)]
+        else:
+            sums[0] += ag_sum
+            sums[1] += xg_sum
+
+    def merge(self, other):
+        """
+        Adds the kicks of another accumulator, e.g. one filled in a worker
+        process. Both must use the same number of bins and threshold.
+        Returns:
+            This accumulator.
+        """
+        if other.n_bins != self.n_bins or other.threshold != self.threshold:
+            raise ValueError("Cannot merge accumulators with different bins or thresholds.")
+        self.tp += other.tp
+        self.fp += other.fp
+        self.tn += other.tn
+        self.fn += other.fn
+        self.pos_hist += other.pos_hist
+        self.neg_hist += other.neg_hist
+        if other.count > 0:
+            self.add_moments(other.count, other.mean, other.m2)
+        for mid, (ag_sum, xg_sum) in other.matches.items():
+            self.add_match(mid, ag_sum, xg_sum)
+        return self
+
+    def get_roc_auc_xg(self):
+        """
+        ROC AUC from the XG histograms: the chance that a random goal has
+        higher XG than a random non-goal, counting pairs in the same bin as
+        ties.
+        Returns:
+            AUC (float), or NaN if there are no goals or no non-goals.
+        """
+        return float(get_histogram_auc(self.pos_hist, self.neg_hist))
+
+    def result(self):
+        """
+        Returns:
+            Dictionary with the same scores as score_model: "accuracy",
+            "precision", "recall", "roc_auc", "roc_auc_xg", "match_mae",
+            "match_rmse", "xg_mean", and "xg_std". All are exact except
+            roc_auc_xg, which comes from the XG histograms.
+        """
+        total = self.tp + self.fp + self.tn + self.fn
+        errors = np.array([ag_sum - xg_sum for ag_sum, xg_sum in self.matches.values()])
+        return {
+            "accuracy": (self.tp + self.tn) / total if total > 0 else float("nan"),
+            # Zero without predicted or actual positives, like sklearn.
+            "precision": self.tp / (self.tp + self.fp) if self.tp + self.fp > 0 else 0.0,
+            "recall": self.tp / (self.tp + self.fn) if self.tp + self.fn > 0 else 0.0,
+            "roc_auc": float(get_label_auc(self.tp, self.fp, self.tn, self.fn)),
+            "roc_auc_xg": self.get_roc_auc_xg(),
+            "match_mae": float(np.mean(np.abs(errors))) if len(errors) > 0 else float("nan"),
+            "match_rmse": float(np.sqrt(np.mean(errors ** 2))) if len(errors) > 0 else float("nan"),
+            "xg_mean": float(self.mean) if self.count > 0 else float("nan"),
+            "xg_std": float(np.sqrt(self.m2 / self.count)) if self.count > 0 else float("nan")
+        }
+
+
+def get_codes(values):
+    """
+    Encodes values as integer codes, using the codes of a categorical if it
+    already has them.
+    Returns:
+        Tuple (codes, uniques) of NumPy arrays.
+    """
+    if hasattr(values, "cat"):
+        values = values.cat.remove_unused_categories()
+        return values.cat.codes.values.astype(np.int64), values.cat.categories.values
+    if hasattr(values, "categories"):
+        values = values.remove_unused_categories()
+        return values.codes.astype(np.int64), values.categories.values
+    uniques, codes = np.unique(np.asarray(values), return_inverse=True)
+    return codes, uniques
+
+
+def get_label_auc(tp, fp, tn, fn):
+    """
+    ROC AUC of predicted labels instead of probabilities, as in score_model:
+    the area under the one-point ROC curve, (1 + TPR - FPR) / 2.
+    Args:
+        tp, fp, tn, fn: Confusion matrix counts, or arrays of counts.
+    Returns:
+        AUC, or one AUC per count (NumPy array), NaN without positive or
+        negative kicks.
+    """
+    pos = np.asarray(tp + fn, dtype=float)
+    neg = np.asarray(fp + tn, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((pos > 0) & (neg > 0), (1 + tp / pos - fp / neg) / 2, np.nan)
+
+
+def get_histogram_auc(pos_hist, neg_hist):
+    """
+    ROC AUC from histograms of XG for positive and negative kicks over the
+    same bins, counting pairs in the same bin as ties.
+    Args:
+        pos_hist: Counts of positive kicks per bin, or one row of counts per
+            set of kicks (NumPy array).
+        neg_hist: Counts of negative kicks per bin, same shape as pos_hist.
+    Returns:
+        AUC, or one AUC per row (NumPy array), NaN without positive or
+        negative kicks.
+    """
+    n_pos = pos_hist.sum(axis=-1)
+    n_neg = neg_hist.sum(axis=-1)
+    neg_below = np.cumsum(neg_hist, axis=-1) - neg_hist
+    pairs = np.sum(pos_hist * (neg_below + 0.5 * neg_hist), axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((n_pos > 0) & (n_neg > 0), pairs / (n_pos * n_neg), np.nan)
+
+
+def get_bins(xg, n_bins):
+    """
+    Returns:
+        Bin of each XG value for the ROC AUC histograms, finer near 0 (NumPy
+        array).
+    """
+    scaled = np.log1p(np.asarray(xg, dtype=np.float64) / AUC_XG_SCALE) / np.log1p(1 / AUC_XG_SCALE)
+    return np.clip((scaled * n_bins).astype(np.int64), 0, n_bins - 1)
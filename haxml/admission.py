@@ -0,0 +1,153 @@
+"""
+Admission control and deadlines for CPU-heavy work in the prediction server.
+"""
+
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeoutError
+)
+import threading
+import time
+
+
+class Overloaded(RuntimeError):
+    """
+    Raised when there is no room to queue more work.
+    """
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when work can no longer finish before its deadline.
+    """
+    pass
+
+
+class Deadline:
+    """
+    Point in time by which a request should be done.
+    Args:
+        secs: Seconds from now until the deadline, or None for no deadline
+            (float).
+    """
+
+    def __init__(self, secs=None):
+        self.expires = time.monotonic() + secs if secs is not None else None
+
+    def remaining(self):
+        """
+        Returns:
+            Seconds left until the deadline, at least 0, or None if there is
+            no deadline (float).
+        """
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def check(self, stage):
+        """
+        Raises DeadlineExceeded if the deadline has passed before the stage.
+        """
+        if self.expired():
+            raise DeadlineExceeded("Deadline passed before: {}".format(stage))
+
+
+class BoundedExecutor:
+    """
+    Runs work on a fixed number of threads with a bounded queue. Work that
+    arrives when the queue is full is rejected right away rather than waiting,
+    and queued work whose deadline passes is dropped without running.
+    Args:
+        n_workers: Number of threads running work (int).
+        max_queue: Maximum number of tasks waiting for a thread (int).
+    """
+
+    def __init__(self, n_workers=2, max_queue=8):
+        self.n_workers = n_workers
+        self.max_queue = max_queue
+        self.pool = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="score")
+        self.slots = threading.BoundedSemaphore(n_workers + max_queue)
+        self.lock = threading.Lock()
+        self.n_waiting = 0
+        self.n_running = 0
+        self.stats = {
+            "admitted": 0,
+            "rejected": 0,
+            "expired": 0,
+            "done": 0,
+            "errors": 0
+        }
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def run(self, fn, deadline):
+        """
+        Runs fn on a worker thread and waits for its result until the deadline.
+        Args:
+            fn: function(deadline) that does the work, and may call
+                deadline.check between stages to stop early.
+            deadline: Deadline for the work.
+        Returns:
+            Result of fn.
+        Raises:
+            Overloaded if the queue is full.
+            DeadlineExceeded if the work did not finish before the deadline.
+            Any exception raised by fn.
+        """
+        if not self.slots.acquire(blocking=False):
+            self.count("rejected")
+            raise Overloaded("Too many requests waiting to be scored.")
+        with self.lock:
+            self.stats["admitted"] += 1
+            self.n_waiting += 1
+
+        def task():
+            with self.lock:
+                self.n_waiting -= 1
+                self.n_running += 1
+            try:
+                deadline.check("start")
+                return fn(deadline)
+            finally:
+                with self.lock:
+                    self.n_running -= 1
+
+        def on_done(future):
+            self.slots.release()
+            if future.cancelled():
+                with self.lock:
+                    self.n_waiting -= 1
+                    self.stats["expired"] += 1
+            elif isinstance(future.exception(), DeadlineExceeded):
+                self.count("expired")
+            elif future.exception() is not None:
+                self.count("errors")
+            else:
+                self.count("done")
+
+        future = self.pool.submit(task)
+        future.add_done_callback(on_done)
+        try:
+            return future.result(timeout=deadline.remaining())
+        except DeadlineExceeded:
+            raise
+        except FutureTimeoutError:
+            # Drop the task if it has not started. A running task stops at its
+            # next deadline check.
+            future.cancel()
+            raise DeadlineExceeded("Deadline passed while scoring.")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["waiting"] = self.n_waiting
+            stats["running"] = self.n_running
+        stats["workers"] = self.n_workers
+        stats["max_queue"] = self.max_queue
+        return stats
@@ -0,0 +1,157 @@
+"""
+Micro-batching of predictions from concurrent requests.
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.coalesce import (
+    get_follower_error
+)
+from haxml.metrics import (
+    Histogram,
+    LATENCY_BUCKETS_MS
+)
+import math
+import numpy as np
+import pandas as pd
+import threading
+import time
+
+
+# Upper bounds of the histogram buckets for calls and rows in each batch.
+BATCH_CALLS_BUCKETS = [1, 2, 4, 8, 16, 32, math.inf]
+BATCH_ROWS_BUCKETS = [10, 100, 250, 500, 1000, 2500, math.inf]
+
+
+class Batch:
+    """
+    Feature matrices collected for one stacked prediction.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.n_rows = 0
+        self.closed = False
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Wraps a classifier so that concurrent predict_proba calls are stacked into
+    one call. The first call to arrive opens a batch and waits up to window_ms
+    for other calls to join, or until the batch has max_rows rows, then
+    predicts all rows at once and hands each caller its own rows. This trades
+    a short wait for fewer calls to the classifier, whose fixed cost per call
+    outweighs the cost per row for the few kicks in one match.
+    Follows the scikit-learn classifier interface for prediction.
+    Args:
+        clf: Classifier to wrap.
+        window_ms: Milliseconds to wait for other calls to join a batch (float).
+        max_rows: Number of rows that closes a batch early (int).
+    """
+
+    def __init__(self, clf, window_ms=2.0, max_rows=1000):
+        self.clf = clf
+        self.classes_ = clf.classes_
+        self.window_ms = window_ms
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.batch = None
+        self.n_batches = 0
+        self.n_calls = 0
+        self.batch_calls = Histogram(BATCH_CALLS_BUCKETS)
+        self.batch_rows = Histogram(BATCH_ROWS_BUCKETS)
+        self.window = Histogram(LATENCY_BUCKETS_MS)
+
+    def __repr__(self):
+        return "MicroBatcher({}, window_ms={}, max_rows={})".format(self.clf, self.window_ms, self.max_rows)
+
+    def predict_proba(self, X):
+        """
+        Predicts class probabilities for the rows of X, in a batch with any
+        concurrent calls.
+        Args:
+            X: Feature matrix (DataFrame or NumPy array), with the same
+                columns in every call.
+        Returns:
+            Class probabilities for each row of X (NumPy array).
+        Raises:
+            Any exception raised by the classifier, in the thread that ran the
+            batch, and a copy caused by it in every other thread in the batch.
+        """
+        with self.lock:
+            batch = self.batch
+            is_leader = batch is None
+            if is_leader:
+                batch = Batch()
+                self.batch = batch
+            start = batch.n_rows
+            batch.items.append(X)
+            batch.n_rows += len(X)
+            if batch.n_rows >= self.max_rows:
+                self.close(batch)
+        if is_leader:
+            self.run(batch)
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            if is_leader:
+                raise batch.error
+            # Each thread raises its own copy, so tracebacks do not mix.
+            raise get_follower_error(batch.error) from batch.error
+        return batch.result[start:start + len(X)]
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def close(self, batch):
+        """
+        Stops new calls from joining the batch. Call with the lock held.
+        """
+        if not batch.closed:
+            batch.closed = True
+            if self.batch is batch:
+                self.batch = None
+            batch.full.set()
+
+    def run(self, batch):
+        """
+        Waits for the batch window, then predicts the stacked batch.
+        """
+        start_time = time.perf_counter()
+        batch.full.wait(self.window_ms / 1000)
+        with self.lock:
+            self.close(batch)
+            self.n_batches += 1
+            self.n_calls += len(batch.items)
+            self.batch_calls.observe(len(batch.items))
+            self.batch_rows.observe(batch.n_rows)
+            self.window.observe(1000 * (time.perf_counter() - start_time))
+        try:
+            if len(batch.items) == 1:
+                X = batch.items[0]
+            elif isinstance(batch.items[0], pd.DataFrame):
+                X = pd.concat(batch.items, ignore_index=True)
+            else:
+                X = np.concatenate(batch.items)
+            batch.result = self.clf.predict_proba(X)
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "window_ms": self.window_ms,
+                "max_rows": self.max_rows,
+                "batches": self.n_batches,
+                "calls": self.n_calls,
+                "calls_per_batch": self.batch_calls.to_dict(),
+                "rows_per_batch": self.batch_rows.to_dict(),
+                "wait_ms": self.window.to_dict()
+            }
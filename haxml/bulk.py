@@ -0,0 +1,214 @@
+"""
+Offline scoring of many matches at once, e.g. all-time kicks, see
+scripts/score_all_matches.py.
+
+Matches are scored in chunks by a pool of processes. Each chunk is written as
+one Parquet file of per-kick XG, with a manifest of the match IDs in each
+file:
+
+    <path>/_manifest.json
+    <path>/part-00000.parquet
+
+A manifest entry is written after its file, so an interrupted run can resume
+by skipping the matches in the manifest. Needs pyarrow.
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.columns import (
+    ColumnBuilder
+)
+from haxml.prediction import (
+    get_row_dtypes
+)
+from haxml.utils import (
+    inflate_match
+)
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    as_completed
+)
+from tqdm import tqdm
+import json
+import os
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# Columns written for each kick, besides "xg".
+OUTPUT_COLUMNS = ["match", "index", "time", "type", "team", "x", "y", "ag"]
+
+
+class BulkOutput:
+    """
+    Directory of Parquet files with the XG of each kick, from one model.
+    Args:
+        path: Directory to write the files in (str).
+        model_key: Key of the model version the XG is from (str). Resuming
+            with a different model version raises a ValueError.
+    """
+
+    def __init__(self, path, model_key):
+        if pa is None:
+            raise ImportError("BulkOutput needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.manifest_path = os.path.join(path, "_manifest.json")
+        self.manifest = self.read_manifest(model_key)
+
+    def read_manifest(self, model_key):
+        if not os.path.exists(self.manifest_path):
+            return {"model": model_key, "parts": []}
+        with open(self.manifest_path, "r") as file:
+            manifest = json.load(file)
+        if manifest["model"] != model_key:
+            raise ValueError("Output has XG from {}, not {}: {}".format(manifest["model"], model_key, self.path))
+        return manifest
+
+    def write_manifest(self):
+        tmpfile = "{}.{}.tmp".format(self.manifest_path, os.getpid())
+        with open(tmpfile, "w") as file:
+            json.dump(self.manifest, file, indent=4)
+        os.replace(tmpfile, self.manifest_path)
+
+    def match_ids(self):
+        """
+        Returns:
+            IDs of the matches already scored (set of str).
+        """
+        return {mid for part in self.manifest["parts"] for mid in part["matches"]}
+
+    def append(self, d_part, match_ids, secs=None):
+        """
+        Writes the kicks of a chunk of matches as a new file.
+        Args:
+            d_part: DataFrame of kicks with "xg".
+            match_ids: IDs of the scored matches, including any without kicks
+                (list of str).
+            secs: Seconds it took to score the matches (float).
+        """
+        os.makedirs(self.path, exist_ok=True)
+        filename = "part-{:05d}.parquet".format(len(self.manifest["parts"]))
+        # Write categoricals as plain strings, so every file has one schema.
+        for col in d_part.select_dtypes(include="category").columns:
+            d_part[col] = d_part[col].astype(object)
+        tmpfile = os.path.join(self.path, ".{}.tmp".format(filename))
+        pq.write_table(pa.Table.from_pandas(d_part, preserve_index=False), tmpfile)
+        os.replace(tmpfile, os.path.join(self.path, filename))
+        self.manifest["parts"].append({
+            "file": filename,
+            "matches": list(match_ids),
+            "kicks": len(d_part),
+            "secs": secs,
+            "added": time.time()
+        })
+        self.write_manifest()
+
+
+# Model, match fetcher, and stadiums of each scoring worker process, set once
+# per process by init_bulk_worker instead of being sent with every chunk.
+bulk_data = {}
+
+
+def init_bulk_worker(model, load_clf, fetch, stadiums):
+    bulk_data["model"] = model
+    bulk_data["clf"] = load_clf(model.path)
+    bulk_data["fetch"] = fetch
+    bulk_data["stadiums"] = stadiums
+
+
+def score_chunk(match_ids):
+    """
+    Scores a chunk of matches in a worker process, predicting all of their
+    kicks at once.
+    Returns:
+        Tuple (d_part, scored, failed, secs) of the DataFrame of kicks with
+        "xg", the IDs of scored matches (list of str), a list of (match ID,
+        error message) for matches that could not be scored, and the seconds
+        it took.
+    """
+    start = time.perf_counter()
+    model = bulk_data["model"]
+    builder = ColumnBuilder(dict(get_row_dtypes(model.generate_rows), match="category", type="category"))
+    scored = []
+    failed = []
+    for mid in match_ids:
+        try:
+            match = inflate_match(bulk_data["fetch"](mid))
+            rows = list(model.generate_rows(match, bulk_data["stadiums"][match["stadium"]]))
+        except Exception as e:
+            failed.append((mid, "{}: {}".format(type(e).__name__, e)))
+            continue
+        for row in rows:
+            row["type"] = match["kicks"][row["index"]]["type"]
+        builder.extend(rows, match=mid)
+        scored.append(mid)
+    d = builder.to_frame()
+    if len(d) == 0:
+        return d.reindex(columns=OUTPUT_COLUMNS + ["xg"]), scored, failed, time.perf_counter() - start
+    d_part = d[OUTPUT_COLUMNS].copy()
+    d_part["xg"] = bulk_data["clf"].predict_proba(d[model.features])[:,1].astype("float32")
+    return d_part, scored, failed, time.perf_counter() - start
+
+
+def score_all(match_ids, model, load_clf, fetch, stadiums, output, n_jobs=1, chunk_size=50):
+    """
+    Scores every match that is not in the output yet and writes the XG of
+    each kick, one file per chunk of matches.
+    Args:
+        match_ids: IDs of the matches to score (list of str).
+        model: Model version to score with (ModelVersion).
+        load_clf: function(path) that loads the model's classifier, called
+            once in each process.
+        fetch: function(mid) that returns packed match data. Must be
+            importable from a module (not a lambda) when n_jobs > 1.
+        stadiums: Dictionary of stadium data (via haxml.utils.get_stadiums).
+        output: BulkOutput to write to.
+        n_jobs: Number of processes to score chunks in, or 1 to score them in
+            this process (int).
+        chunk_size: Number of matches per chunk and file (int).
+    Returns:
+        Dictionary with counts of "matches", "skipped", and "failed" matches,
+        "kicks", "secs", "kicks_per_sec", and "errors", a list of (match ID,
+        error message) for failed matches.
+    """
+    done = output.match_ids()
+    todo = [mid for mid in match_ids if mid not in done]
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    report = {"matches": 0, "skipped": len(match_ids) - len(todo), "failed": 0, "kicks": 0, "errors": []}
+    start = time.perf_counter()
+    bar = tqdm(total=len(todo))
+
+    def write(res):
+        d_part, scored, failed, secs = res
+        if len(scored) > 0:
+            output.append(d_part, scored, secs=secs)
+        report["matches"] += len(scored)
+        report["failed"] += len(failed)
+        report["kicks"] += len(d_part)
+        report["errors"].extend(failed)
+        bar.set_postfix(kicks_per_sec="{:.0f}".format(report["kicks"] / (time.perf_counter() - start)))
+        bar.update(len(scored) + len(failed))
+
+    if n_jobs == 1:
+        init_bulk_worker(model, load_clf, fetch, stadiums)
+        for chunk in chunks:
+            write(score_chunk(chunk))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=init_bulk_worker,
+            initargs=(model, load_clf, fetch, stadiums)
+        ) as pool:
+            futures = [pool.submit(score_chunk, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                write(future.result())
+    bar.close()
+    report["secs"] = time.perf_counter() - start
+    report["kicks_per_sec"] = report["kicks"] / report["secs"] if report["secs"] > 0 else 0.0
+    return report
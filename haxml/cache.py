@@ -0,0 +1,65 @@
+"""
+In-memory caches for the prediction server.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache:
+    """
+    Thread-safe cache that evicts the least recently used entries, and
+    optionally expires entries after a number of seconds.
+    Args:
+        max_size: Maximum number of entries to keep (int).
+        ttl_secs: Seconds to keep each entry, or None to keep entries until
+            they are evicted (float).
+    """
+
+    def __init__(self, max_size=100, ttl_secs=None):
+        self.max_size = max_size
+        self.ttl_secs = ttl_secs
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Gets the value for a key.
+        Returns:
+            Cached value, or None if the key is missing or expired.
+        """
+        with self.lock:
+            if key in self.entries:
+                expires, value = self.entries[key]
+                if expires is None or expires > time.time():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Sets the value for a key, evicting the oldest entries if full.
+        """
+        expires = time.time() + self.ttl_secs if self.ttl_secs is not None else None
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def __len__(self):
+        return len(self.entries)
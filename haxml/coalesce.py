@@ -0,0 +1,109 @@
+"""
+Request coalescing for the prediction server.
+"""
+
+import copy
+import threading
+
+
+class Call:
+    """
+    One in-flight computation and the threads waiting on it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.n_followers = 0
+
+
+class CoalescedError(RuntimeError):
+    """
+    Raised in threads that waited for a call whose error cannot be copied.
+    """
+
+
+def get_follower_error(error):
+    """
+    Copies the error of a call for a thread that waited for it, since raising
+    one exception object in several threads mixes their tracebacks.
+    """
+    try:
+        return copy.copy(error)
+    except Exception:
+        return CoalescedError("Coalesced call failed: {}: {}".format(type(error).__name__, error))
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time. Threads that ask for a key
+    while its computation is in flight wait for it and share its result (or
+    its error) instead of running it again, so a burst of identical requests
+    costs one computation. Nothing is kept once the computation is done, so
+    results should be cached elsewhere if they are worth keeping.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {
+            "leaders": 0,
+            "followers": 0,
+            "errors": 0,
+            "timeouts": 0
+        }
+
+    def do(self, key, fn, timeout=None):
+        """
+        Runs fn, or waits for the call already running for the key.
+        Args:
+            key: Hashable key of the computation, e.g. (mid, model_name).
+            fn: function() that computes the result.
+            timeout: Seconds to wait for another thread's call, or None to wait
+                as long as it takes (float).
+        Returns:
+            Tuple (result, shared), where shared is True if the result came
+            from another thread's call.
+        Raises:
+            TimeoutError if the call for the key did not finish in time.
+            Any exception raised by fn, in the thread that ran it. Threads that
+            waited for it raise a copy of the same type, caused by the original,
+            so each thread has its own traceback.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = Call()
+                self.calls[key] = call
+                self.stats["leaders"] += 1
+            else:
+                call.n_followers += 1
+                self.stats["followers"] += 1
+        if is_leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                with self.lock:
+                    self.stats["errors"] += 1
+                raise
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+            return call.result, False
+        if not call.done.wait(timeout):
+            with self.lock:
+                self.stats["timeouts"] += 1
+            raise TimeoutError("Timed out waiting for: {}".format(key))
+        if call.error is not None:
+            raise get_follower_error(call.error) from call.error
+        return call.result, True
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self.calls)
+        return stats
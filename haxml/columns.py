@@ -0,0 +1,123 @@
+"""
+Typed column builder for DataFrames of kick records.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnBuilder:
+    """
+    Collects records into one list per column as they are generated, then
+    converts each column to its declared dtype. Records are not kept, so the
+    only copy of each value is in its column. Extra values that are the same
+    for many records in a row, like the match ID, are kept as runs instead of
+    one value per record.
+    Columns without a declared dtype are inferred by pandas, except that
+    string columns become categoricals.
+    Args:
+        dtypes: Dict of column names (str) to dtypes, e.g. "float32", "int8",
+            or "category" (dict).
+    """
+
+    def __init__(self, dtypes=None):
+        self.dtypes = dtypes if dtypes is not None else {}
+        self.columns = {}
+        self.runs = {}
+        self.n_rows = 0
+
+    def __len__(self):
+        return self.n_rows
+
+    def add_column(self, key):
+        # Column first seen in this record, earlier records are missing it.
+        col = [None] * self.n_rows
+        self.columns[key] = col
+        return col
+
+    def pad(self):
+        """
+        Pads the columns the last record was missing.
+        """
+        for col in self.columns.values():
+            if len(col) < self.n_rows:
+                col.append(None)
+
+    def add_runs(self, values, n):
+        """
+        Adds n records' worth of each extra value.
+        """
+        for key, value in values.items():
+            runs = self.runs.get(key)
+            if runs is None:
+                runs = [(None, self.n_rows - n)] if self.n_rows > n else []
+                self.runs[key] = runs
+            if len(runs) > 0 and runs[-1][0] == value:
+                runs[-1] = (value, runs[-1][1] + n)
+            else:
+                runs.append((value, n))
+
+    def append(self, record, **values):
+        """
+        Adds one record, along with extra column values for it.
+        Args:
+            record: Values of the record (dict).
+            values: Extra values for the record, e.g. match=mid. Pass the
+                same keys with every record, and keys that are not in the
+                record.
+        """
+        self.extend([record], **values)
+
+    def extend(self, records, **values):
+        """
+        Adds each record from an iterable, such as a row generator, with the
+        same extra column values.
+        Returns:
+            Number of records added (int).
+        """
+        columns = self.columns
+        start = self.n_rows
+        for record in records:
+            for key, value in record.items():
+                col = columns.get(key)
+                if col is None:
+                    col = self.add_column(key)
+                col.append(value)
+            self.n_rows += 1
+            if len(record) != len(columns):
+                self.pad()
+        n = self.n_rows - start
+        if n > 0:
+            self.add_runs(values, n)
+        return n
+
+    def get_run_column(self, key):
+        runs = self.runs[key]
+        n_missing = self.n_rows - sum(n for value, n in runs)
+        if n_missing > 0:
+            runs = runs + [(None, n_missing)]
+        values = np.empty(len(runs), dtype=object)
+        values[:] = [value for value, n in runs]
+        return np.repeat(values, [n for value, n in runs])
+
+    def to_frame(self):
+        """
+        Returns:
+            DataFrame with a column of the declared dtype for each key.
+        """
+        data = {}
+        columns = dict(self.columns)
+        for key in self.runs:
+            columns[key] = self.get_run_column(key)
+        for key, col in columns.items():
+            dtype = self.dtypes.get(key)
+            if dtype == "category":
+                data[key] = pd.Categorical(col)
+            elif dtype is not None and not any(value is None for value in col):
+                data[key] = np.array(col, dtype=dtype)
+            else:
+                ser = pd.Series(col)
+                if ser.dtype == object and len(col) > 0 and all(isinstance(v, str) for v in col):
+                    ser = ser.astype("category")
+                data[key] = ser
+        return pd.DataFrame(data)
@@ -0,0 +1,101 @@
+"""
+Latency estimates for scoring matches with each model.
+"""
+
+import threading
+
+
+def get_match_size(packed):
+    """
+    Counts kicks and positions in packed match data, without inflating it.
+    Returns:
+        Tuple (n_kicks, n_positions).
+    """
+    return len(packed.get("kicks", [])), len(packed.get("positions", []))
+
+
+class CostModel:
+    """
+    Estimates the milliseconds it takes to score a match with each model, from
+    the size of the match:
+        ms = ms_per_position * n_positions
+            + ms_per_kick * n_kicks
+            + ms_per_scan * n_kicks * n_positions
+    The first term is inflating the match, the second is features and
+    prediction for each kick, and the third is features that scan the
+    positions for each kick. The coefficients are priors for each model,
+    declared with its config. Each model version's estimates are scaled by a
+    moving average of observed time over the prior, so they follow the actual
+    hardware and load.
+    Args:
+        model_configs: List of dicts with the "name" and "generator" of each
+            model and its "costs", a dict with coefficients "ms_per_kick" and
+            "ms_per_scan" (float). Models without costs, e.g. new models in the
+            registry manifest, use those of the first model with the same
+            generator.
+        ms_per_position: Coefficient for inflating the match (float).
+        alpha: Weight of each new observation in the moving average (float).
+    """
+
+    def __init__(self, model_configs, ms_per_position=0.0025, alpha=0.2):
+        self.costs = {}
+        self.generator_costs = {}
+        for model_config in model_configs:
+            if "costs" in model_config:
+                self.costs[model_config["name"]] = model_config["costs"]
+                self.generator_costs.setdefault(model_config["generator"], model_config["costs"])
+        self.ms_per_position = ms_per_position
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.scales = {}
+        self.counts = {}
+
+    def get_prior(self, model, n_kicks, n_positions):
+        cost = self.costs.get(model.name)
+        if cost is None:
+            cost = self.generator_costs.get(model.generator, {})
+        return (
+            self.ms_per_position * n_positions
+            + cost.get("ms_per_kick", 0.0) * n_kicks
+            + cost.get("ms_per_scan", 0.0) * n_kicks * n_positions
+        )
+
+    def estimate(self, model, n_kicks, n_positions):
+        """
+        Args:
+            model: Model version (ModelVersion).
+            n_kicks: Number of kicks in the match (int).
+            n_positions: Number of positions in the match (int).
+        Returns:
+            Estimated milliseconds to score the match with the model (float).
+        """
+        with self.lock:
+            scale = self.scales.get(model.key, 1.0)
+        return scale * self.get_prior(model, n_kicks, n_positions)
+
+    def observe(self, model, n_kicks, n_positions, ms):
+        """
+        Updates the model version's scale with the time it took to score a
+        match.
+        """
+        prior = self.get_prior(model, n_kicks, n_positions)
+        if prior <= 0:
+            return
+        with self.lock:
+            scale = self.scales.get(model.key)
+            ratio = ms / prior
+            if scale is None:
+                self.scales[model.key] = ratio
+            else:
+                self.scales[model.key] = (1 - self.alpha) * scale + self.alpha * ratio
+            self.counts[model.key] = self.counts.get(model.key, 0) + 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                model_key: {
+                    "scale": self.scales[model_key],
+                    "observations": self.counts[model_key]
+                }
+                for model_key in self.scales
+            }
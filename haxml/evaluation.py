@@ -5,15 +5,38 @@ Methods for training and evaluating models.
 import sys
 sys.path.append("./")
 
+from haxml.accumulators import (
+    AUC_BINS,
+    MetricAccumulator,
+    get_bins,
+    get_codes,
+    get_histogram_auc,
+    get_label_auc
+)
+from haxml.columns import (
+    ColumnBuilder
+)
+from haxml.prediction import (
+    get_row_dtypes
+)
 from haxml.utils import (
+    kfold_split_matches,
     load_match,
     total_scored_goals,
     total_kicks,
     goal_fraction
 )
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    as_completed
+)
 from matplotlib.figure import Figure
 import matplotlib.patches as mpatches
+import hashlib
+import joblib
+import json
 import numpy as np
+import os
 import pandas as pd
 from sklearn.metrics import (
     accuracy_score,
@@ -64,7 +87,7 @@ def style_columns(config):
     return style_fn
 
 
-def make_df(metadata, stadiums, callback, progress=False):
+def make_df(metadata, stadiums, callback, progress=False, dtypes=None, return_loaded=False):
     """
     Transforms match metadata into a DataFrame of records for
     each kick, including target label and features.
@@ -73,23 +96,32 @@ def make_df(metadata, stadiums, callback, progress=False):
         stadiums: Dictionary of stadium data (via haxml.utils.get_stadiums).
         callback: Method to run on each match to extract kicks.
         progress: Whether or not to show progress bar (boolean).
+        dtypes: Dict of column names to dtypes, defaults to the declared
+            dtypes of callback (via haxml.prediction.get_row_dtypes). Other
+            string columns become categoricals.
+        return_loaded: Whether to also return the IDs of the matches that were
+            loaded, leaving out matches without a packed match file (boolean).
     Returns:
-        DataFrame where each row is a kick record.
+        DataFrame where each row is a kick record, or a tuple (d, loaded) of
+        the DataFrame and the loaded match IDs (list of str) if return_loaded.
     """
-    rows = []
+    if dtypes is None:
+        dtypes = get_row_dtypes(callback)
+    builder = ColumnBuilder(dict(dtypes, match="category"))
+    loaded = []
     bar = tqdm(metadata) if progress else metadata
     for meta in bar:
         key = meta["match_id"]
         infile = "../data/packed_matches/{}.json".format(key)
         try:
             s = stadiums[meta["stadium"]]
-            row_gen = load_match(infile, lambda m: callback(m, s))
-            for row in row_gen:
-                row["match"] = key
-                rows.append(row)
+            load_match(infile, lambda m: builder.extend(callback(m, s), match=key))
+            loaded.append(key)
         except FileNotFoundError:
             pass
-    return pd.DataFrame(rows)
+    if return_loaded:
+        return builder.to_frame(), loaded
+    return builder.to_frame()
 
 
 def score_model(d_test, target, features, clf, kwargs):
@@ -105,11 +137,16 @@ def score_model(d_test, target, features, clf, kwargs):
         accuracy: correct predictions / all records
         precision: true positives / predicted positives
         recall: true positives / actual positives
-        roc_auc: area under the ROC curve (0.5 is as good as random)
+        roc_auc: area under the ROC curve of predicted labels (0.5 is as good
+            as random)
+        roc_auc_xg: area under the ROC curve of XG
         match_mae: mean absolute error between XG and AG per match
         match_rmse: root mean squared error between XG and AG per match
         xg_mean: mean of XG on dataset
         xg_std: standard deviation of XG on dataset
+    The test set XG is kept in the result as a prediction cache ("test_xg" and
+    "test_key", a fingerprint of the test rows), which the plot_* methods read
+    instead of predicting again.
     Returns:
         Dictionary with fields for scoring metrics and model metadata.
     """
@@ -117,19 +154,23 @@ def score_model(d_test, target, features, clf, kwargs):
         warnings.filterwarnings("ignore", message=NO_PREDICTED_SAMPLES)
         Xt = d_test[features]
         yt = d_test[target]
-        xg = clf.predict_proba(Xt)[:,1]
-        yp = clf.predict(Xt)
-        d_test["xg"] = xg
-        gp = d_test.groupby(["match"]).agg({"ag": sum, "xg": sum})
+        proba = clf.predict_proba(Xt)
+        xg = proba[:,1]
+        # Same labels as clf.predict, without predicting again.
+        yp = clf.classes_[np.argmax(proba, axis=1)]
+        gp = get_match_errors(d_test, xg)
         return {
             "model": type(clf).__name__,
             "features": features,
             "clf": clf,
             "kwargs": kwargs,
+            "test_xg": xg,
+            "test_key": get_frame_key(d_test, features),
             "accuracy": accuracy_score(yt, yp),
             "precision": precision_score(yt, yp),
             "recall": recall_score(yt, yp),
             "roc_auc": roc_auc_score(yt, yp),
+            "roc_auc_xg": roc_auc_score(yt, xg),
             "match_mae": mean_absolute_error(gp["ag"], gp["xg"]),
             "match_rmse": mean_squared_error(gp["ag"], gp["xg"], squared=False),
             "xg_mean": np.mean(xg),
@@ -137,40 +178,1009 @@ def score_model(d_test, target, features, clf, kwargs):
         }
 
 
-def run_models(d_train, d_test, score_fn, target, feature_sets, model_params):
+def score_batches(clf, batches, target, features, acc=None):
     """
-    Trains and scores models for evaluation.
+    Scores a model on batches of kicks, keeping only running counts and sums
+    instead of the kicks, see haxml.accumulators.MetricAccumulator.
+    Args:
+        clf: Classifier (sklearn style).
+        batches: Iterable of DataFrames of kick records, e.g. from
+            FeatureQuery.iter_batches.
+        target: Variable to predict (str).
+        features: Columns of DataFrame to use as predictors (list of str).
+        acc: MetricAccumulator to add to, or None to start a new one.
+    Returns:
+        MetricAccumulator with the kicks of all batches.
+    """
+    if acc is None:
+        acc = MetricAccumulator()
+    for d in batches:
+        if len(d) == 0:
+            continue
+        xg = clf.predict_proba(d[features])[:,1]
+        acc.update(d["match"], d[target].values, xg, ag=d["ag"].values)
+    return acc
+
+
+# Model and row generator of each streaming scoring worker process, set once
+# per process by init_stream_worker instead of being sent with every chunk.
+stream_data = {}
+
+
+def init_stream_worker(clf, stadiums, callback, target, features):
+    stream_data["clf"] = clf
+    stream_data["stadiums"] = stadiums
+    stream_data["callback"] = callback
+    stream_data["target"] = target
+    stream_data["features"] = features
+
+
+def run_stream_task(chunk):
+    d = make_df(chunk, stream_data["stadiums"], stream_data["callback"])
+    return score_batches(stream_data["clf"], [d], stream_data["target"], stream_data["features"])
+
+
+def score_matches(clf, metadata, stadiums, callback, target, features, n_jobs=1, chunk_size=100):
+    """
+    Scores a model on the kicks of any number of matches, making the kick
+    records of one chunk of matches at a time, so memory does not grow with
+    the number of matches (apart from two sums per match for the match
+    errors). Chunks are scored in parallel and their accumulators merged.
+    Args:
+        clf: Classifier (sklearn style).
+        metadata: Match metadata (list of dicts).
+        stadiums: Dictionary of stadium data (via haxml.utils.get_stadiums).
+        callback: Method to run on each match to extract kicks. Must be
+            importable from a module (not a lambda) when n_jobs > 1.
+        target: Variable to predict (str).
+        features: Columns of DataFrame to use as predictors (list of str).
+        n_jobs: Number of processes to score chunks in, or 1 to score them in
+            this process (int).
+        chunk_size: Number of matches per chunk (int).
+    Returns:
+        Dictionary with the same scoring metrics as score_model, with
+        roc_auc_xg from XG histograms, and the number of "kicks" and
+        "matches" scored.
+    """
+    chunks = [metadata[i:i + chunk_size] for i in range(0, len(metadata), chunk_size)]
+    acc = MetricAccumulator()
+    with tqdm(total=len(metadata)) as bar:
+        if n_jobs == 1:
+            init_stream_worker(clf, stadiums, callback, target, features)
+            for chunk in chunks:
+                acc.merge(run_stream_task(chunk))
+                bar.update(len(chunk))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=init_stream_worker,
+                initargs=(clf, stadiums, callback, target, features)
+            ) as pool:
+                futures = {pool.submit(run_stream_task, chunk): len(chunk) for chunk in chunks}
+                for future in as_completed(futures):
+                    acc.merge(future.result())
+                    bar.update(futures[future])
+    res = {
+        "model": type(clf).__name__,
+        "features": features,
+        "clf": clf
+    }
+    res.update(acc.result())
+    res["kicks"] = acc.count
+    res["matches"] = len(acc.matches)
+    return res
+
+
+def get_columns(feature_sets, target):
+    """
+    Lists the columns that training and scoring models on the feature sets
+    read, in order without duplicates.
+    """
+    columns = []
+    for col in [c for features in feature_sets for c in features] + [target, "ag", "match"]:
+        if col not in columns:
+            columns.append(col)
+    return columns
+
+
+def load_frame(d, columns):
+    """
+    Reads only the needed columns if d is a query on the feature store (see
+    haxml.feature_store.FeatureQuery), otherwise returns the DataFrame as is.
+    """
+    if hasattr(d, "load"):
+        return d.load(columns)
+    return d
+
+
+def get_sweep_key(d_train, d_test, score_fn, target):
+    """
+    Makes a key for what a sweep's scores depend on besides the combination:
+    the target, the scoring method, and the train and test data, by their
+    lengths and sorted match IDs.
+    Returns:
+        Hex digest (str).
+    """
+    spec = [
+        target,
+        "{}.{}".format(score_fn.__module__, score_fn.__qualname__),
+        [
+            [len(d), sorted(str(mid) for mid in d["match"].unique()) if "match" in d.columns else []]
+            for d in [d_train, d_test]
+        ]
+    ]
+    text = json.dumps(spec)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def get_combination_key(features, Classifier, kwargs, sweep_key=""):
+    """
+    Makes a stable key for one combination of features and model params in a
+    sweep, used to name its checkpoint and spilled model files.
+    Args:
+        sweep_key: Key of the sweep's target, scoring method, and data (via
+            get_sweep_key), so checkpoints of other sweeps are not reused
+            (str).
+    Returns:
+        Hex digest (str).
+    """
+    spec = [
+        list(features),
+        "{}.{}".format(Classifier.__module__, Classifier.__qualname__),
+        kwargs,
+        sweep_key
+    ]
+    text = json.dumps(spec, sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def write_atomic(obj, outfile):
+    """
+    Pickles an object to a temporary file and renames it, so an interrupted
+    write never leaves a partial file.
+    """
+    tmpfile = "{}.{}.tmp".format(outfile, os.getpid())
+    joblib.dump(obj, tmpfile)
+    os.replace(tmpfile, outfile)
+
+
+def get_train_slice(d_train, target, features, cache):
+    """
+    Gets the predictors and target of the train data for a feature set,
+    reusing the last slice while consecutive models share the feature set.
     Args:
         d_train: DataFrame of train data.
+        target: Variable to predict (str).
+        features: Columns of DataFrame to use as predictors (list of str).
+        cache: Dict to keep the last slice in.
+    Returns:
+        Tuple (X_train, y_train).
+    """
+    key = tuple(features)
+    if cache.get("key") != key:
+        cache["key"] = key
+        cache["slice"] = (d_train[features], d_train[target])
+    return cache["slice"]
+
+
+def run_model(X_train, y_train, d_test, score_fn, target, features, Classifier, kwargs, model_dir=None, sweep_key=""):
+    """
+    Trains and scores one combination of features and model params.
+    Args:
+        X_train: Predictors of the train data (DataFrame).
+        y_train: Target of the train data (Series).
         d_test: DataFrame of test data.
+        score_fn: Method to get scoring metrics and metadata for the model.
+        target: Variable to predict (str).
+        features: Columns of DataFrame to use as predictors (list of str).
+        Classifier: sklearn Classifier type.
+        kwargs: Keyword args for classifier.
+        model_dir: Directory to write the fitted classifier to, if any (str).
+            When set, "clf" in the result is the filename instead of the
+            classifier.
+        sweep_key: Key of the sweep, for the filename (str).
+    Returns:
+        Dictionary with fields for scoring metrics and model metadata.
+    """
+    clf = Classifier(**kwargs)
+    clf.fit(X_train, y_train)
+    scores = score_fn(d_test, target, features, clf, kwargs)
+    if model_dir is not None:
+        key = get_combination_key(features, Classifier, kwargs, sweep_key)
+        outfile = os.path.join(model_dir, "{}.pkl".format(key))
+        write_atomic(clf, outfile)
+        scores["clf"] = outfile
+    return scores
+
+
+# Train and test data of each sweep worker process, set once per process by
+# init_sweep_worker instead of being sent with every task.
+sweep_data = {}
+
+
+def init_sweep_worker(d_train, d_test, score_fn, target, model_dir, sweep_key):
+    sweep_data["d_train"] = d_train
+    sweep_data["d_test"] = d_test
+    sweep_data["score_fn"] = score_fn
+    sweep_data["target"] = target
+    sweep_data["model_dir"] = model_dir
+    sweep_data["sweep_key"] = sweep_key
+    sweep_data["slices"] = {}
+
+
+def run_sweep_task(features, Classifier, kwargs):
+    X_train, y_train = get_train_slice(sweep_data["d_train"], sweep_data["target"], features, sweep_data["slices"])
+    return run_model(
+        X_train,
+        y_train,
+        sweep_data["d_test"],
+        sweep_data["score_fn"],
+        sweep_data["target"],
+        features,
+        Classifier,
+        kwargs,
+        model_dir=sweep_data["model_dir"],
+        sweep_key=sweep_data["sweep_key"]
+    )
+
+
+def run_models(d_train, d_test, score_fn, target, feature_sets, model_params,
+               n_jobs=1, checkpoint_dir=None, spill_models=False):
+    """
+    Trains and scores models for evaluation.
+    Args:
+        d_train: DataFrame of train data, or a FeatureQuery to read only the
+            columns of the feature sets from.
+        d_test: DataFrame of test data, or a FeatureQuery.
         score_fn: Method to get scoring metrics and metadata for each model.
+            Must be importable from a module (not a lambda) when n_jobs > 1.
         target: Variable to predict (str).
         feature_sets: List of lists of strings, where strings are columns of
             DataFrame to use as predictors.
         model_params: List of tuples of (Classifier, kwargs) where Classifier is
             the sklearn Classifier type and kwargs are the keyword args.
+        n_jobs: Number of processes to train models in, or 1 to train them in
+            this process (int). Each process gets the train and test data once
+            when it starts, then trains one model per task.
+        checkpoint_dir: Directory to save each model's scores to as soon as it
+            is done, if any (str). Combinations with saved scores are not
+            trained again, so an interrupted sweep resumes where it left off.
+            Scores are only reused for the same target, score_fn, and train
+            and test matches.
+        spill_models: Whether to write each fitted classifier to
+            <checkpoint_dir>/models/ and keep its filename in the "clf" column
+            instead of the classifier, to save memory (boolean).
     Returns:
-        DataFrame of models with their scoring metrics and metadata.
+        DataFrame of models with their scoring metrics and metadata, in the
+        order of the combinations.
     """
-    n_combinations = len(feature_sets) * len(model_params)
+    if spill_models and checkpoint_dir is None:
+        raise ValueError("spill_models needs a checkpoint_dir.")
+    columns = get_columns(feature_sets, target)
+    d_train = load_frame(d_train, columns)
+    d_test = load_frame(d_test, columns)
+    model_dir = os.path.join(checkpoint_dir, "models") if spill_models else None
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    if model_dir is not None:
+        os.makedirs(model_dir, exist_ok=True)
+    sweep_key = get_sweep_key(d_train, d_test, score_fn, target) if checkpoint_dir is not None else ""
+    combinations = [
+        (features, Classifier, kwargs)
+        for features in feature_sets
+        for Classifier, kwargs in model_params
+    ]
+    res = [None] * len(combinations)
+    todo = []
+    for i, (features, Classifier, kwargs) in enumerate(combinations):
+        if checkpoint_dir is not None:
+            key = get_combination_key(features, Classifier, kwargs, sweep_key)
+            infile = os.path.join(checkpoint_dir, "{}.pkl".format(key))
+            if os.path.exists(infile):
+                res[i] = joblib.load(infile)
+                continue
+        todo.append(i)
+
+    def save(i, scores):
+        res[i] = scores
+        if checkpoint_dir is not None:
+            key = get_combination_key(*combinations[i], sweep_key)
+            write_atomic(scores, os.path.join(checkpoint_dir, "{}.pkl".format(key)))
+
+    with tqdm(total=len(combinations), initial=len(combinations) - len(todo)) as bar:
+        if n_jobs == 1:
+            slices = {}
+            for i in todo:
+                features, Classifier, kwargs = combinations[i]
+                bar.set_description("Model: {}".format(Classifier(**kwargs)))
+                bar.refresh()
+                X_train, y_train = get_train_slice(d_train, target, features, slices)
+                save(i, run_model(X_train, y_train, d_test, score_fn, target, features, Classifier, kwargs, model_dir=model_dir, sweep_key=sweep_key))
+                bar.update(1)
+        elif len(todo) > 0:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=init_sweep_worker,
+                initargs=(d_train, d_test, score_fn, target, model_dir, sweep_key)
+            ) as pool:
+                futures = {pool.submit(run_sweep_task, *combinations[i]): i for i in todo}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    save(i, future.result())
+                    bar.set_description("Model: {}".format(res[i]["model"]))
+                    bar.update(1)
+    return pd.DataFrame(res)
+
+
+# Columns of model results that are not kept per fold, to keep fold results
+# small when they are sent back from worker processes.
+FOLD_DROP_COLUMNS = ["clf", "test_xg", "test_key"]
+
+
+def get_fold_ids(d, folds):
+    """
+    Gets the fold of each kick record from its match.
+    Args:
+        d: DataFrame of kick records with a "match" column.
+        folds: List of lists of match metadata (dicts with "match_id"), e.g.
+            from haxml.utils.kfold_split_matches.
+    Returns:
+        Fold index of each row of d, or -1 if its match is in no fold (NumPy
+        array).
+    """
+    fold_of_match = {meta["match_id"]: k for k, fold in enumerate(folds) for meta in fold}
+    return d["match"].astype(object).map(fold_of_match).fillna(-1).astype(int).values
+
+
+def run_fold(d, fold_ids, k, score_fn, target, features, Classifier, kwargs):
+    """
+    Trains a model on every fold but k and scores it on fold k.
+    Returns:
+        Dictionary with fields for scoring metrics and model metadata, without
+        the classifier and its predictions.
+    """
+    is_test = fold_ids == k
+    is_train = (fold_ids >= 0) & ~is_test
+    d_train = d[is_train]
+    d_test = d[is_test]
+    scores = run_model(d_train[features], d_train[target], d_test, score_fn, target, features, Classifier, kwargs)
+    for col in FOLD_DROP_COLUMNS:
+        scores.pop(col, None)
+    scores["fold"] = k
+    return scores
+
+
+# Kick records and folds of each cross-validation worker process, set once per
+# process by init_cv_worker instead of being sent with every task.
+cv_data = {}
+
+
+def init_cv_worker(d, fold_ids, score_fn, target):
+    cv_data["d"] = d
+    cv_data["fold_ids"] = fold_ids
+    cv_data["score_fn"] = score_fn
+    cv_data["target"] = target
+
+
+def run_cv_task(k, features, Classifier, kwargs):
+    return run_fold(
+        cv_data["d"],
+        cv_data["fold_ids"],
+        k,
+        cv_data["score_fn"],
+        cv_data["target"],
+        features,
+        Classifier,
+        kwargs
+    )
+
+
+def cross_validate(d, folds, score_fn, target, feature_sets, model_params, n_jobs=1):
+    """
+    Cross-validates models on folds of matches. Features are generated once
+    for all matches (e.g. with make_df) and each fold selects its kicks by
+    match, so no match is processed more than once.
+    Args:
+        d: DataFrame of kick records for the matches in all folds, or a
+            FeatureQuery to read only the columns of the feature sets from.
+        folds: List of lists of match metadata (dicts with "match_id"), e.g.
+            from haxml.utils.kfold_split_matches.
+        score_fn: Method to get scoring metrics and metadata for each model.
+            Must be importable from a module (not a lambda) when n_jobs > 1.
+        target: Variable to predict (str).
+        feature_sets: List of lists of strings, where strings are columns of
+            DataFrame to use as predictors.
+        model_params: List of tuples of (Classifier, kwargs) where Classifier is
+            the sklearn Classifier type and kwargs are the keyword args.
+        n_jobs: Number of processes to train folds in, or 1 to train them in
+            this process (int). Each process gets the kick records once when
+            it starts.
+    Returns:
+        Tuple (d_summary, d_folds) of DataFrames. d_summary has a row for
+        each combination of features and model params with the mean and
+        standard deviation of each metric over the folds, as <metric>_mean
+        and <metric>_std. d_folds has the metrics of each fold.
+    """
+    d = load_frame(d, get_columns(feature_sets, target))
+    fold_ids = get_fold_ids(d, folds)
+    combinations = [
+        (features, Classifier, kwargs)
+        for features in feature_sets
+        for Classifier, kwargs in model_params
+    ]
+    tasks = [(c, k) for c in range(len(combinations)) for k in range(len(folds))]
     res = []
-    with tqdm(total=n_combinations) as bar:
-        for features in feature_sets:
-            for Classifier, kwargs in model_params:
-                clf = Classifier(**kwargs)
-                bar.set_description("Model: {}".format(clf))
+    with tqdm(total=len(tasks)) as bar:
+        if n_jobs == 1:
+            for c, k in tasks:
+                features, Classifier, kwargs = combinations[c]
+                bar.set_description("Fold {}: {}".format(k, Classifier(**kwargs)))
                 bar.refresh()
-                X_train = d_train[features]
-                y_train = d_train[target]
-                X_test = d_test[features]
-                y_test = d_test[target]
-                clf.fit(X_train, y_train)
-                scores = score_fn(d_test, target, features, clf, kwargs)
+                scores = run_fold(d, fold_ids, k, score_fn, target, features, Classifier, kwargs)
+                scores["combination"] = c
                 res.append(scores)
                 bar.update(1)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=init_cv_worker,
+                initargs=(d, fold_ids, score_fn, target)
+            ) as pool:
+                futures = {
+                    pool.submit(run_cv_task, k, *combinations[c]): c
+                    for c, k in tasks
+                }
+                for future in as_completed(futures):
+                    scores = future.result()
+                    scores["combination"] = futures[future]
+                    res.append(scores)
+                    bar.set_description("Fold {}: {}".format(scores["fold"], scores["model"]))
+                    bar.update(1)
+    d_folds = pd.DataFrame(res).sort_values(["combination", "fold"]).reset_index(drop=True)
+    return summarize_folds(d_folds), d_folds
+
+
+def summarize_folds(d_folds):
+    """
+    Aggregates the metrics of each fold into the mean and standard deviation
+    over the folds, for each combination of features and model params.
+    Args:
+        d_folds: DataFrame of fold metrics, as returned by cross_validate.
+    Returns:
+        DataFrame with a row for each combination.
+    """
+    meta_cols = ["model", "features", "kwargs"]
+    metric_cols = [
+        col for col in d_folds.select_dtypes(include="number").columns
+        if col not in ("combination", "fold")
+    ]
+    res = []
+    for c, d_comb in d_folds.groupby("combination", sort=True):
+        row = {col: d_comb[col].iloc[0] for col in meta_cols if col in d_comb}
+        row["n_folds"] = len(d_comb)
+        for col in metric_cols:
+            row["{}_mean".format(col)] = d_comb[col].mean()
+            row["{}_std".format(col)] = d_comb[col].std()
+        res.append(row)
+    return pd.DataFrame(res)
+
+
+def split_validation(d_train, n_folds=5, seed=0):
+    """
+    Holds out one fold of the train matches for validation, with all kicks of
+    a match on one side and a similar spread of goals per match on both (via
+    haxml.utils.kfold_split_matches).
+    Args:
+        d_train: DataFrame of train data.
+        n_folds: Number of folds, one of which is held out (int).
+        seed: Seed for the folds (int).
+    Returns:
+        Tuple (d_fit, d_val) of DataFrames.
+    """
+    d_goals = d_train.groupby("match", observed=True)["ag"].agg(["sum"])
+    metadata = [
+        {
+            "match_id": mid,
+            "scored_goals_red": int(row["sum"]),
+            "scored_goals_blue": 0
+        }
+        for mid, row in d_goals.iterrows()
+    ]
+    folds = kfold_split_matches(metadata, n_folds=n_folds, seed=seed)
+    is_val = d_train["match"].astype(object).isin({meta["match_id"] for meta in folds[0]}).values
+    if not is_val.any() or is_val.all():
+        raise ValueError("Not enough train matches to hold out a validation fold.")
+    return d_train[~is_val], d_train[is_val]
+
+
+# Train, validation, and test data of each search worker process, set once per
+# process by init_search_worker instead of being sent with every task.
+search_data = {}
+
+
+def init_search_worker(d_fit, d_val, d_train, d_test, score_fn, target, match_order):
+    search_data["d_fit"] = d_fit
+    search_data["d_val"] = d_val
+    search_data["d_train"] = d_train
+    search_data["d_test"] = d_test
+    search_data["score_fn"] = score_fn
+    search_data["target"] = target
+    search_data["match_order"] = match_order
+
+
+def run_search_task(n_matches, features, Classifier, kwargs, keep_clf=False, final=False):
+    """
+    Trains a candidate on the first n_matches matches of the search order and
+    scores it on the validation data. A final candidate is trained on all
+    train matches and scored on the test data instead.
+    """
+    if final:
+        d_train = search_data["d_train"]
+        d_eval = search_data["d_test"]
+        n_matches = d_train["match"].nunique()
+    else:
+        d_train = search_data["d_fit"]
+        d_eval = search_data["d_val"]
+        if n_matches < len(search_data["match_order"]):
+            d_train = d_train[d_train["match"].isin(search_data["match_order"][:n_matches])]
+    target = search_data["target"]
+    scores = run_model(d_train[features], d_train[target], d_eval, search_data["score_fn"], target, features, Classifier, kwargs)
+    if not keep_clf:
+        for col in FOLD_DROP_COLUMNS:
+            scores.pop(col, None)
+    scores["n_matches"] = n_matches
+    scores["n_rows"] = len(d_train)
+    return scores
+
+
+def successive_halving(d_train, d_test, score_fn, target, feature_sets, model_params,
+                       metric="roc_auc", higher_is_better=True, factor=3,
+                       min_matches=None, n_best=1, n_jobs=1, seed=0, val_folds=5):
+    """
+    Searches combinations of features and model params by successive halving.
+    One fold of the train matches is held out for validation. Every candidate
+    is first trained on a small random subset of the other train matches.
+    After each round, only the best 1/factor of the candidates by metric on
+    the validation matches go on to the next round, which trains on factor
+    times as many matches. The candidates left are trained on all but the
+    validation matches and ranked once more, then the n_best are trained on
+    all train matches and scored on d_test, which is not used for ranking, so
+    their test scores are not biased by the search.
+    Args:
+        d_train: DataFrame of train data, or a FeatureQuery.
+        d_test: DataFrame of test data, or a FeatureQuery.
+        score_fn: Method to get scoring metrics and metadata for each model.
+            Must be importable from a module (not a lambda) when n_jobs > 1.
+        target: Variable to predict (str).
+        feature_sets: List of lists of strings, where strings are columns of
+            DataFrame to use as predictors.
+        model_params: List of tuples of (Classifier, kwargs) where Classifier is
+            the sklearn Classifier type and kwargs are the keyword args.
+        metric: Scoring metric to rank candidates by (str).
+        higher_is_better: Whether higher values of the metric are better
+            (boolean).
+        factor: Fraction of candidates dropped each round is 1 - 1/factor, and
+            the number of matches grows by factor each round (int).
+        min_matches: Number of matches in the first round, defaults to enough
+            that the last round would use all matches (int).
+        n_best: Number of candidates to train on all matches (int).
+        n_jobs: Number of processes to train candidates in, or 1 to train them
+            in this process (int).
+        seed: Seed for the validation fold and the order in which matches are
+            added (int).
+        val_folds: Number of folds to split the train matches into, one of
+            which is held out for validation (int).
+    Returns:
+        Tuple (d_best, d_rounds) of DataFrames. d_best has the test scores of
+        the best candidates trained on all train matches, as in run_models,
+        best first. d_rounds has the validation scores of every candidate in
+        every round, with the "round", "n_matches", and "n_rows" it was
+        trained on.
+    """
+    columns = get_columns(feature_sets, target)
+    d_train = load_frame(d_train, columns)
+    d_test = load_frame(d_test, columns)
+    combinations = [
+        (features, Classifier, kwargs)
+        for features in feature_sets
+        for Classifier, kwargs in model_params
+    ]
+    d_fit, d_val = split_validation(d_train, n_folds=val_folds, seed=seed)
+    match_order = np.random.default_rng(seed).permutation(d_fit["match"].astype(object).unique())
+    n_total = len(match_order)
+    if min_matches is None:
+        n_rounds = max(1, int(np.ceil(np.log(max(len(combinations) / n_best, 1)) / np.log(factor))))
+        min_matches = max(1, n_total // (factor ** n_rounds))
+    pool = None
+    if n_jobs != 1:
+        pool = ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=init_search_worker,
+            initargs=(d_fit, d_val, d_train, d_test, score_fn, target, match_order)
+        )
+    else:
+        init_search_worker(d_fit, d_val, d_train, d_test, score_fn, target, match_order)
+
+    def run_round(candidates, n_matches, keep_clf=False, final=False):
+        if pool is None:
+            return [run_search_task(n_matches, *combinations[c], keep_clf=keep_clf, final=final) for c in candidates]
+        futures = [pool.submit(run_search_task, n_matches, *combinations[c], keep_clf=keep_clf, final=final) for c in candidates]
+        return [future.result() for future in futures]
+
+    def rank(res, candidates):
+        values = np.array([scores[metric] for scores in res], dtype=float)
+        values = np.where(np.isnan(values), -np.inf if higher_is_better else np.inf, values)
+        order = np.argsort(-values if higher_is_better else values, kind="stable")
+        return [candidates[i] for i in order]
+
+    rounds = []
+    candidates = list(range(len(combinations)))
+    n_matches = min_matches
+    r = 0
+    try:
+        with tqdm(desc="Search") as bar:
+            while len(candidates) > n_best and n_matches < n_total:
+                bar.set_description("Round {}: {} candidates on {} matches".format(r, len(candidates), n_matches))
+                bar.refresh()
+                res = run_round(candidates, n_matches)
+                for c, scores in zip(candidates, res):
+                    scores["round"] = r
+                    scores["combination"] = c
+                    rounds.append(scores)
+                n_keep = max(n_best, int(np.ceil(len(candidates) / factor)))
+                candidates = rank(res, candidates)[:n_keep]
+                n_matches = min(n_matches * factor, n_total)
+                r += 1
+                bar.update(1)
+            bar.set_description("Round {}: {} candidates on {} matches".format(r, len(candidates), n_total))
+            bar.refresh()
+            res = run_round(candidates, n_total)
+            for c, scores in zip(candidates, res):
+                scores["round"] = r
+                scores["combination"] = c
+                rounds.append(scores)
+            best = rank(res, candidates)[:n_best]
+            bar.update(1)
+            bar.set_description("Final: {} candidates on all train matches".format(len(best)))
+            bar.refresh()
+            res_best = run_round(best, n_total, keep_clf=True, final=True)
+            bar.update(1)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    for c, scores in zip(best, res_best):
+        scores["combination"] = c
+    d_best = pd.DataFrame(res_best)
+    d_rounds = pd.DataFrame(rounds)
+    n_rows = d_rounds["n_rows"].sum() + d_best["n_rows"].sum()
+    grid_rows = len(combinations) * len(d_train)
+    print("Trained on {:,} rows, {:.1%} of the {:,} rows of a full grid.".format(
+        n_rows, n_rows / max(grid_rows, 1), grid_rows
+    ))
+    return d_best, d_rounds
+
+
+# Metrics where lower is better, for which permutation importance is the
+# increase instead of the decrease.
+LOWER_IS_BETTER = ["match_mae", "match_rmse"]
+
+
+def get_match_stats(d_test, target, xg, n_bins=AUC_BINS, threshold=0.5):
+    """
+    Sums what score_model's metrics need per match, so the metrics of any
+    weighting of the matches (e.g. a bootstrap sample) are a matrix product.
+    Args:
+        d_test: DataFrame of test data.
+        target: Variable to predict (str).
+        xg: XG for each row of d_test (NumPy array).
+        n_bins: Number of XG bins for the ROC AUC (int).
+        threshold: Kicks with XG above this are predicted as goals (float).
+    Returns:
+        Dictionary of arrays with one row per match.
+    """
+    codes, uniques = get_codes(d_test["match"])
+    n = len(uniques)
+    y = d_test[target].values.astype(bool)
+    yp = xg > threshold
+    count = lambda weights: np.bincount(codes, weights=weights, minlength=n)
+    hist = lambda mask: np.bincount(
+        codes[mask] * n_bins + get_bins(xg[mask], n_bins),
+        minlength=n * n_bins
+    ).reshape(n, n_bins).astype(float)
+    return {
+        "tp": count(y & yp),
+        "fp": count(~y & yp),
+        "tn": count(~y & ~yp),
+        "fn": count(y & ~yp),
+        "kicks": count(None),
+        "xg_sum": count(xg),
+        "xg_sq": count(xg ** 2),
+        "error": count(d_test["ag"].values) - count(xg),
+        "pos_hist": hist(y),
+        "neg_hist": hist(~y)
+    }
+
+
+def get_weighted_scores(weights, stats):
+    """
+    Computes score_model's metrics for weightings of the matches, with
+    roc_auc_xg from XG histograms.
+    Args:
+        weights: Times each match is counted, one row per weighting (NumPy
+            array of shape (n_weightings, n_matches)).
+        stats: Match stats from get_match_stats.
+    Returns:
+        Dictionary of metric names to arrays with one value per weighting.
+    """
+    total = lambda key: weights @ stats[key]
+    tp, fp, tn, fn = total("tp"), total("fp"), total("tn"), total("fn")
+    kicks = total("kicks")
+    n_matches = weights.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xg_mean = total("xg_sum") / kicks
+        return {
+            "accuracy": (tp + tn) / kicks,
+            "precision": np.where(tp + fp > 0, tp / (tp + fp), 0.0),
+            "recall": np.where(tp + fn > 0, tp / (tp + fn), 0.0),
+            "roc_auc": get_label_auc(tp, fp, tn, fn),
+            "roc_auc_xg": get_histogram_auc(total("pos_hist"), total("neg_hist")),
+            "match_mae": (weights @ np.abs(stats["error"])) / n_matches,
+            "match_rmse": np.sqrt((weights @ stats["error"] ** 2) / n_matches),
+            "xg_mean": xg_mean,
+            "xg_std": np.sqrt(np.maximum(total("xg_sq") / kicks - xg_mean ** 2, 0))
+        }
+
+
+# Match stats of each bootstrap worker process, set once per process by
+# init_bootstrap_worker instead of being sent with every chunk.
+bootstrap_data = {}
+
+
+def init_bootstrap_worker(stats):
+    bootstrap_data["stats"] = stats
+
+
+def run_bootstrap_task(n_reps, seed_seq):
+    stats = bootstrap_data["stats"]
+    n = len(stats["kicks"])
+    rng = np.random.default_rng(seed_seq)
+    weights = rng.multinomial(n, np.full(n, 1 / n), size=n_reps).astype(float)
+    return get_weighted_scores(weights, stats)
+
+
+def bootstrap_scores(model, d_test, target, n_reps=1000, alpha=0.05, n_jobs=1, seed=0,
+                     chunk_size=100, n_bins=AUC_BINS):
+    """
+    Estimates confidence intervals of a model's metrics by resampling test
+    matches with replacement. Predictions are made once (or read from the
+    model's prediction cache) and summed per match, so each replicate is only
+    a weighting of the match sums, computed for a chunk of replicates at once.
+    Args:
+        model: Model result from score_model or a row of run_models (dict).
+        d_test: DataFrame of test data.
+        target: Variable to predict (str).
+        n_reps: Number of bootstrap replicates (int).
+        alpha: Intervals cover 1 - alpha of the replicates (float).
+        n_jobs: Number of processes to run chunks in, or 1 to run them in
+            this process (int).
+        seed: Random seed, giving the same replicates for any n_jobs (int).
+        chunk_size: Number of replicates per chunk (int).
+        n_bins: Number of XG bins for the ROC AUC (int).
+    Returns:
+        Tuple (d_ci, d_reps) of DataFrames. d_ci has a row for each metric
+        with its "estimate" on the test set, its "std" over the replicates,
+        and the "lower" and "upper" bounds of the interval. d_reps has the
+        metrics of each replicate.
+    """
+    xg = get_test_xg(model, d_test)
+    stats = get_match_stats(d_test, target, xg, n_bins=n_bins)
+    sizes = [min(chunk_size, n_reps - i) for i in range(0, n_reps, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    res = []
+    if n_jobs == 1:
+        init_bootstrap_worker(stats)
+        res = [run_bootstrap_task(size, seed_seq) for size, seed_seq in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=init_bootstrap_worker,
+            initargs=(stats,)
+        ) as pool:
+            res = list(pool.map(run_bootstrap_task, sizes, seeds))
+    d_reps = pd.concat([pd.DataFrame(scores) for scores in res], ignore_index=True)
+    estimate = get_weighted_scores(np.ones((1, len(stats["kicks"]))), stats)
+    d_ci = pd.DataFrame([
+        {
+            "metric": metric,
+            "estimate": estimate[metric][0],
+            "std": d_reps[metric].std(),
+            "lower": d_reps[metric].quantile(alpha / 2),
+            "upper": d_reps[metric].quantile(1 - alpha / 2)
+        }
+        for metric in d_reps.columns
+    ])
+    return d_ci, d_reps
+
+
+# Model and test data of each permutation importance worker process, set once
+# per process by init_permutation_worker instead of being sent with every task.
+permutation_data = {}
+
+
+def init_permutation_worker(clf, d_test, target, features, n_bins):
+    permutation_data["clf"] = clf
+    permutation_data["d_test"] = d_test
+    permutation_data["X"] = d_test[features].copy()
+    permutation_data["target"] = target
+    permutation_data["n_bins"] = n_bins
+
+
+def run_permutation_task(feature, seed_seq):
+    X = permutation_data["X"]
+    d_test = permutation_data["d_test"]
+    col = X[feature].values.copy()
+    X[feature] = np.random.default_rng(seed_seq).permutation(col)
+    xg = permutation_data["clf"].predict_proba(X)[:,1]
+    X[feature] = col
+    stats = get_match_stats(d_test, permutation_data["target"], xg, n_bins=permutation_data["n_bins"])
+    scores = get_weighted_scores(np.ones((1, len(stats["kicks"]))), stats)
+    return {metric: values[0] for metric, values in scores.items()}
+
+
+def permutation_importance(model, d_test, target, metrics=["roc_auc_xg", "match_mae"], n_repeats=5,
+                           n_jobs=1, seed=0, n_bins=AUC_BINS):
+    """
+    Measures how much each feature matters to a fitted model by shuffling it
+    in the test data and scoring the model again, without retraining.
+    Args:
+        model: Model result from score_model or a row of run_models (dict).
+        d_test: DataFrame of test data.
+        target: Variable to predict (str).
+        metrics: Metrics of score_model to report (list of str).
+        n_repeats: Number of shuffles per feature (int).
+        n_jobs: Number of processes to run shuffles in, or 1 to run them in
+            this process (int). Each process gets the model and test data
+            once when it starts.
+        seed: Random seed, giving the same shuffles for any n_jobs (int).
+        n_bins: Number of XG bins for the ROC AUC (int).
+    Returns:
+        DataFrame with a row for each feature, sorted by importance on the
+        first metric, with the mean and standard deviation over the shuffles
+        of how much worse each metric got, as <metric>_importance and
+        <metric>_importance_std.
+    """
+    clf = model["clf"]
+    if isinstance(clf, str):
+        clf = joblib.load(clf)
+    features = list(model["features"])
+    xg = get_test_xg(model, d_test)
+    stats = get_match_stats(d_test, target, xg, n_bins=n_bins)
+    baseline = get_weighted_scores(np.ones((1, len(stats["kicks"]))), stats)
+    seeds = np.random.SeedSequence(seed).spawn(len(features) * n_repeats)
+    tasks = [(feature, seeds[f * n_repeats + r]) for f, feature in enumerate(features) for r in range(n_repeats)]
+    d_test = d_test[get_columns([features], target)]
+    with tqdm(total=len(tasks)) as bar:
+        if n_jobs == 1:
+            init_permutation_worker(clf, d_test, target, features, n_bins)
+            res = []
+            for feature, seed_seq in tasks:
+                res.append(run_permutation_task(feature, seed_seq))
+                bar.update(1)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=init_permutation_worker,
+                initargs=(clf, d_test, target, features, n_bins)
+            ) as pool:
+                res = []
+                for scores in pool.map(run_permutation_task, *zip(*tasks)):
+                    res.append(scores)
+                    bar.update(1)
+    d_perm = pd.DataFrame(res)
+    d_perm["feature"] = [feature for feature, seed_seq in tasks]
+    for metric in metrics:
+        sign = -1 if metric in LOWER_IS_BETTER else 1
+        d_perm[metric] = sign * (baseline[metric][0] - d_perm[metric])
+    gp = d_perm.groupby("feature", sort=False)[metrics]
+    d_imp = gp.mean().add_suffix("_importance").join(gp.std().add_suffix("_importance_std"))
+    d_imp = d_imp.sort_values("{}_importance".format(metrics[0]), ascending=False)
+    return d_imp.reset_index()
+
+
+def compare_shadow(d_log):
+    """
+    Compares the baseline and candidate models on kicks from the shadow log
+    (via haxml.shadow.read_shadow_log).
+    Args:
+        d_log: DataFrame of shadow log records.
+    Scores:
+        kicks: number of kicks scored by both models
+        matches: number of matches scored by both models
+        roc_auc: area under the ROC curve of XG (0.5 is as good as random)
+        match_mae: mean absolute error between XG and AG per match
+        match_rmse: root mean squared error between XG and AG per match
+        xg_mean: mean of XG on the kicks
+        xg_std: standard deviation of XG on the kicks
+        mean_abs_diff: mean absolute difference in XG from the other model
+    Returns:
+        DataFrame with a row of scoring metrics for each model key.
+    """
+    res = []
+    for (baseline, candidate), d_pair in d_log.groupby(["baseline", "candidate"]):
+        diff = np.abs(d_pair["candidate_xg"] - d_pair["baseline_xg"])
+        for role, model_key in [("baseline", baseline), ("candidate", candidate)]:
+            col = "{}_xg".format(role)
+            gp = d_pair.groupby(["mid"]).agg({"ag": sum, col: sum})
+            has_both_classes = d_pair["ag"].nunique() > 1
+            res.append({
+                "model": model_key,
+                "role": role,
+                "kicks": len(d_pair),
+                "matches": len(gp),
+                "roc_auc": roc_auc_score(d_pair["ag"], d_pair[col]) if has_both_classes else np.nan,
+                "match_mae": mean_absolute_error(gp["ag"], gp[col]),
+                "match_rmse": np.sqrt(mean_squared_error(gp["ag"], gp[col])),
+                "xg_mean": np.mean(d_pair[col]),
+                "xg_std": np.std(d_pair[col]),
+                "mean_abs_diff": np.mean(diff)
+            })
     return pd.DataFrame(res)
 
 
+def get_match_errors(d_test, xg):
+    """
+    Sums actual goals, XG, and kicks per match, without copying the test data.
+    Args:
+        d_test: DataFrame of test data.
+        xg: XG for each row of d_test (NumPy array).
+    Returns:
+        DataFrame indexed by match with "ag", "xg", and "kicks" columns.
+    """
+    df_pred = pd.DataFrame({
+        "match": d_test["match"].values,
+        "ag": d_test["ag"].values,
+        "xg": xg
+    })
+    # Only observed matches, since the match column may be categorical.
+    gp = df_pred.groupby("match", observed=True)
+    return gp.agg(ag=("ag", "sum"), xg=("xg", "sum"), kicks=("xg", "size"))
+
+
+def get_frame_key(d, features):
+    """
+    Fingerprints the rows of a DataFrame that predictions depend on: the
+    index, the features, and the match of each row. Frames with the same
+    length and index (e.g. the RangeIndex of make_df) but other rows get
+    different keys.
+    Returns:
+        Hex digest (str).
+    """
+    columns = list(features) + (["match"] if "match" in d.columns and "match" not in features else [])
+    hashes = pd.util.hash_pandas_object(d[columns], index=True).values
+    return hashlib.sha256(hashes.tobytes()).hexdigest()[:16]
+
+
+def get_test_xg(model, d_test):
+    """
+    Gets XG for the test data from the model's prediction cache (see
+    score_model), predicting if the cache is missing or was made on different
+    test data, as checked by the fingerprint of the rows.
+    Args:
+        model: Model result from score_model or a row of run_models (dict).
+        d_test: DataFrame of test data.
+    Returns:
+        XG for each row of d_test (NumPy array).
+    """
+    xg = model.get("test_xg")
+    key = model.get("test_key")
+    if xg is not None and key is not None and len(xg) == len(d_test) and key == get_frame_key(d_test, model["features"]):
+        return xg
+    clf = model["clf"]
+    if isinstance(clf, str):
+        clf = joblib.load(clf)
+    return clf.predict_proba(d_test[model["features"]])[:,1]
+
+
 def blank_plot():
     """
     Returns a new tuple of (fig, ax).
@@ -191,12 +1201,9 @@ def plot_errors_by_kicks(model, d_test, plot=None, kwargs={}):
     name = str(model["clf"])
     feat = ", ".join(model["features"])
     label = f"Model: {name}\nFeatures: {feat}"
-    X_test = d_test[model["features"]]
-    xg = model["clf"].predict_proba(X_test)[:,1]
-    df_pred = pd.DataFrame(d_test)
-    df_pred["xg"] = xg
-    df_gp = df_pred.groupby("match").agg({"ag": sum, "xg": sum, "index": len})
-    ax.scatter(df_gp["index"], df_gp["xg"] - df_gp["ag"], label=label, **kwargs)
+    d_test = load_frame(d_test, get_columns([model["features"]], "ag"))
+    df_gp = get_match_errors(d_test, get_test_xg(model, d_test))
+    ax.scatter(df_gp["kicks"], df_gp["xg"] - df_gp["ag"], label=label, **kwargs)
     ax.legend(bbox_to_anchor=(1.5, 1), loc="upper right")
     ax.axhline(0, color="black", linewidth=1)
     ax.axvline(0, color="black", linewidth=1)
@@ -222,11 +1229,8 @@ def plot_errors_by_goals(model, d_test, plot=None, kwargs={}):
     feat = ", ".join(model["features"])
     label = f"Model: {name}\nFeatures: {feat}"
     color = kwargs["color"] if "color" in kwargs else None
-    X_test = d_test[model["features"]]
-    xg = model["clf"].predict_proba(X_test)[:,1]
-    df_pred = pd.DataFrame(d_test)
-    df_pred["xg"] = xg
-    df_gp = df_pred.groupby("match").agg({"ag": sum, "xg": sum})
+    d_test = load_frame(d_test, get_columns([model["features"]], "ag"))
+    df_gp = get_match_errors(d_test, get_test_xg(model, d_test))
     violins = {}
     for match in df_gp.to_dict(orient="records"):
         ag = match["ag"]
@@ -264,8 +1268,8 @@ def plot_xg_histogram(model, d_test, plot=None, kwargs={}, min_xg=1e-4):
     name = str(model["clf"])
     feat = ", ".join(model["features"])
     label = f"Model: {name}\nFeatures: {feat}"
-    X_test = d_test[model["features"]]
-    xg = model["clf"].predict_proba(X_test)[:,1]
+    d_test = load_frame(d_test, get_columns([model["features"]], "ag"))
+    xg = get_test_xg(model, d_test)
     ax.hist(list(filter(lambda v: v > min_xg, xg)), label=label, **kwargs)
     ax.legend(bbox_to_anchor=(1.5, 1), loc="upper right")
     ax.set_xlabel("XG")
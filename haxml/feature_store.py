@@ -0,0 +1,313 @@
+"""
+Partitioned on-disk store of kick feature rows.
+
+Rows are written as Parquet files, partitioned by stadium and by the date the
+match was saved, with a manifest of the match IDs already in the store:
+
+    <path>/_manifest.json
+    <path>/stadium=NAFL%20Official%20Map%20v1/date=2021-01-07/part-00000.parquet
+
+Reads only open the partitions that match the stadium and date filters, only
+decode the requested columns, and skip row groups by time and kick type using
+the Parquet statistics. Updates only add new files, and reads only open the
+files in the manifest, so readers never see a partial write. Needs pyarrow.
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.columns import (
+    ColumnBuilder
+)
+from haxml.prediction import (
+    get_row_dtypes
+)
+from haxml.utils import (
+    load_match
+)
+from datetime import (
+    datetime,
+    timezone
+)
+from tqdm import tqdm
+from urllib.parse import (
+    quote
+)
+import json
+import os
+import pandas as pd
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# Columns that come from the partition path instead of the Parquet files.
+PARTITION_COLUMNS = ["stadium", "date"]
+
+
+def get_match_date(match):
+    """
+    Gets the date a match was saved.
+    Args:
+        match: Inflated match data (dict), with "saved" in milliseconds.
+    Returns:
+        Date in UTC, formatted as YYYY-MM-DD (str).
+    """
+    saved = datetime.fromtimestamp(match["saved"] / 1000, tz=timezone.utc)
+    return saved.strftime("%Y-%m-%d")
+
+
+class FeatureStore:
+    """
+    Append-only, partitioned store of kick feature rows.
+    Args:
+        path: Directory to store the rows in (str).
+    """
+
+    def __init__(self, path):
+        if pa is None:
+            raise ImportError("FeatureStore needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.manifest_path = os.path.join(path, "_manifest.json")
+        self.manifest = self.read_manifest()
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"parts": []}
+        with open(self.manifest_path, "r") as file:
+            return json.load(file)
+
+    def write_manifest(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmpfile = "{}.{}.tmp".format(self.manifest_path, os.getpid())
+        with open(tmpfile, "w") as file:
+            json.dump(self.manifest, file, indent=4)
+        os.replace(tmpfile, self.manifest_path)
+
+    def match_ids(self):
+        """
+        Returns:
+            IDs of the matches with rows in the store (set of str).
+        """
+        return {mid for part in self.manifest["parts"] for mid in part["matches"]}
+
+    def append(self, d_new, match_ids, secs=None):
+        """
+        Writes rows of new matches, one new file per stadium and date.
+        Args:
+            d_new: DataFrame of kick rows with "stadium" and "date" columns.
+            match_ids: IDs of the new matches, including any without kicks
+                (list of str).
+            secs: Seconds it took to make the rows, if measured (float).
+        """
+        n = len(self.manifest["parts"])
+        files = []
+        if len(d_new) > 0:
+            # Sort by time within each file, so row group statistics on time
+            # are narrow and time filters can skip row groups.
+            d_new = d_new.sort_values(["stadium", "date", "match", "time"])
+            for (stadium, date), d_part in d_new.groupby(PARTITION_COLUMNS, sort=False, observed=True):
+                part_dir = os.path.join(self.path, "stadium={}".format(quote(stadium, safe="")), "date={}".format(date))
+                os.makedirs(part_dir, exist_ok=True)
+                outfile = os.path.join(part_dir, "part-{:05d}.parquet".format(n))
+                d_part = d_part.drop(columns=PARTITION_COLUMNS)
+                # Write categoricals as plain strings, which Parquet encodes as
+                # dictionaries per file anyway, so every file has one schema.
+                for col in d_part.select_dtypes(include="category").columns:
+                    d_part[col] = d_part[col].astype(object)
+                table = pa.Table.from_pandas(d_part, preserve_index=False)
+                tmpfile = os.path.join(part_dir, ".part-{:05d}.parquet.tmp".format(n))
+                pq.write_table(table, tmpfile, row_group_size=10000)
+                os.replace(tmpfile, outfile)
+                files.append(os.path.relpath(outfile, self.path))
+        self.manifest["parts"].append({
+            "files": files,
+            "matches": list(match_ids),
+            "rows": len(d_new),
+            "secs": secs,
+            "added": time.time()
+        })
+        self.write_manifest()
+
+    def update(self, metadata, stadiums, callback, match_dir="../data/packed_matches", progress=False):
+        """
+        Makes feature rows for the matches that are not in the store yet and
+        appends them. Adds "match", "stadium", "date", and the kick "type" to
+        each row.
+        Args:
+            metadata: Match metadata for all matches so far (list of dicts).
+            stadiums: Dictionary of stadium data (via haxml.utils.get_stadiums).
+            callback: Method to run on each match to extract kicks.
+            match_dir: Directory of packed match files (str).
+            progress: Whether or not to show progress bar (boolean).
+        Returns:
+            Dict with "new_matches", "new_rows", and "secs".
+        """
+        known = self.match_ids()
+        new_meta = [meta for meta in metadata if meta["match_id"] not in known]
+        start = time.perf_counter()
+        dtypes = dict(get_row_dtypes(callback), match="category", stadium="category", date="category", type="category")
+        builder = ColumnBuilder(dtypes)
+        match_ids = []
+        bar = tqdm(new_meta) if progress else new_meta
+        for meta in bar:
+            key = meta["match_id"]
+            infile = os.path.join(match_dir, "{}.json".format(key))
+            try:
+                s = stadiums[meta["stadium"]]
+                match = load_match(infile)
+            except FileNotFoundError:
+                continue
+            date = get_match_date(match)
+            for row in callback(match, s):
+                row["stadium"] = match["stadium"]
+                builder.append(row, match=key, date=date, type=match["kicks"][row["index"]]["type"])
+            match_ids.append(key)
+        d_new = builder.to_frame()
+        secs = time.perf_counter() - start
+        if len(match_ids) > 0:
+            self.append(d_new, match_ids, secs=secs)
+        return {
+            "new_matches": len(match_ids),
+            "new_rows": len(d_new),
+            "secs": secs
+        }
+
+    def get_files(self):
+        """
+        Returns:
+            Paths of the files in the manifest (list of str). Files left by an
+            append that did not finish are not in the manifest, and are
+            replaced when their matches are appended again.
+        """
+        return [os.path.join(self.path, f) for part in self.manifest["parts"] for f in part["files"]]
+
+    def get_dataset(self):
+        return ds.dataset(
+            self.get_files(),
+            format="parquet",
+            partitioning=ds.partitioning(flavor="hive"),
+            partition_base_dir=self.path
+        )
+
+    def read(self, columns=None, stadiums=None, start_date=None, end_date=None,
+             min_time=None, max_time=None, types=None):
+        """
+        Reads rows from the store.
+        Args:
+            columns: Columns to read, or None for all columns (list of str).
+            stadiums: Stadiums to read, or None for all stadiums (list of str).
+            start_date: First match date to read, as YYYY-MM-DD (str).
+            end_date: Last match date to read, as YYYY-MM-DD (str).
+            min_time: Earliest kick time to read, in seconds (float).
+            max_time: Latest kick time to read, in seconds (float).
+            types: Kick types to read, e.g. ["goal", "save"] (list of str).
+        Returns:
+            DataFrame of kick rows.
+        """
+        if len(self.get_files()) == 0:
+            return pd.DataFrame(columns=columns)
+        expr = get_filter(stadiums, start_date, end_date, min_time, max_time, types)
+        table = self.get_dataset().to_table(columns=columns, filter=expr)
+        return to_frame(table)
+
+    def iter_batches(self, columns=None, batch_size=65536, **filters):
+        """
+        Reads rows from the store one batch at a time, so only one batch is
+        in memory at once.
+        Args:
+            columns: Columns to read, or None for all columns (list of str).
+            batch_size: Maximum number of rows per batch (int).
+            filters: Keyword args for read, other than columns.
+        Returns:
+            Generator of DataFrames of kick rows.
+        """
+        if len(self.get_files()) == 0:
+            return
+        expr = get_filter(**filters)
+        for batch in self.get_dataset().to_batches(columns=columns, filter=expr, batch_size=batch_size):
+            if batch.num_rows > 0:
+                yield to_frame(batch)
+
+    def query(self, **filters):
+        """
+        Makes a query that evaluation methods can read with only the columns
+        they need, see FeatureQuery.
+        Args:
+            filters: Keyword args for read, other than columns.
+        """
+        return FeatureQuery(self, filters)
+
+
+class FeatureQuery:
+    """
+    Rows of a feature store selected by filters, read when a method knows
+    which columns it needs. Can be passed instead of a DataFrame to
+    haxml.evaluation.run_models and the plot_* methods.
+    Args:
+        store: FeatureStore to read from.
+        filters: Keyword args for FeatureStore.read, other than columns (dict).
+    """
+
+    def __init__(self, store, filters):
+        self.store = store
+        self.filters = filters
+
+    def __repr__(self):
+        return "FeatureQuery({}, {})".format(self.store.path, self.filters)
+
+    def load(self, columns=None):
+        """
+        Reads the selected rows with only the given columns.
+        Returns:
+            DataFrame of kick rows.
+        """
+        return self.store.read(columns=columns, **self.filters)
+
+    def iter_batches(self, columns=None, batch_size=65536):
+        """
+        Reads the selected rows with only the given columns, one batch at a
+        time (see FeatureStore.iter_batches).
+        """
+        return self.store.iter_batches(columns=columns, batch_size=batch_size, **self.filters)
+
+
+def get_filter(stadiums=None, start_date=None, end_date=None, min_time=None, max_time=None, types=None):
+    """
+    Makes a dataset filter expression from the filters of FeatureStore.read.
+    Returns:
+        Expression, or None to read all rows.
+    """
+    conditions = []
+    if stadiums is not None:
+        conditions.append(ds.field("stadium").isin(stadiums))
+    if start_date is not None:
+        conditions.append(ds.field("date") >= start_date)
+    if end_date is not None:
+        conditions.append(ds.field("date") <= end_date)
+    if min_time is not None:
+        conditions.append(ds.field("time") >= min_time)
+    if max_time is not None:
+        conditions.append(ds.field("time") <= max_time)
+    if types is not None:
+        conditions.append(ds.field("type").isin(types))
+    expr = None
+    for condition in conditions:
+        expr = condition if expr is None else expr & condition
+    return expr
+
+
+def to_frame(table):
+    """
+    Converts a table or record batch to a DataFrame, with strings as
+    categoricals.
+    """
+    d = table.to_pandas()
+    for col in d.select_dtypes(include=["object", "string"]).columns:
+        d[col] = d[col].astype("category")
+    return d
@@ -0,0 +1,289 @@
+"""
+Compiled, array-based inference for tree ensembles.
+
+A fitted scikit-learn forest (or single decision tree) is flattened into packed
+node arrays that can be traversed for every kick and every tree at once with
+NumPy, skipping sklearn's per-tree dispatch and input validation. Predictions
+are bit-identical to the original classifier's predict_proba.
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.utils import (
+    get_file_sha256
+)
+import joblib
+import numpy as np
+import os
+
+
+# Marker sklearn uses for the children of a leaf node.
+TREE_LEAF = -1
+
+
+class CompiledForest:
+    """
+    Tree ensemble flattened into packed node arrays.
+    Follows the scikit-learn classifier interface for prediction, so it can be
+    used wherever a fitted classifier is expected by the predictor functions.
+    Args:
+        feature: Feature index tested at each node, 0 for leaves (int32 array).
+        threshold: Split threshold at each node (float64 array).
+        left: Global index of the left child, self for leaves (int32 array).
+        right: Global index of the right child, self for leaves (int32 array).
+        missing_left: Whether NaN values go to the left child (bool array).
+        value: Class probabilities at each node (float64 array of shape
+            (n_nodes, n_classes)).
+        roots: Global index of the root node of each tree (int32 array).
+        max_depth: Number of traversal steps needed to reach every leaf (int).
+        classes: Class labels, in the order of the value columns (array).
+        n_features: Number of features expected in the input (int).
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, value,
+                 roots, max_depth, classes, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.n_features_in_ = int(n_features)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def apply(self, X):
+        """
+        Finds the leaf reached by each sample in each tree.
+        Args:
+            X: Feature matrix (array-like of shape (n_samples, n_features)).
+        Returns:
+            Global leaf indices (int32 array of shape (n_samples, n_trees)).
+        """
+        # sklearn casts inputs to float32 before comparing them to the float64
+        # thresholds, so we do the same to take the same path at every split.
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            err = "Expected {} features, got input of shape {}."
+            raise ValueError(err.format(self.n_features_in_, X.shape))
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[nodes]]
+            go_left = x <= self.threshold[nodes]
+            go_left |= np.isnan(x) & self.missing_left[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        """
+        Predicts class probabilities, averaged over all trees.
+        Args:
+            X: Feature matrix (array-like of shape (n_samples, n_features)).
+        Returns:
+            Class probabilities (float64 array of shape (n_samples, n_classes)).
+        """
+        leaf_proba = self.value[self.apply(X)]
+        # Sum the trees sequentially, in order, like sklearn's accumulator, so
+        # floating point rounding matches exactly.
+        proba = np.cumsum(leaf_proba, axis=1)[:, -1, :]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        """
+        Predicts the most probable class for each sample.
+        Args:
+            X: Feature matrix (array-like of shape (n_samples, n_features)).
+        Returns:
+            Predicted class labels (array of shape (n_samples,)).
+        """
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def __repr__(self):
+        return "CompiledForest(n_trees={}, n_nodes={:,}, max_depth={})".format(
+            self.n_trees,
+            self.n_nodes,
+            self.max_depth
+        )
+
+
+def normalizes_leaf_values():
+    """
+    Checks whether the installed sklearn divides leaf values by their sum in
+    predict_proba. Before version 1.4, trees stored class counts at each node;
+    since then they store class fractions and return them unchanged.
+    Returns:
+        True if leaf values must be normalized to get probabilities.
+    """
+    import sklearn
+    major, minor = sklearn.__version__.split(".")[:2]
+    return (int(major), int(minor)) < (1, 4)
+
+
+def compile_forest(clf):
+    """
+    Flattens a fitted tree ensemble into a CompiledForest.
+    Args:
+        clf: Fitted sklearn RandomForestClassifier, ExtraTreesClassifier, or
+            DecisionTreeClassifier with a single output.
+    Returns:
+        CompiledForest with the same predictions as the classifier.
+    """
+    if hasattr(clf, "estimators_"):
+        estimators = clf.estimators_
+    elif hasattr(clf, "tree_"):
+        estimators = [clf]
+    else:
+        raise ValueError("Not a fitted tree model: {}".format(type(clf).__name__))
+    if getattr(clf, "n_outputs_", 1) != 1:
+        raise ValueError("Only single output tree models can be compiled.")
+    normalize = normalizes_leaf_values()
+    features = []
+    thresholds = []
+    lefts = []
+    rights = []
+    missing_lefts = []
+    values = []
+    roots = []
+    max_depth = 0
+    offset = 0
+    for est in estimators:
+        tree = est.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == TREE_LEAF
+        # Leaves point to themselves, so extra traversal steps are no-ops.
+        left = np.where(is_leaf, node_ids, tree.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree.children_right) + offset
+        feature = np.where(is_leaf, 0, tree.feature)
+        if hasattr(tree, "missing_go_to_left"):
+            missing_left = tree.missing_go_to_left.astype(bool)
+        else:
+            missing_left = np.zeros(n_nodes, dtype=bool)
+        value = tree.value[:, 0, :clf.n_classes_].astype(np.float64)
+        if normalize:
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value = value / normalizer
+        features.append(feature)
+        thresholds.append(tree.threshold)
+        lefts.append(left)
+        rights.append(right)
+        missing_lefts.append(missing_left)
+        values.append(value)
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n_nodes
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(np.int32),
+        right=np.concatenate(rights).astype(np.int32),
+        missing_left=np.concatenate(missing_lefts),
+        value=np.concatenate(values),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max_depth,
+        classes=np.asarray(clf.classes_),
+        n_features=clf.n_features_in_
+    )
+
+
+def save_compiled_forest(compiled, outfile, source_sha256=None):
+    """
+    Writes a CompiledForest to an uncompressed .npz file, which loads quickly.
+    Args:
+        compiled: CompiledForest to save.
+        outfile: Filename to write to, should end in .npz (string).
+        source_sha256: Hash of the pickled model it was compiled from, checked
+            by load_classifier (string).
+    """
+    extra = {"source_sha256": np.array(source_sha256)} if source_sha256 is not None else {}
+    np.savez(
+        outfile,
+        **extra,
+        feature=compiled.feature,
+        threshold=compiled.threshold,
+        left=compiled.left,
+        right=compiled.right,
+        missing_left=compiled.missing_left,
+        value=compiled.value,
+        roots=compiled.roots,
+        max_depth=np.array(compiled.max_depth),
+        classes=compiled.classes_,
+        n_features=np.array(compiled.n_features_in_)
+    )
+
+
+def load_compiled_forest(infile):
+    """
+    Reads a CompiledForest from a .npz file.
+    Args:
+        infile: Filename where the compiled forest is stored (string).
+    Returns:
+        CompiledForest.
+    """
+    with np.load(infile, allow_pickle=False) as data:
+        return CompiledForest(
+            feature=data["feature"],
+            threshold=data["threshold"],
+            left=data["left"],
+            right=data["right"],
+            missing_left=data["missing_left"],
+            value=data["value"],
+            roots=data["roots"],
+            max_depth=data["max_depth"],
+            classes=data["classes"],
+            n_features=data["n_features"]
+        )
+
+
+def get_compiled_path(path):
+    """
+    Returns the path where the compiled version of a pickled model is stored.
+    Args:
+        path: Filename of the pickled model (string).
+    Returns:
+        Filename with the .npz extension (string).
+    """
+    return os.path.splitext(path)[0] + ".npz"
+
+
+def load_classifier(path):
+    """
+    Loads a classifier, preferring a compiled forest saved next to the pickle
+    if it was compiled from the current pickle. Compiled forests store the
+    hash of their pickle; older ones without it must be newer than the pickle.
+    Args:
+        path: Filename of the pickled model (string).
+    Returns:
+        CompiledForest if an up to date compiled version exists, otherwise the
+        unpickled classifier.
+    """
+    compiled_path = get_compiled_path(path)
+    if os.path.exists(compiled_path):
+        if is_compiled_current(path, compiled_path):
+            return load_compiled_forest(compiled_path)
+        print("Warning: Ignoring compiled forest that does not match its pickle, recompile it: {}".format(compiled_path))
+    return joblib.load(path)
+
+
+def is_compiled_current(path, compiled_path):
+    """
+    Checks if a compiled forest was made from the pickled model as it is now.
+    """
+    with np.load(compiled_path, allow_pickle=False) as data:
+        source_sha256 = str(data["source_sha256"]) if "source_sha256" in data.files else None
+    if source_sha256 is not None:
+        return source_sha256 == get_file_sha256(path)
+    return os.path.getmtime(compiled_path) >= os.path.getmtime(path)
@@ -0,0 +1,259 @@
+"""
+Incremental updates of the kick dataset and models as new matches arrive.
+
+The dataset is a directory of parts, each holding the kick records of the
+matches added in one update, with a manifest of the match IDs in each part:
+
+    <path>/manifest.json
+    <path>/part-00000.pkl
+    <path>/part-00001.pkl
+
+An update only makes records for matches that are not in the manifest, then
+models are updated with the new records instead of being trained from scratch.
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.evaluation import (
+    make_df
+)
+from pandas.api.types import (
+    union_categoricals
+)
+import copy
+import json
+import numpy as np
+import os
+import pandas as pd
+import time
+
+
+class IncrementalDataset:
+    """
+    Append-only store of kick records, in one part per update.
+    Args:
+        path: Directory to store the parts and manifest in (str).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.manifest = self.read_manifest()
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"parts": []}
+        with open(self.manifest_path, "r") as file:
+            return json.load(file)
+
+    def write_manifest(self):
+        tmpfile = "{}.{}.tmp".format(self.manifest_path, os.getpid())
+        with open(tmpfile, "w") as file:
+            json.dump(self.manifest, file, indent=4)
+        os.replace(tmpfile, self.manifest_path)
+
+    def match_ids(self):
+        """
+        Returns:
+            IDs of the matches with records in the dataset (set of str).
+        """
+        return {mid for part in self.manifest["parts"] for mid in part["matches"]}
+
+    def append(self, d_new, match_ids, secs=None):
+        """
+        Writes the records of new matches as a new part. The manifest is
+        written after the part, so an interrupted append leaves the dataset
+        as it was.
+        Args:
+            d_new: DataFrame of kick records for the new matches.
+            match_ids: IDs of the new matches, including any without kicks
+                (list of str).
+            secs: Seconds it took to make the records, if measured (float).
+        """
+        os.makedirs(self.path, exist_ok=True)
+        filename = "part-{:05d}.pkl".format(len(self.manifest["parts"]))
+        d_new.to_pickle(os.path.join(self.path, filename))
+        self.manifest["parts"].append({
+            "file": filename,
+            "matches": list(match_ids),
+            "rows": len(d_new),
+            "secs": secs,
+            "added": time.time()
+        })
+        self.write_manifest()
+
+    def load(self):
+        """
+        Reads all records in the dataset.
+        Returns:
+            DataFrame of kick records.
+        """
+        parts = [
+            pd.read_pickle(os.path.join(self.path, part["file"]))
+            for part in self.manifest["parts"]
+        ]
+        if len(parts) == 0:
+            return pd.DataFrame()
+        return concat_parts(parts)
+
+    def get_secs_per_match(self):
+        """
+        Average seconds it took to make the records of one match, over all
+        parts with a measured time.
+        Returns:
+            Seconds (float), or None if no part was measured.
+        """
+        timed = [part for part in self.manifest["parts"] if part.get("secs") is not None and len(part["matches"]) > 0]
+        if len(timed) == 0:
+            return None
+        return sum(part["secs"] for part in timed) / sum(len(part["matches"]) for part in timed)
+
+
+def concat_parts(parts):
+    """
+    Concatenates DataFrames of kick records, keeping categorical columns
+    categorical. pd.concat turns them into objects unless every part has the
+    same categories, which parts with different matches never do.
+    Args:
+        parts: DataFrames to concatenate (list of DataFrame).
+    Returns:
+        DataFrame.
+    """
+    d = pd.concat(parts, ignore_index=True)
+    for col in d.columns:
+        cols = [part[col] for part in parts if col in part.columns]
+        is_categorical = any(isinstance(c.dtype, pd.CategoricalDtype) for c in cols)
+        if is_categorical and not isinstance(d[col].dtype, pd.CategoricalDtype) and sum(len(c) for c in cols) == len(d):
+            d[col] = union_categoricals([c.astype("category") for c in cols])
+    return d
+
+
+def update_dataset(dataset, metadata, stadiums, callback, progress=False):
+    """
+    Makes kick records only for matches that are not in the dataset yet and
+    appends them as a new part. Matches without a packed match file are left
+    out of the manifest, so the next update tries them again.
+    Args:
+        dataset: IncrementalDataset to update.
+        metadata: Match metadata for all matches so far (list of dicts).
+        stadiums: Dictionary of stadium data (via haxml.utils.get_stadiums).
+        callback: Method to run on each match to extract kicks.
+        progress: Whether or not to show progress bar (boolean).
+    Returns:
+        Tuple (d_new, report) of the new kick records (DataFrame) and a dict
+        with "new_matches", "missing_matches" (without a packed match file),
+        "new_rows", "secs", and "full_rebuild_secs", the estimated time to make
+        the records of all matches from scratch.
+    """
+    known = dataset.match_ids()
+    new_meta = [meta for meta in metadata if meta["match_id"] not in known]
+    start = time.perf_counter()
+    d_new, loaded = make_df(new_meta, stadiums, callback, progress=progress, return_loaded=True)
+    secs = time.perf_counter() - start
+    if len(loaded) > 0:
+        dataset.append(d_new, loaded, secs=secs)
+    secs_per_match = dataset.get_secs_per_match()
+    return d_new, {
+        "new_matches": len(loaded),
+        "missing_matches": len(new_meta) - len(loaded),
+        "new_rows": len(d_new),
+        "secs": secs,
+        "full_rebuild_secs": secs_per_match * len(metadata) if secs_per_match is not None else None
+    }
+
+
+def update_model(clf, d_new, d_all, target, features, n_new_trees=10, copy_clf=True):
+    """
+    Updates a fitted classifier with new kick records, in the cheapest way the
+    classifier supports:
+        unchanged: Without new records, the classifier is returned as it was.
+        trees: Forests with warm_start (e.g. random forests) keep their trees
+            and fit n_new_trees more on the new records. If the new records
+            only have one class, the forest is trained from scratch instead,
+            since trees fit on one class only predict that class.
+        partial_fit: Classifiers with partial_fit (e.g. SGD, naive Bayes) take
+            one more pass over the new records.
+        warm_start: Other classifiers with warm_start (e.g. logistic
+            regression) refit on all records, starting from their current fit.
+        refit: Anything else is trained from scratch on all records.
+    Args:
+        clf: Fitted classifier (sklearn style).
+        d_new: DataFrame of new kick records.
+        d_all: DataFrame of all kick records, including the new ones.
+        target: Variable to predict (str).
+        features: Columns of DataFrame to use as predictors (list of str).
+        n_new_trees: Number of trees to add to forests (int).
+        copy_clf: Whether to update a copy and leave clf as it was (boolean).
+    Returns:
+        Tuple (clf, method) of the updated classifier and the method used (str).
+    """
+    if len(d_new) == 0:
+        return clf, "unchanged"
+    if copy_clf:
+        clf = copy.deepcopy(clf)
+    params = clf.get_params()
+    if "warm_start" in params and "n_estimators" in params and hasattr(clf, "estimators_"):
+        if d_new[target].nunique() < 2:
+            clf.set_params(warm_start=False, n_estimators=len(clf.estimators_))
+            clf.fit(d_all[features], d_all[target])
+            return clf, "refit"
+        clf.set_params(warm_start=True, n_estimators=len(clf.estimators_) + n_new_trees)
+        clf.fit(d_new[features], d_new[target])
+        return clf, "trees"
+    if hasattr(clf, "partial_fit"):
+        clf.partial_fit(d_new[features], d_new[target], classes=clf.classes_)
+        return clf, "partial_fit"
+    if "warm_start" in params:
+        clf.set_params(warm_start=True)
+        clf.fit(d_all[features], d_all[target])
+        return clf, "warm_start"
+    clf.fit(d_all[features], d_all[target])
+    return clf, "refit"
+
+
+def compare_update(clf, d_new, d_all, d_test, score_fn, target, features, kwargs={}, n_new_trees=10):
+    """
+    Updates a classifier with new records and compares it to a classifier
+    trained from scratch on all records, timing both.
+    Args:
+        clf: Fitted classifier (sklearn style).
+        d_new: DataFrame of new kick records.
+        d_all: DataFrame of all kick records, including the new ones.
+        d_test: DataFrame of test data.
+        score_fn: Method to get scoring metrics and metadata for each model.
+        target: Variable to predict (str).
+        features: Columns of DataFrame to use as predictors (list of str).
+        kwargs: Keyword args for classifier, passed to score_fn.
+        n_new_trees: Number of trees to add to forests (int).
+    Returns:
+        Dictionary with the updated classifier ("clf"), the update "method",
+        "update_secs", "full_secs", "secs_saved", and for each numeric metric
+        of score_fn, the updated value and its "<metric>_drift" from the full
+        retrain (updated minus full).
+    """
+    start = time.perf_counter()
+    updated, method = update_model(clf, d_new, d_all, target, features, n_new_trees=n_new_trees)
+    update_secs = time.perf_counter() - start
+    full = copy.deepcopy(updated)
+    if "warm_start" in full.get_params():
+        full.set_params(warm_start=False)
+    start = time.perf_counter()
+    full.fit(d_all[features], d_all[target])
+    full_secs = time.perf_counter() - start
+    scores_updated = score_fn(d_test, target, features, updated, kwargs)
+    scores_full = score_fn(d_test, target, features, full, kwargs)
+    res = {
+        "model": type(clf).__name__,
+        "features": features,
+        "clf": updated,
+        "method": method,
+        "update_secs": update_secs,
+        "full_secs": full_secs,
+        "secs_saved": full_secs - update_secs
+    }
+    for key, value in scores_updated.items():
+        if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            res[key] = value
+            res["{}_drift".format(key)] = value - scores_full[key]
+    return res
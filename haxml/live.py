@@ -0,0 +1,126 @@
+"""
+Incremental XG predictions for matches that are still being played.
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.serialize import (
+    KICK_COLUMNS,
+    to_columns
+)
+from haxml.utils import (
+    inflate_match
+)
+from collections import OrderedDict
+import pandas as pd
+import threading
+
+
+class LiveMatch:
+    """
+    Per-match state for live XG. Keeps the feature rows and XG of the kicks
+    scored so far, so each update only generates features for new kicks.
+    Args:
+        stadium: Stadium data (dict).
+        generate_rows: function(match, stadium) to generate kick records.
+        features: Columns to use as predictors (list of str).
+        clf: Classifier following scikit-learn interface.
+    """
+
+    def __init__(self, stadium, generate_rows, features, clf):
+        self.stadium = stadium
+        self.generate_rows = generate_rows
+        self.features = features
+        self.clf = clf
+        self.kicks = []
+        self.rows = []
+        self.xg = []
+        self.lock = threading.Lock()
+
+    @property
+    def n_kicks(self):
+        return len(self.xg)
+
+    def update(self, packed):
+        """
+        Scores the kicks that were added since the last update.
+        Args:
+            packed: Latest packed match data (dict).
+        Returns:
+            Number of new kicks scored (int).
+        """
+        with self.lock:
+            start = len(self.xg)
+            if len(packed["kicks"]) <= start:
+                return 0
+            match = inflate_match(packed)
+            new_kicks = match["kicks"][start:]
+            # Features only depend on positions up to the kick, so earlier
+            # kicks keep their XG as the match grows.
+            tail = dict(match, kicks=new_kicks)
+            rows = list(self.generate_rows(tail, self.stadium))
+            for row in rows:
+                row["index"] += start
+            xg = [None] * len(new_kicks)
+            if len(rows) > 0:
+                d_kicks = pd.DataFrame(rows)
+                probs = self.clf.predict_proba(d_kicks[self.features])[:,1]
+                for i, p in zip(d_kicks["index"], probs):
+                    xg[i - start] = float(p)
+            self.kicks.extend(new_kicks)
+            self.rows.extend(rows)
+            self.xg.extend(xg)
+            return len(new_kicks)
+
+    def get_kicks(self, start=0):
+        """
+        Gets kick fields and XG as columns, for kicks after the given index.
+        Args:
+            start: Index of the first kick to include (int).
+        Returns:
+            Dict with "start" index, "n_kicks" total, and "kicks" columns.
+        """
+        with self.lock:
+            kicks = to_columns(self.kicks[start:], KICK_COLUMNS)
+            kicks["xg"] = self.xg[start:]
+            return {
+                "start": start,
+                "n_kicks": len(self.xg),
+                "kicks": kicks
+            }
+
+
+class LiveMatchCache:
+    """
+    Bounded cache of LiveMatch states, evicting the least recently used.
+    Args:
+        max_size: Maximum number of match states to keep (int).
+    """
+
+    def __init__(self, max_size=50):
+        self.max_size = max_size
+        self.states = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, make_state):
+        """
+        Gets the state for a key, creating it if needed.
+        Args:
+            key: Cache key, e.g. tuple (mid, model_name).
+            make_state: function() that returns a new LiveMatch.
+        Returns:
+            LiveMatch.
+        """
+        with self.lock:
+            if key in self.states:
+                self.states.move_to_end(key)
+                return self.states[key]
+            state = make_state()
+            self.states[key] = state
+            while len(self.states) > self.max_size:
+                self.states.popitem(last=False)
+            return state
+
+    def __len__(self):
+        return len(self.states)
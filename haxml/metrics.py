@@ -0,0 +1,286 @@
+"""
+Lightweight latency instrumentation for the prediction server.
+"""
+
+import math
+import threading
+import time
+
+
+# Upper bounds (in milliseconds) of the latency histogram buckets.
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf]
+# Upper bounds (in bytes) of the payload size histogram buckets.
+SIZE_BUCKETS_BYTES = [1e3, 1e4, 1e5, 1e6, 1e7, math.inf]
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values with fixed bucket bounds.
+    Args:
+        buckets: Sorted upper bounds of the buckets, ending with math.inf.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile as the upper bound of the bucket containing it.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return self.max if math.isinf(bound) else bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count > 0 else None,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                str(bound): n for bound, n in zip(self.buckets, self.counts)
+            }
+        }
+
+
+class NullSpan:
+    """
+    Span that does nothing, used when instrumentation is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    """
+    Context manager that times one stage and reports it when done.
+    """
+
+    def __init__(self, metrics, stage, model):
+        self.metrics = metrics
+        self.stage = stage
+        self.model = model
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        ms = 1000 * (time.perf_counter() - self.start)
+        self.metrics.record_span(self.stage, ms, self.model)
+        return False
+
+
+class Metrics:
+    """
+    Registry of latency histograms, counters, and payload sizes.
+    Stage spans are also collected per request (per thread) so they can be
+    reported in the Server-Timing response header.
+    Args:
+        enabled: Whether to record anything (boolean). When disabled, spans
+            are no-ops and request traces are empty.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.startup = {}
+        self.routes = {}
+        self.stages = {}
+        self.models = {}
+        self.payloads = {}
+        self.counters = {}
+
+    def span(self, stage, model=None):
+        """
+        Times a stage of the current request.
+        Args:
+            stage: Name of the stage, e.g. "fetch" or "predict" (str).
+            model: Name of the model the stage ran for, if any (str).
+        Returns:
+            Context manager.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, model)
+
+    def record_span(self, stage, ms, model=None):
+        with self.lock:
+            get_histogram(self.stages, stage, LATENCY_BUCKETS_MS).observe(ms)
+            if model is not None:
+                if model not in self.models:
+                    self.models[model] = {}
+                stages = self.models[model]
+                get_histogram(stages, stage, LATENCY_BUCKETS_MS).observe(ms)
+        trace = getattr(self.local, "trace", None)
+        if trace is not None:
+            trace.append((stage, model, ms))
+
+    def startup_span(self, stage, message=None):
+        """
+        Times and logs a stage of server startup. Startup stages are always
+        recorded, even when instrumentation is disabled, since they only run
+        once.
+        Args:
+            stage: Name of the startup stage (str).
+            message: Progress message to print when the stage starts, or None
+                to time the stage without printing (str).
+        Returns:
+            Context manager.
+        """
+        return StartupSpan(self, stage, message)
+
+    def increment(self, counter, n=1):
+        """
+        Adds to a named counter.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def start_trace(self):
+        """
+        Starts collecting spans for the request handled by this thread.
+        """
+        self.local.trace = [] if self.enabled else None
+        self.local.start = time.perf_counter()
+
+    def get_trace(self):
+        """
+        Returns the spans collected for this thread's request, or None.
+        """
+        return getattr(self.local, "trace", None)
+
+    def set_trace(self, trace):
+        """
+        Collects spans from this thread into another thread's request trace,
+        e.g. for work handed off to a worker thread. Set None to stop.
+        """
+        self.local.trace = trace
+
+    def end_trace(self, route, status, size=None):
+        """
+        Stops collecting spans for this thread and records the request.
+        Args:
+            route: Route rule that handled the request (str).
+            status: HTTP status code (int).
+            size: Response payload size in bytes, if known (int).
+        Returns:
+            List of tuples (stage, model, ms) recorded during the request.
+        """
+        trace = getattr(self.local, "trace", None)
+        self.local.trace = None
+        if not self.enabled or trace is None:
+            return []
+        ms = 1000 * (time.perf_counter() - self.local.start)
+        with self.lock:
+            get_histogram(self.routes, route, LATENCY_BUCKETS_MS).observe(ms)
+            if size is not None:
+                get_histogram(self.payloads, route, SIZE_BUCKETS_BYTES).observe(size)
+            key = "status_{}".format(status)
+            self.counters[key] = self.counters.get(key, 0) + 1
+        return trace
+
+    def to_dict(self):
+        """
+        Returns a snapshot of all metrics, for the /metrics route.
+        """
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "uptime_secs": time.time() - self.start_time,
+                "startup_secs": dict(self.startup),
+                "counters": dict(self.counters),
+                "routes_ms": histograms_to_dict(self.routes),
+                "stages_ms": histograms_to_dict(self.stages),
+                "models_ms": {
+                    model: histograms_to_dict(stages)
+                    for model, stages in self.models.items()
+                },
+                "payload_bytes": histograms_to_dict(self.payloads)
+            }
+
+
+class StartupSpan:
+    """
+    Context manager that times and logs one stage of server startup.
+    """
+
+    def __init__(self, metrics, stage, message):
+        self.metrics = metrics
+        self.stage = stage
+        self.message = message
+
+    def __enter__(self):
+        if self.message is not None:
+            print("{}...".format(self.message))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        secs = time.perf_counter() - self.start
+        self.metrics.startup[self.stage] = secs
+        if self.message is not None:
+            print("\tDone in {:.1f} secs".format(secs))
+        return False
+
+
+def get_histogram(histograms, key, buckets):
+    """
+    Gets the histogram for a key, creating it if needed.
+    """
+    if key not in histograms:
+        histograms[key] = Histogram(buckets)
+    return histograms[key]
+
+
+def histograms_to_dict(histograms):
+    return {key: hist.to_dict() for key, hist in histograms.items()}
+
+
+def format_server_timing(trace):
+    """
+    Formats request spans as a Server-Timing header value.
+    Args:
+        trace: List of tuples (stage, model, ms).
+    Returns:
+        Header value (str), e.g. 'fetch;dur=12.3, predict;desc="demo_logit";dur=0.8'.
+    """
+    entries = []
+    for stage, model, ms in trace:
+        if model is None:
+            entries.append("{};dur={:.1f}".format(stage, ms))
+        else:
+            entries.append('{};desc="{}";dur={:.1f}'.format(stage, model, ms))
+    return ", ".join(entries)
@@ -0,0 +1,144 @@
+"""
+Background worker that scores new matches before anyone requests them.
+"""
+
+import queue
+import threading
+import traceback
+
+
+class PrecomputeWorker:
+    """
+    Polls a source for match IDs, scores the ones that are not in the store yet
+    with each model, and writes the results to the store.
+    Tasks wait in a bounded queue. When the queue is full, new tasks are
+    skipped and picked up again on a later poll. Failed tasks are retried on
+    later polls, up to max_attempts times.
+    Args:
+        list_ids: function() that returns match IDs to precompute (list of str).
+        score: function(mid, model_key) that returns the result to store.
+        store: XGStore to write results to.
+        list_models: function() that returns the keys of the models to score
+            each match with (list of str). Called on each poll, so new model
+            versions are picked up.
+        max_queue: Maximum number of tasks waiting to be scored (int).
+        n_threads: Number of threads scoring tasks (int).
+        max_attempts: Maximum number of times to try each task (int).
+        poll_secs: Seconds to wait between polls of the source (float).
+    """
+
+    def __init__(self, list_ids, score, store, list_models, max_queue=100,
+                 n_threads=1, max_attempts=3, poll_secs=30.0):
+        self.list_ids = list_ids
+        self.score = score
+        self.store = store
+        self.list_models = list_models
+        self.tasks = queue.Queue(maxsize=max_queue)
+        self.n_threads = n_threads
+        self.max_attempts = max_attempts
+        self.poll_secs = poll_secs
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.attempts = {}
+        self.stats = {
+            "queued": 0,
+            "skipped": 0,
+            "done": 0,
+            "errors": 0,
+            "failed": 0
+        }
+        self.stop_event = threading.Event()
+
+    def poll(self):
+        """
+        Queues a task for each match and model without a stored result.
+        Returns:
+            Number of tasks queued (int).
+        """
+        n_queued = 0
+        model_keys = self.list_models()
+        for mid in self.list_ids():
+            for model_key in model_keys:
+                key = (mid, model_key)
+                with self.lock:
+                    if key in self.pending:
+                        continue
+                    if self.attempts.get(key, 0) >= self.max_attempts:
+                        continue
+                if self.store.has(mid, model_key):
+                    continue
+                try:
+                    self.tasks.put_nowait(key)
+                except queue.Full:
+                    with self.lock:
+                        self.stats["skipped"] += 1
+                    continue
+                with self.lock:
+                    self.pending.add(key)
+                    self.stats["queued"] += 1
+                n_queued += 1
+        return n_queued
+
+    def run_task(self, key):
+        """
+        Scores and stores one (mid, model_key) task, counting failures.
+        """
+        mid, model_key = key
+        try:
+            result = self.score(mid, model_key)
+            self.store.write(mid, model_key, result)
+            with self.lock:
+                self.stats["done"] += 1
+                self.attempts.pop(key, None)
+        except Exception:
+            traceback.print_exc()
+            with self.lock:
+                self.stats["errors"] += 1
+                self.attempts[key] = self.attempts.get(key, 0) + 1
+                if self.attempts[key] >= self.max_attempts:
+                    self.stats["failed"] += 1
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+
+    def work(self):
+        """
+        Scores tasks from the queue until stopped.
+        """
+        while not self.stop_event.is_set():
+            try:
+                key = self.tasks.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            self.run_task(key)
+            self.tasks.task_done()
+
+    def run_forever(self):
+        """
+        Starts the scoring threads and polls the source until stopped.
+        """
+        for _ in range(self.n_threads):
+            threading.Thread(target=self.work, daemon=True).start()
+        while not self.stop_event.is_set():
+            try:
+                self.poll()
+            except Exception:
+                traceback.print_exc()
+            self.stop_event.wait(self.poll_secs)
+
+    def start(self):
+        """
+        Runs the worker in a background daemon thread.
+        """
+        thread = threading.Thread(target=self.run_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["queue_size"] = self.tasks.qsize()
+        return stats
@@ -28,6 +28,45 @@ import math
 import pandas as pd
 
 
+# Features used by each of the production predictors.
+FEATURES_DEMO = ["goal_distance", "goal_angle"]
+FEATURES_EDWIN = ["goal_distance","goal_angle","defender_dist","closest_defender","defenders_within_box","in_box","in_shot","ball_speed"]
+FEATURES_LYNN_WEIGHTED = ['goal_angle', 'goal_distance', 'closest_defender', 'in_box', 'defenders_within_shot', 'in_shot', 'ball_speed', 'on_goal', 'player_speed', 'weighted_def_dist']
+FEATURES_LYNN_BOTH = ['goal_angle', 'goal_distance', 'defender_dist', 'closest_defender', 'in_box', 'defenders_within_shot', 'in_shot', 'ball_speed', 'on_goal', 'player_speed', 'weighted_def_dist']
+
+# Column dtypes of the rows made by each row generator, for make_df. Strings are
+# categoricals, flags and counts are int8, and positions and features are
+# float32, which is also the precision sklearn trees split on.
+ROW_DTYPES_DEMO = {
+    "ag": "int8",
+    "index": "int32",
+    "time": "float32",
+    "x": "float32",
+    "y": "float32",
+    "goal_x": "float32",
+    "goal_y": "float32",
+    "goal_distance": "float32",
+    "goal_angle": "float32",
+    "team": "category",
+    "stadium": "category"
+}
+ROW_DTYPES_EDWIN = dict(ROW_DTYPES_DEMO, **{
+    "defender_dist": "float32",
+    "closest_defender": "int8",
+    "defenders_within_box": "int8",
+    "in_box": "int8",
+    "defenders_within_shot": "int8",
+    "in_shot": "int8",
+    "ball_speed": "float32"
+})
+ROW_DTYPES_LYNN = dict(ROW_DTYPES_EDWIN, **{
+    "on_goal": "int8",
+    "player_speed": "float32",
+    "weighted_def_dist": "float32",
+    "closest_def": "float32",
+    "in_stadium": "category"
+})
+
 def generate_rows_demo(match, stadium):
     """
     Generates target and features for each kick in the match.
@@ -80,7 +119,7 @@ def predict_xg_demo(match, stadium, generate_rows, clf):
     Returns:
         Inflated match data with "xg" field added to each kick (dict).
     """
-    features = ["goal_distance", "goal_angle"]
+    features = FEATURES_DEMO
     d_kicks = pd.DataFrame(generate_rows(match, stadium))
     d_kicks["xg"] = clf.predict_proba(d_kicks[features])[:,1]
     for kick in d_kicks.to_dict(orient="records"):
@@ -146,7 +185,7 @@ def predict_xg_edwin(match, stadium, generate_rows, clf):
     Returns:
         Inflated match data with "xg" field added to each kick (dict).
     """
-    features = ["goal_distance","goal_angle","defender_dist","closest_defender","defenders_within_box","in_box","in_shot","ball_speed"]
+    features = FEATURES_EDWIN
     d_kicks = pd.DataFrame(generate_rows(match, stadium))
     d_kicks["xg"] = clf.predict_proba(d_kicks[features])[:,1]
     for kick in d_kicks.to_dict(orient="records"):
@@ -164,7 +203,7 @@ def predict_xg_lynn_weighted(match, stadium, generate_rows, clf):
     Returns:
         Inflated match data with "xg" field added to each kick (dict).
     """
-    features = ['goal_angle', 'goal_distance', 'closest_defender', 'in_box', 'defenders_within_shot', 'in_shot', 'ball_speed', 'on_goal', 'player_speed', 'weighted_def_dist']
+    features = FEATURES_LYNN_WEIGHTED
     d_kicks = pd.DataFrame(generate_rows(match, stadium))
     d_kicks["xg"] = clf.predict_proba(d_kicks[features])[:,1]
     for kick in d_kicks.to_dict(orient="records"):
@@ -182,7 +221,7 @@ def predict_xg_lynn_both(match, stadium, generate_rows, clf):
     Returns:
         Inflated match data with "xg" field added to each kick (dict).
     """
-    features = ['goal_angle', 'goal_distance', 'defender_dist', 'closest_defender', 'in_box', 'defenders_within_shot', 'in_shot', 'ball_speed', 'on_goal', 'player_speed', 'weighted_def_dist']
+    features = FEATURES_LYNN_BOTH
     d_kicks = pd.DataFrame(generate_rows(match, stadium))
     d_kicks["xg"] = clf.predict_proba(d_kicks[features])[:,1]
     for kick in d_kicks.to_dict(orient="records"):
@@ -262,4 +301,55 @@ def generate_rows_lynn(match, stadium):
             "in_stadium": match["stadium"]
         }
         
-        yield row
\ No newline at end of file
+        yield row
+
+def predict_xg_models(match, stadium, models):
+    """
+    Predicts XG for each kick with several models, generating the features
+    only once for all models that share a generator.
+    Args:
+        match: Inflated match data (dict).
+        stadium: Stadium data (dict).
+        models: List of tuples (name, clf, generate_rows, features), where name
+            is the model name (str), clf is a classifier following the
+            scikit-learn interface, generate_rows is a function(match, stadium)
+            to generate kick records, and features is a list of columns to use
+            as predictors.
+    Returns:
+        Dict of model names (str) to lists of XG (floats) for each kick, in the
+        same order as the match kick list.
+    """
+    groups = {}
+    for name, clf, generate_rows, features in models:
+        if generate_rows not in groups:
+            groups[generate_rows] = []
+        groups[generate_rows].append((name, clf, features))
+    n_kicks = len(match["kicks"])
+    xg_by_model = {}
+    for generate_rows, group in groups.items():
+        d_kicks = pd.DataFrame(generate_rows(match, stadium))
+        for name, clf, features in group:
+            xg = [None] * n_kicks
+            if len(d_kicks) > 0:
+                probs = clf.predict_proba(d_kicks[features])[:,1]
+                for i, p in zip(d_kicks["index"], probs):
+                    xg[i] = float(p)
+            xg_by_model[name] = xg
+    return xg_by_model
+
+
+def get_row_dtypes(generate_rows):
+    """
+    Gets the declared column dtypes of a row generator.
+    Args:
+        generate_rows: Row generator, e.g. generate_rows_demo.
+    Returns:
+        Dict of column names (str) to dtypes, empty if the generator has no
+        declared dtypes.
+    """
+    dtypes = {
+        generate_rows_demo: ROW_DTYPES_DEMO,
+        generate_rows_edwin: ROW_DTYPES_EDWIN,
+        generate_rows_lynn: ROW_DTYPES_LYNN
+    }
+    return dict(dtypes.get(generate_rows, {}))
@@ -0,0 +1,371 @@
+"""
+Versioned registry of production models, read from a manifest file.
+
+The manifest is a JSON file listing each model's name, path, feature generator,
+features, content hash, and version, along with the default model. The hash
+covers the pickled model and the compiled forest and lookup surface next to it,
+if any, since the server may serve those instead:
+
+    {
+        "default": "lynn_rf_weighted",
+        "models": [
+            {
+                "name": "demo_logit",
+                "path": "models/demo_logistic_regression.pkl",
+                "generator": "demo",
+                "features": ["goal_distance", "goal_angle"],
+                "sha256": "...",
+                "version": "..."
+            }
+        ]
+    }
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.forest import (
+    get_compiled_path
+)
+from haxml.prediction import (
+    generate_rows_demo,
+    generate_rows_edwin,
+    generate_rows_lynn
+)
+from haxml.surface import (
+    get_surface_path
+)
+from haxml.utils import (
+    get_file_sha256
+)
+import hashlib
+import json
+import os
+import threading
+import traceback
+
+
+# Feature generators that models in the manifest can use, by name.
+GENERATORS = {
+    "demo": generate_rows_demo,
+    "edwin": generate_rows_edwin,
+    "lynn": generate_rows_lynn
+}
+
+
+def get_artifact_sha256(path):
+    """
+    Computes one SHA-256 hash of a pickled model and of the compiled forest
+    (.npz) and lookup surface (.surface.npz) next to it, so changing any file
+    the server may serve for the model changes the hash.
+    Returns:
+        Hex digest (str), or None if the pickled model does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    for artifact in [path, get_compiled_path(path), get_surface_path(path)]:
+        sha256 = get_file_sha256(artifact)
+        if sha256 is not None:
+            digest.update("{}:{}\n".format(os.path.basename(artifact), sha256).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ModelVersion:
+    """
+    One version of a production model. The classifier is loaded when first
+    needed, see ModelRegistry.load.
+    Args:
+        name: Name of the model (str).
+        path: Filename of the pickled model (str).
+        generator: Name of the feature generator in GENERATORS (str).
+        features: Columns to use as predictors (list of str).
+        sha256: Expected hash of the model artifacts (via get_artifact_sha256),
+            or None to skip the check (str).
+        version: Version of the model, or None to use the start of the hash
+            (str).
+    """
+
+    def __init__(self, name, path, generator, features, sha256=None, version=None):
+        if generator not in GENERATORS:
+            raise ValueError("Unknown generator for {}: {}".format(name, generator))
+        self.name = name
+        self.path = path
+        self.generator = generator
+        self.generate_rows = GENERATORS[generator]
+        self.features = list(features)
+        self.sha256 = sha256
+        if version is None and sha256 is not None:
+            version = sha256[:12]
+        self.version = version
+        self.clf = None
+        # Held while the classifier loads, so only requests for this model
+        # wait for it.
+        self.load_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled, e.g. to send the model to worker processes.
+        state = dict(self.__dict__)
+        del state["load_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.load_lock = threading.Lock()
+
+    def __repr__(self):
+        return "ModelVersion({})".format(self.key)
+
+    @property
+    def key(self):
+        """
+        Name and version (str), for keys of results that depend on the model.
+        """
+        if self.version is None:
+            return self.name
+        return "{}@{}".format(self.name, self.version)
+
+    def is_same(self, other):
+        """
+        Checks if two entries describe the same model artifact.
+        """
+        return (
+            self.path == other.path
+            and self.generator == other.generator
+            and self.features == other.features
+            and self.sha256 == other.sha256
+            and self.version == other.version
+        )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "path": self.path,
+            "generator": self.generator,
+            "features": self.features,
+            "sha256": self.sha256,
+            "version": self.version
+        }
+
+
+def make_model_versions(model_configs):
+    """
+    Makes model versions from config dicts with "name", "path", "generator",
+    and "features" keys, hashing each model's artifacts for its version.
+    """
+    models = []
+    for model_config in model_configs:
+        sha256 = model_config.get("sha256")
+        if sha256 is None:
+            sha256 = get_artifact_sha256(model_config["path"])
+        models.append(ModelVersion(
+            model_config["name"],
+            model_config["path"],
+            model_config["generator"],
+            model_config["features"],
+            sha256=sha256,
+            version=model_config.get("version")
+        ))
+    return models
+
+
+def read_manifest(infile):
+    """
+    Reads a model manifest.
+    Raises ValueError if the manifest is invalid.
+    Returns:
+        Tuple (models, default_name) of the models (list of ModelVersion) and
+        the name of the default model (str).
+    """
+    with open(infile, "r") as file:
+        manifest = json.load(file)
+    models = []
+    for entry in manifest["models"]:
+        models.append(ModelVersion(
+            entry["name"],
+            entry["path"],
+            entry["generator"],
+            entry["features"],
+            sha256=entry.get("sha256"),
+            version=entry.get("version")
+        ))
+    names = [model.name for model in models]
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicate model names in manifest: {}".format(infile))
+    default_name = manifest.get("default", names[0] if len(names) > 0 else None)
+    if default_name not in names:
+        raise ValueError("Default model is not in manifest: {}".format(default_name))
+    return models, default_name
+
+
+def write_manifest(models, default_name, outfile):
+    """
+    Writes a model manifest, replacing the file atomically so the server never
+    reads a partial manifest.
+    Args:
+        models: Models to list (list of ModelVersion).
+        default_name: Name of the default model (str).
+        outfile: Filename to write to (str).
+    """
+    manifest = {
+        "default": default_name,
+        "models": [model.to_dict() for model in models]
+    }
+    tmpfile = "{}.{}.tmp".format(outfile, os.getpid())
+    with open(tmpfile, "w") as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(tmpfile, outfile)
+
+
+class ModelRegistry:
+    """
+    Current version of each production model. Updates build a new dict of
+    models and swap it in with one assignment, so each request sees either the
+    old or the new set of models. Requests should look up a model once and
+    keep using that ModelVersion, so one request never mixes versions.
+    Args:
+        models: Models to serve (list of ModelVersion).
+        default_name: Name of the default model (str).
+        load: function(model) that loads and returns the model's classifier.
+        unload: function(model) called for each model version that an update
+            swaps out or removes, to free anything kept for it, if any.
+    """
+
+    def __init__(self, models, default_name, load, unload=None):
+        self.state = ({model.name: model for model in models}, default_name)
+        self.load_fn = load
+        self.unload_fn = unload
+        self.update_lock = threading.Lock()
+        self.manifest_mtime = None
+        self.stats = {
+            "updates": 0,
+            "swapped": 0,
+            "errors": 0,
+            "last_error": None
+        }
+        self.stop_event = threading.Event()
+
+    @property
+    def default_name(self):
+        return self.state[1]
+
+    def names(self):
+        return list(self.state[0].keys())
+
+    def get(self, name):
+        """
+        Gets the current version of a model.
+        Raises KeyError if there is no model with the name.
+        """
+        models, default_name = self.state
+        if name not in models:
+            raise KeyError("No model named: {}".format(name))
+        return models[name]
+
+    def load(self, model):
+        """
+        Loads the model's classifier if needed. Loaded models are returned
+        without locking, and a model that is loading (e.g. a new version being
+        warmed during a swap) only blocks requests for that model version.
+        Returns:
+            Classifier following the scikit-learn interface.
+        """
+        clf = model.clf
+        if clf is not None:
+            return clf
+        with model.load_lock:
+            if model.clf is None:
+                model.clf = self.load_fn(model)
+        return model.clf
+
+    def update(self, models, default_name, warm=None):
+        """
+        Replaces the models. Models whose artifact is unchanged keep their
+        loaded classifier. Changed models are warmed before they are swapped
+        in if the old version was loaded, or if they are the default model, so
+        requests never wait for them to load. Versions that are swapped out or
+        removed are passed to unload after the swap.
+        Args:
+            models: New models to serve (list of ModelVersion).
+            default_name: Name of the new default model (str).
+            warm: function(model) that loads and warms a model, if any.
+        Returns:
+            Names of models that were added or changed (list of str).
+        """
+        with self.update_lock:
+            old_models, old_default = self.state
+            new_models = {}
+            changed = []
+            for model in models:
+                old = old_models.get(model.name)
+                if old is not None and old.is_same(model):
+                    new_models[model.name] = old
+                    continue
+                was_loaded = old is not None and old.clf is not None
+                if warm is not None and (was_loaded or model.name == default_name):
+                    warm(model)
+                new_models[model.name] = model
+                changed.append(model.name)
+            self.state = (new_models, default_name)
+            self.stats["updates"] += 1
+            self.stats["swapped"] += len(changed)
+        if self.unload_fn is not None:
+            keys = {model.key for model in new_models.values()}
+            for name, old in old_models.items():
+                if new_models.get(name) is not old and old.key not in keys:
+                    self.unload_fn(old)
+        return changed
+
+    def poll_manifest(self, infile, warm=None):
+        """
+        Updates the models from the manifest if the file changed since the
+        last poll. Invalid manifests are reported and ignored, keeping the
+        current models.
+        Returns:
+            Names of models that were added or changed (list of str).
+        """
+        if not os.path.exists(infile):
+            return []
+        mtime = os.path.getmtime(infile)
+        if mtime == self.manifest_mtime:
+            return []
+        self.manifest_mtime = mtime
+        try:
+            models, default_name = read_manifest(infile)
+            return self.update(models, default_name, warm=warm)
+        except Exception as e:
+            traceback.print_exc()
+            with self.update_lock:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = str(e)
+            return []
+
+    def watch(self, infile, warm=None, poll_secs=10.0):
+        """
+        Polls the manifest in a background daemon thread until stopped.
+        """
+        def run():
+            while not self.stop_event.wait(poll_secs):
+                changed = self.poll_manifest(infile, warm=warm)
+                if len(changed) > 0:
+                    print("Swapped models: {}".format(", ".join(changed)))
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_stats(self):
+        models, default_name = self.state
+        with self.update_lock:
+            stats = dict(self.stats)
+        stats["default"] = default_name
+        stats["models"] = {
+            name: {
+                "version": model.version,
+                "loaded": model.clf is not None
+            }
+            for name, model in models.items()
+        }
+        return stats
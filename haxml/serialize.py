@@ -0,0 +1,94 @@
+"""
+Fast JSON serialization and compact payloads for match data.
+"""
+
+import json
+import math
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Kick fields included as columns in compact responses.
+KICK_COLUMNS = ["time", "type", "fromId", "fromName", "fromTeam", "fromX", "fromY"]
+# Sections of the inflated match that can be requested in compact responses.
+MATCH_SECTIONS = ["saved", "score", "stadium", "players", "goals", "possessions", "positions"]
+# Sections that are lists of records, which are returned as columns.
+COLUMN_SECTIONS = ["goals", "possessions", "positions"]
+
+
+def to_json_values(obj):
+    """
+    Converts NumPy values for the standard library JSON encoder and replaces
+    NaN and infinite floats with None, as orjson does, since JSON has no NaN.
+    """
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: to_json_values(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_json_values(value) for value in obj]
+    if isinstance(obj, (np.ndarray, np.generic)):
+        if obj.dtype.kind == "f" and obj.dtype.itemsize < 8:
+            # Write the shortest decimal of each float32, as orjson does.
+            obj = np.asarray(obj).astype(str).astype(np.float64)
+        return to_json_values(obj.tolist())
+    return obj
+
+
+def dumps(obj):
+    """
+    Serializes an object to JSON, writing NumPy arrays directly.
+    Uses orjson if it is installed, otherwise the standard library. Either way,
+    NaN and infinite floats are written as null.
+    Args:
+        obj: Object to serialize, may contain NumPy arrays and scalars.
+    Returns:
+        JSON (bytes).
+    """
+    if orjson is not None:
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(obj, option=options)
+    return json.dumps(to_json_values(obj), allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def to_columns(records, keys=None):
+    """
+    Converts a list of records to a dict of columns.
+    Args:
+        records: List of dicts with the same keys.
+        keys: Keys to include, defaults to all keys of the first record.
+    Returns:
+        Dict of keys (str) to lists of values.
+    """
+    if keys is None:
+        keys = list(records[0].keys()) if len(records) > 0 else []
+    return {key: [record[key] for record in records] for key in keys}
+
+
+def compact_match(match, xg, sections=[]):
+    """
+    Builds a compact payload with kick-level XG as column arrays.
+    Args:
+        match: Inflated match data (dict).
+        xg: XG for each kick, in the same order as the match kick list
+            (NumPy array).
+        sections: Other sections of the match to include, from MATCH_SECTIONS
+            (list of str). List sections are returned as columns.
+    Returns:
+        Dict with "kicks" columns (including "xg") and the requested sections.
+    """
+    kicks = to_columns(match["kicks"], KICK_COLUMNS)
+    kicks["xg"] = xg
+    res = {"kicks": kicks}
+    for section in sections:
+        if section not in MATCH_SECTIONS:
+            raise ValueError("Unknown match section: {}".format(section))
+        if section in COLUMN_SECTIONS:
+            res[section] = to_columns(match[section])
+        else:
+            res[section] = match[section]
+    return res
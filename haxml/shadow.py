@@ -0,0 +1,183 @@
+"""
+Shadow evaluation of a candidate model on live traffic.
+
+After a request scores a match with the baseline model, the shadow worker
+scores the same kicks with the candidate model in the background and appends
+both predictions to a JSON lines log, one line per kick:
+
+    {"mid": "...", "index": 0, "time": 12.5, "ag": 0,
+     "baseline": "lynn_rf_weighted@...", "baseline_xg": 0.04,
+     "candidate": "edwin_rf_8@...", "candidate_xg": 0.06, "logged": 1600000000.0}
+
+Read the log with read_shadow_log and compare the models with
+haxml.evaluation.compare_shadow.
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.serialize import (
+    dumps
+)
+import os
+import pandas as pd
+import queue
+import threading
+import time
+import traceback
+
+
+class ShadowWorker:
+    """
+    Scores shadow tasks from a bounded queue on background threads and appends
+    the records to the log. Submitting never blocks: when the queue is full,
+    the task is dropped, so shadow scoring never adds latency to requests.
+    Args:
+        score: function(task) that returns the records to log (list of dicts).
+        log_path: Filename of the JSON lines log to append to (str).
+        max_queue: Maximum number of tasks waiting to be scored (int).
+        n_threads: Number of threads scoring tasks (int).
+    """
+
+    def __init__(self, score, log_path, max_queue=50, n_threads=1):
+        self.score = score
+        self.log_path = log_path
+        self.tasks = queue.Queue(maxsize=max_queue)
+        self.n_threads = n_threads
+        self.lock = threading.Lock()
+        self.log_lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "dropped": 0,
+            "done": 0,
+            "errors": 0,
+            "records": 0
+        }
+        self.stop_event = threading.Event()
+
+    def count(self, stat, n=1):
+        with self.lock:
+            self.stats[stat] += n
+
+    def submit(self, task):
+        """
+        Queues a task if there is room.
+        Returns:
+            Whether the task was queued (boolean).
+        """
+        try:
+            self.tasks.put_nowait(task)
+        except queue.Full:
+            self.count("dropped")
+            return False
+        self.count("submitted")
+        return True
+
+    def drop(self):
+        """
+        Counts a task that was not submitted, e.g. because the server is busy.
+        """
+        self.count("dropped")
+
+    def append(self, records):
+        """
+        Appends records to the log, one JSON object per line. Each call writes
+        all of its lines at once, so lines from different tasks never mix.
+        """
+        if len(records) == 0:
+            return
+        lines = b"".join(dumps(record) + b"\n" for record in records)
+        log_dir = os.path.dirname(self.log_path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        with self.log_lock:
+            with open(self.log_path, "ab") as file:
+                file.write(lines)
+
+    def run_task(self, task):
+        try:
+            records = self.score(task)
+            self.append(records)
+            with self.lock:
+                self.stats["done"] += 1
+                self.stats["records"] += len(records)
+        except Exception:
+            traceback.print_exc()
+            self.count("errors")
+
+    def work(self):
+        """
+        Scores tasks from the queue until stopped.
+        """
+        while not self.stop_event.is_set():
+            try:
+                task = self.tasks.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            self.run_task(task)
+            self.tasks.task_done()
+
+    def start(self):
+        """
+        Runs the scoring threads in the background as daemon threads.
+        """
+        for _ in range(self.n_threads):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["queue_size"] = self.tasks.qsize()
+        stats["log_path"] = self.log_path
+        return stats
+
+
+def make_shadow_records(mid, rows, baseline_key, baseline_xg, candidate_key, candidate_xg):
+    """
+    Pairs the predictions of the baseline and candidate models for each kick.
+    Args:
+        mid: Match ID (str).
+        rows: Feature rows with "index", "time", and "ag" columns (DataFrame).
+        baseline_key: Key of the baseline model (str).
+        baseline_xg: Baseline XG for each row (NumPy array).
+        candidate_key: Key of the candidate model (str).
+        candidate_xg: Candidate XG for each row (NumPy array).
+    Returns:
+        Records to log (list of dicts).
+    """
+    logged = time.time()
+    return [
+        {
+            "mid": mid,
+            "index": int(i),
+            "time": float(t),
+            "ag": int(ag),
+            "baseline": baseline_key,
+            "baseline_xg": float(bxg),
+            "candidate": candidate_key,
+            "candidate_xg": float(cxg),
+            "logged": logged
+        }
+        for i, t, ag, bxg, cxg in zip(rows["index"], rows["time"], rows["ag"], baseline_xg, candidate_xg)
+    ]
+
+
+def read_shadow_log(infile, latest=True):
+    """
+    Reads the shadow log into a DataFrame with one row per logged kick.
+    Args:
+        infile: Filename of the log (str).
+        latest: Whether to keep only the latest record for each kick and pair
+            of models, since a match can be scored more than once (boolean).
+    Returns:
+        DataFrame with the columns of the log records.
+    """
+    d_log = pd.read_json(infile, lines=True, dtype={"mid": str})
+    if latest and len(d_log) > 0:
+        d_log = d_log.sort_values("logged")
+        d_log = d_log.drop_duplicates(["mid", "index", "baseline", "candidate"], keep="last")
+        d_log = d_log.sort_values(["mid", "index"]).reset_index(drop=True)
+    return d_log
@@ -0,0 +1,104 @@
+"""
+Sources of packed match data for the prediction server.
+"""
+
+import json
+import os
+
+
+class FirebaseMatchSource:
+    """
+    Reads packed matches from the Firebase real-time database.
+    Args:
+        db: Pyrebase database reference.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_packed(self, mid):
+        """
+        Fetch packed match data for the given match ID.
+        Raises ValueError if the match is not found.
+        """
+        r = self.db.child("match/{}".format(mid)).get()
+        packed = r.val()
+        if packed is None:
+            raise ValueError("Match data not found for: {}".format(mid))
+        return packed
+
+    def count_kicks(self, mid):
+        """
+        Counts the kicks of a match with a shallow query, which only
+        downloads the kick keys instead of the whole match.
+        Returns:
+            Number of kicks (int), 0 if the match has none or is not found.
+        """
+        keys = self.db.child("match/{}/kicks".format(mid)).shallow().get().val()
+        return len(keys) if keys is not None else 0
+
+    def list_ids(self, limit=20):
+        """
+        Lists the IDs of the most recently saved matches. Firebase push IDs
+        sort in the order they were created.
+        Args:
+            limit: Maximum number of IDs to return (int).
+        Returns:
+            List of match IDs, oldest first (list of str).
+        """
+        keys = self.db.child("match").shallow().get().val()
+        if keys is None:
+            return []
+        return sorted(keys)[-limit:]
+
+
+class DirectoryMatchSource:
+    """
+    Reads packed matches from JSON files named <mid>.json in a directory, such
+    as the data/packed_matches folder made by the download scripts. Stands in
+    for the database when running locally, and can be driven by rewriting the
+    files, e.g. to simulate a live match.
+    Args:
+        path: Directory where packed match files are stored (string).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_packed(self, mid):
+        """
+        Read packed match data for the given match ID.
+        Raises ValueError if the match is not found.
+        """
+        infile = os.path.join(self.path, "{}.json".format(mid))
+        try:
+            with open(infile, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            raise ValueError("Match data not found for: {}".format(mid))
+
+    def count_kicks(self, mid):
+        """
+        Counts the kicks of a match.
+        Returns:
+            Number of kicks (int), 0 if the match has none or is not found.
+        """
+        try:
+            return len(self.get_packed(mid).get("kicks", []))
+        except ValueError:
+            return 0
+
+    def list_ids(self, limit=20):
+        """
+        Lists the IDs of the most recently modified match files.
+        Args:
+            limit: Maximum number of IDs to return (int).
+        Returns:
+            List of match IDs, oldest first (list of str).
+        """
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith(".json"):
+                infile = os.path.join(self.path, name)
+                files.append((os.path.getmtime(infile), name[:-len(".json")]))
+        return [mid for mtime, mid in sorted(files)[-limit:]]
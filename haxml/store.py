@@ -0,0 +1,72 @@
+"""
+Local file store for precomputed XG results.
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.serialize import (
+    dumps
+)
+import json
+import os
+import threading
+
+
+def is_safe_key(key):
+    """
+    Checks that a match ID or model name can be used as a file name.
+    """
+    return len(key) > 0 and not key.startswith(".") and "/" not in key and "\\" not in key
+
+
+class XGStore:
+    """
+    Stores one JSON file of results per match and model, at
+    <path>/<model_name>/<mid>.json. Writes go to a temporary file that is then
+    renamed, so readers never see a partial file and repeated writes of the
+    same result are harmless.
+    Args:
+        path: Directory to store results in (string).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_path(self, mid, model_name):
+        if not is_safe_key(mid) or not is_safe_key(model_name):
+            raise ValueError("Invalid store key: {}, {}".format(mid, model_name))
+        return os.path.join(self.path, model_name, "{}.json".format(mid))
+
+    def has(self, mid, model_name):
+        """
+        Checks if there is a stored result for the match and model.
+        """
+        return os.path.exists(self.get_path(mid, model_name))
+
+    def read(self, mid, model_name):
+        """
+        Reads the stored result for the match and model.
+        Returns:
+            Stored result (dict), or None if there is no result.
+        """
+        try:
+            with open(self.get_path(mid, model_name), "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write(self, mid, model_name, result):
+        """
+        Writes the result for the match and model, replacing any earlier one.
+        Args:
+            mid: Match ID (str).
+            model_name: Name of the model (str).
+            result: Result to store, may contain NumPy arrays (dict).
+        """
+        outfile = self.get_path(mid, model_name)
+        os.makedirs(os.path.dirname(outfile), exist_ok=True)
+        tmpfile = "{}.{}.{}.tmp".format(outfile, os.getpid(), threading.get_ident())
+        with open(tmpfile, "wb") as file:
+            file.write(dumps(result))
+        os.replace(tmpfile, outfile)
@@ -0,0 +1,245 @@
+"""
+Precomputed XG lookup surfaces for models that only use the kick position.
+
+Models trained on FEATURES_DEMO (goal distance and goal angle) predict the same
+XG for every kick from the same spot, given the stadium and the kicking team.
+Their predictions can be evaluated once on a grid over each stadium and then
+served by interpolating the grid, without the classifier or scikit-learn.
+"""
+
+import sys
+sys.path.append("./")
+
+from haxml.prediction import (
+    FEATURES_DEMO
+)
+from haxml.utils import (
+    angle_from_goal,
+    get_opposing_goalpost,
+    stadium_distance
+)
+import numpy as np
+import os
+import pandas as pd
+
+
+# Teams that can take a kick.
+SURFACE_TEAMS = ["red", "blue"]
+# Default spacing between grid points, in stadium units.
+SURFACE_STEP = 5.0
+# Default distance the grid extends beyond the stadium bounds, since kicks can
+# be taken from behind the goal line.
+SURFACE_MARGIN = 50.0
+
+
+def get_position_features(x, y, gx, gy):
+    """
+    Computes goal distance and goal angle for arrays of kick positions, as in
+    stadium_distance and angle_from_goal.
+    Args:
+        x: X-coordinates where the ball was kicked from (NumPy array).
+        y: Y-coordinates where the ball was kicked from (NumPy array).
+        gx: X-coordinate of the goal midpoint (float).
+        gy: Y-coordinate of the goal midpoint (float).
+    Returns:
+        Tuple (goal_distance, goal_angle) of NumPy arrays.
+    """
+    dx = np.abs(x - gx)
+    dy = np.abs(y - gy)
+    dist = np.sqrt((dx ** 2) + (dy ** 2))
+    angle = np.full(dx.shape, np.pi / 2.0)
+    is_off_line = dy > 0
+    angle[is_off_line] = np.arctan(dx[is_off_line] / dy[is_off_line])
+    return dist, angle
+
+
+class XGSurface:
+    """
+    Grids of XG over the stadium for each (stadium, team), read with bilinear
+    interpolation. Positions beyond the grid read the nearest edge of the grid.
+    Args:
+        tables: Dict of tuples (stadium_name, team) to tuples
+            (x0, y0, step, values), where values[i, j] is the XG for a kick
+            from (x0 + i * step, y0 + j * step) (2D float32 NumPy array).
+        max_error: Largest difference from the original model seen when the
+            surface was compiled, if measured (float).
+    """
+
+    def __init__(self, tables, max_error=None):
+        self.tables = tables
+        self.max_error = max_error
+
+    def __repr__(self):
+        return "XGSurface(n_tables={}, n_points={}, max_error={})".format(
+            len(self.tables),
+            sum(values.size for x0, y0, step, values in self.tables.values()),
+            self.max_error
+        )
+
+    def has_stadium(self, stadium_name):
+        """
+        Checks if the surface has a grid for each team in the stadium.
+        """
+        return all((stadium_name, team) in self.tables for team in SURFACE_TEAMS)
+
+    def predict(self, stadium_name, team, x, y):
+        """
+        Looks up XG for kicks by one team.
+        Args:
+            stadium_name: Name of the stadium (str).
+            team: Team that took the kicks ("red" or "blue").
+            x: X-coordinates where the ball was kicked from (NumPy array).
+            y: Y-coordinates where the ball was kicked from (NumPy array).
+        Returns:
+            XG for each kick (NumPy array).
+        """
+        x0, y0, step, values = self.tables[(stadium_name, team)]
+        nx, ny = values.shape
+        fx = np.clip((np.asarray(x, dtype=float) - x0) / step, 0, nx - 1)
+        fy = np.clip((np.asarray(y, dtype=float) - y0) / step, 0, ny - 1)
+        i = np.minimum(fx.astype(int), nx - 2)
+        j = np.minimum(fy.astype(int), ny - 2)
+        tx = fx - i
+        ty = fy - j
+        return (
+            values[i, j] * (1 - tx) * (1 - ty)
+            + values[i + 1, j] * tx * (1 - ty)
+            + values[i, j + 1] * (1 - tx) * ty
+            + values[i + 1, j + 1] * tx * ty
+        )
+
+    def predict_match(self, match):
+        """
+        Looks up XG for each kick in the match.
+        Args:
+            match: Inflated match data (dict).
+        Returns:
+            XG for each kick, in the same order as the match kick list (NumPy
+            array).
+        """
+        kicks = match["kicks"]
+        x = np.array([kick["fromX"] for kick in kicks], dtype=float)
+        y = np.array([kick["fromY"] for kick in kicks], dtype=float)
+        teams = np.array([kick["fromTeam"] for kick in kicks])
+        xg = np.full(len(kicks), np.nan)
+        for team in SURFACE_TEAMS:
+            is_team = teams == team
+            if is_team.any():
+                xg[is_team] = self.predict(match["stadium"], team, x[is_team], y[is_team])
+        return xg
+
+
+def compile_surface(clf, stadiums, step=SURFACE_STEP, margin=SURFACE_MARGIN, features=FEATURES_DEMO):
+    """
+    Evaluates a fitted classifier on a grid over each stadium and team.
+    Stadiums without bounds or goalposts are skipped.
+    Args:
+        clf: Classifier trained on goal distance and goal angle, following the
+            scikit-learn interface.
+        stadiums: Dict of stadium names (str) to stadium data (dict).
+        step: Spacing between grid points, in stadium units (float).
+        margin: Distance the grid extends beyond the stadium bounds (float).
+        features: Names of the features clf was trained on, in order (list).
+    Returns:
+        XGSurface.
+    """
+    tables = {}
+    for stadium_name, stadium in stadiums.items():
+        if "bounds" not in stadium or "goalposts" not in stadium:
+            continue
+        bounds = stadium["bounds"]
+        xs = np.arange(bounds["minX"] - margin, bounds["maxX"] + margin + step, step)
+        ys = np.arange(bounds["minY"] - margin, bounds["maxY"] + margin + step, step)
+        x, y = np.meshgrid(xs, ys, indexing="ij")
+        for team in SURFACE_TEAMS:
+            gp = get_opposing_goalpost(stadium, team)
+            dist, angle = get_position_features(x.ravel(), y.ravel(), gp["mid"]["x"], gp["mid"]["y"])
+            X = pd.DataFrame({"goal_distance": dist, "goal_angle": angle})[features]
+            values = clf.predict_proba(X)[:,1].astype(np.float32).reshape(x.shape)
+            tables[(stadium_name, team)] = (xs[0], ys[0], step, values)
+    return XGSurface(tables)
+
+
+def measure_surface_error(surface, clf, stadiums, n_samples=1000, seed=0, features=FEATURES_DEMO):
+    """
+    Compares the surface to the classifier on random kick positions over the
+    whole grid of each stadium, including the margin beyond the bounds that
+    kicks from behind the goal line are read from, using the same feature
+    functions as the predictors. Sets surface.max_error to the largest
+    difference.
+    Args:
+        surface: XGSurface compiled from clf.
+        clf: Original classifier.
+        stadiums: Dict of stadium names (str) to stadium data (dict).
+        n_samples: Number of positions to check per stadium and team (int).
+        seed: Seed for the random positions (int).
+        features: Names of the features clf was trained on, in order (list).
+    Returns:
+        Dict of tuples (stadium_name, team) to the largest difference (float).
+    """
+    rng = np.random.default_rng(seed)
+    errors = {}
+    for (stadium_name, team), (x0, y0, step, values) in surface.tables.items():
+        stadium = stadiums[stadium_name]
+        gp = get_opposing_goalpost(stadium, team)
+        gx = gp["mid"]["x"]
+        gy = gp["mid"]["y"]
+        nx, ny = values.shape
+        x = rng.uniform(x0, x0 + (nx - 1) * step, size=n_samples)
+        y = rng.uniform(y0, y0 + (ny - 1) * step, size=n_samples)
+        X = pd.DataFrame({
+            "goal_distance": [stadium_distance(xi, yi, gx, gy) for xi, yi in zip(x, y)],
+            "goal_angle": [angle_from_goal(xi, yi, gx, gy) for xi, yi in zip(x, y)]
+        })[features]
+        expected = clf.predict_proba(X)[:,1]
+        actual = surface.predict(stadium_name, team, x, y)
+        errors[(stadium_name, team)] = float(np.abs(expected - actual).max())
+    surface.max_error = max(errors.values()) if len(errors) > 0 else None
+    return errors
+
+
+def save_surface(surface, outfile):
+    """
+    Writes the surface to a compressed NumPy .npz file, with all grids in one
+    flat array.
+    """
+    keys = list(surface.tables.keys())
+    tables = [surface.tables[key] for key in keys]
+    np.savez_compressed(
+        outfile,
+        stadiums=np.array([stadium_name for stadium_name, team in keys]),
+        teams=np.array([team for stadium_name, team in keys]),
+        origins=np.array([(x0, y0) for x0, y0, step, values in tables], dtype=float).reshape(-1, 2),
+        steps=np.array([step for x0, y0, step, values in tables], dtype=float),
+        shapes=np.array([values.shape for x0, y0, step, values in tables], dtype=np.int64).reshape(-1, 2),
+        values=np.concatenate([values.ravel() for x0, y0, step, values in tables]) if len(tables) > 0 else np.zeros(0, dtype=np.float32),
+        max_error=np.array(np.nan if surface.max_error is None else surface.max_error)
+    )
+
+
+def load_surface(infile):
+    """
+    Reads a surface written by save_surface.
+    """
+    with np.load(infile) as data:
+        tables = {}
+        offset = 0
+        for stadium_name, team, (x0, y0), step, (nx, ny) in zip(
+            data["stadiums"], data["teams"], data["origins"], data["steps"], data["shapes"]
+        ):
+            values = data["values"][offset:offset + nx * ny].reshape(nx, ny)
+            tables[(str(stadium_name), str(team))] = (float(x0), float(y0), float(step), values)
+            offset += nx * ny
+        max_error = float(data["max_error"])
+    return XGSurface(tables, None if np.isnan(max_error) else max_error)
+
+
+def get_surface_path(path):
+    """
+    Returns the path where the lookup surface of a pickled model is stored.
+    Args:
+        path: Filename of the pickled model (string).
+    Returns:
+        Filename with the .surface.npz extension (string).
+    """
+    return os.path.splitext(path)[0] + ".surface.npz"
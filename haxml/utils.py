@@ -2,8 +2,11 @@
 Logic and utilities for HaxML analytics.
 """
 
+import hashlib
 import json
 import math
+import os
+import random
 from tqdm import tqdm
 
 
@@ -228,6 +231,21 @@ def load_match(infile, callback=None):
     return match
 
 
+def get_file_sha256(path):
+    """
+    Computes the SHA-256 hash of a file's contents.
+    Returns:
+        Hex digest (str), or None if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def get_stadiums(infile):
     """
     Reads a dict of stadium data from a filename.
@@ -317,6 +335,34 @@ def train_test_split_matches_even_count(metadata):
     return train, test
 
 
+def kfold_split_matches(metadata, n_folds=5, seed=0):
+    """
+    Splits matches into folds of almost the same size for cross-validation.
+    All kicks of a match stay in the match's fold. Matches are sorted by number
+    of scored goals and dealt out in rounds, one match to each fold per round
+    in a random order, so each fold gets a similar spread of goal counts.
+    Args:
+        metadata: List of dicts with IDs and metadata for each match, to split
+            into folds.
+        n_folds: Number of folds (int).
+        seed: Seed for the random order within each round (int).
+    Returns:
+        List of n_folds lists of match metadata (dicts).
+    """
+    rng = random.Random(seed)
+    folds = [[] for _ in range(n_folds)]
+    # Shuffle first so ties in goals are dealt out in a random order.
+    meta_shuffled = list(metadata)
+    rng.shuffle(meta_shuffled)
+    meta_sorted = sorted(meta_shuffled, key=total_scored_goals)
+    for start in range(0, len(meta_sorted), n_folds):
+        order = list(range(n_folds))
+        rng.shuffle(order)
+        for k, record in zip(order, meta_sorted[start:start + n_folds]):
+            folds[k].append(record)
+    return folds
+
+
 def total_scored_goals(meta):
     """
     Adds up the total number of scored goals from the match metadata.
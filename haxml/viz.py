@@ -9,8 +9,28 @@ sys.path.append("./")
 from haxml.utils import (
     get_opposing_goalpost
 )
+from collections import OrderedDict
+from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
+import io
+from xml.sax.saxutils import escape
+
+
+# Style of each line in XG time plots: (label, color, linestyle).
+XG_TIME_LINES = [
+    ("Red Actual", "red", "-"),
+    ("Red XG", "red", "--"),
+    ("Blue Actual", "blue", "-"),
+    ("Blue XG", "blue", "--")
+]
+# Resolution of rendered plots, in pixels per inch.
+PLOT_DPI = 100
+# Figures reused between renders in this process, key: tuple (width, height),
+# value: tuple (fig, ax, lines, canvas). Sizes come from requests, so only the
+# most recently used FIGURE_TEMPLATES_MAX figures are kept.
+figure_templates = OrderedDict()
+FIGURE_TEMPLATES_MAX = 8
 
 
 def plot_stadium(stadium):
@@ -169,16 +189,147 @@ def plot_xg_time_series(match):
     ax.plot(time, xgs_red, color="red", linestyle="--", label="Red XG")
     ax.plot(time, ags_blue, color="blue", linestyle="-", label="Blue Actual")
     ax.plot(time, xgs_blue, color="blue", linestyle="--", label="Blue XG")
+    ax.set_title(get_xg_time_plot_title(match))
+    ax.set_xlabel("Match Time (secs)")
+    ax.set_ylabel("Goals")
+    ax.legend()
+    return fig, ax
+
+
+def get_xg_time_plot_title(match):
+    """
+    Produces the title for the XG match time plot.
+    Args:
+        match: Inflated match data (dict).
+    Returns:
+        Title with the final score and stadium (str).
+    """
     title = "Final Score: {} Won {}-{}\n{}"
     red_score = match["score"]["red"]
     blue_score = match["score"]["blue"]
     winner = "Red" if red_score > blue_score else "Blue"
     stadium_name = match["stadium"]
-    ax.set_title(title.format(winner, red_score, blue_score, stadium_name))
-    ax.set_xlabel("Match Time (secs)")
-    ax.set_ylabel("Goals")
-    ax.legend()
-    return fig, ax
+    return title.format(winner, red_score, blue_score, stadium_name)
+
+
+def get_figure_template(width, height):
+    """
+    Gets a reusable figure for XG time plots, making it on first use and
+    evicting the least recently used figure if there are too many.
+    Args:
+        width: Width of the plot in pixels (int).
+        height: Height of the plot in pixels (int).
+    Returns:
+        Tuple (fig, ax, lines, canvas), with lines in the order of XG_TIME_LINES.
+    """
+    key = (width, height)
+    if key in figure_templates:
+        figure_templates.move_to_end(key)
+    else:
+        fig = Figure(figsize=(width / PLOT_DPI, height / PLOT_DPI), dpi=PLOT_DPI)
+        ax = fig.add_subplot(1, 1, 1)
+        lines = []
+        for label, color, linestyle in XG_TIME_LINES:
+            line, = ax.plot([], [], color=color, linestyle=linestyle, label=label)
+            lines.append(line)
+        ax.set_xlabel("Match Time (secs)")
+        ax.set_ylabel("Goals")
+        ax.legend()
+        figure_templates[key] = (fig, ax, lines, FigureCanvas(fig))
+        while len(figure_templates) > FIGURE_TEMPLATES_MAX:
+            figure_templates.popitem(last=False)
+    return figure_templates[key]
+
+
+def render_xg_time_plot(xg_time_ser, title, width=1000, height=600):
+    """
+    Renders an XG match time plot to PNG, reusing the figure for the size.
+    Only takes plain data, so it can run in a worker process.
+    Args:
+        xg_time_ser: Tuple of (time, ags_red, ags_blue, xgs_red, xgs_blue), from
+            get_xg_time_series.
+        title: Title of the plot (str).
+        width: Width of the plot in pixels (int).
+        height: Height of the plot in pixels (int).
+    Returns:
+        PNG image (bytes).
+    """
+    fig, ax, lines, canvas = get_figure_template(width, height)
+    time, ags_red, ags_blue, xgs_red, xgs_blue = xg_time_ser
+    for line, ser in zip(lines, [ags_red, xgs_red, ags_blue, xgs_blue]):
+        line.set_data(time, ser)
+    ax.relim()
+    ax.autoscale_view()
+    ax.set_title(title)
+    output = io.BytesIO()
+    canvas.print_png(output)
+    return output.getvalue()
+
+
+def xg_time_plot_svg(xg_time_ser, title, width=1000, height=600):
+    """
+    Draws an XG match time plot as a lightweight SVG, without matplotlib.
+    Args:
+        xg_time_ser: Tuple of (time, ags_red, ags_blue, xgs_red, xgs_blue), from
+            get_xg_time_series.
+        title: Title of the plot, lines separated by newlines (str).
+        width: Width of the plot in pixels (int).
+        height: Height of the plot in pixels (int).
+    Returns:
+        SVG document (str).
+    """
+    time, ags_red, ags_blue, xgs_red, xgs_blue = xg_time_ser
+    title_lines = title.split("\n")
+    left, right, bottom = 60, 20, 50
+    top = 20 + 18 * len(title_lines)
+    plot_w = width - left - right
+    plot_h = height - top - bottom
+    max_t = max(max(time), 1)
+    max_y = max(max(ags_red + ags_blue + xgs_red + xgs_blue), 1) * 1.05
+
+    def sx(t):
+        return left + plot_w * t / max_t
+
+    def sy(y):
+        return top + plot_h * (1 - y / max_y)
+
+    parts = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" '
+        'viewBox="0 0 {} {}" font-family="sans-serif" font-size="12">'.format(width, height, width, height),
+        '<rect width="100%" height="100%" fill="white"/>'
+    ]
+    for i, line in enumerate(title_lines):
+        parts.append('<text x="{}" y="{}" text-anchor="middle" font-size="14">{}</text>'.format(
+            left + plot_w / 2, 20 + 18 * i, escape(line)
+        ))
+    # Axes, with a tick for each goal and about every minute of match time.
+    parts.append('<rect x="{}" y="{}" width="{}" height="{}" fill="none" stroke="black"/>'.format(
+        left, top, plot_w, plot_h
+    ))
+    y_step = max(1, int(max_y / 10) + 1)
+    for y in range(0, int(max_y) + 1, y_step):
+        parts.append('<text x="{}" y="{:.1f}" text-anchor="end">{}</text>'.format(left - 6, sy(y) + 4, y))
+    t_step = 60 * max(1, int(max_t / 600) + 1)
+    for t in range(0, int(max_t) + 1, t_step):
+        parts.append('<text x="{:.1f}" y="{}" text-anchor="middle">{}</text>'.format(sx(t), top + plot_h + 16, t))
+    parts.append('<text x="{}" y="{}" text-anchor="middle">Match Time (secs)</text>'.format(
+        left + plot_w / 2, height - 12
+    ))
+    parts.append('<text x="14" y="{}" text-anchor="middle" transform="rotate(-90 14 {})">Goals</text>'.format(
+        top + plot_h / 2, top + plot_h / 2
+    ))
+    # Series and legend.
+    for i, ((label, color, linestyle), ser) in enumerate(zip(XG_TIME_LINES, [ags_red, xgs_red, ags_blue, xgs_blue])):
+        dash = ' stroke-dasharray="6,4"' if linestyle == "--" else ""
+        points = " ".join("{:.1f},{:.1f}".format(sx(t), sy(y)) for t, y in zip(time, ser))
+        parts.append('<polyline points="{}" fill="none" stroke="{}" stroke-width="1.5"{}/>'.format(points, color, dash))
+        ly = top + 14 + 16 * i
+        parts.append('<line x1="{}" y1="{}" x2="{}" y2="{}" stroke="{}" stroke-width="1.5"{}/>'.format(
+            left + 10, ly - 4, left + 34, ly - 4, color, dash
+        ))
+        parts.append('<text x="{}" y="{}">{}</text>'.format(left + 40, ly, label))
+    parts.append("</svg>")
+    return "\n".join(parts)
 
 
 def plot_positions(positions, stadium):
@@ -0,0 +1,62 @@
+import sys
+sys.path.append("./")
+
+from haxml.forest import (
+    compile_forest,
+    get_compiled_path,
+    save_compiled_forest
+)
+from haxml.utils import (
+    get_file_sha256
+)
+import joblib
+import numpy as np
+import os
+import time
+
+
+# Get command line arguments.
+if len(sys.argv) <= 1:
+    raise IOError("Missing parameter: infile")
+infile = sys.argv[1]
+outfile = sys.argv[2] if len(sys.argv) > 2 else get_compiled_path(infile)
+
+# Load and compile the fitted forest.
+print("Compiling model: {}".format(infile))
+clf = joblib.load(infile)
+compiled = compile_forest(clf)
+print("\t{}".format(compiled))
+
+# Check predictions on random samples drawn across the range of split values.
+rng = np.random.default_rng(0)
+X = np.zeros((1000, compiled.n_features_in_))
+for f in range(compiled.n_features_in_):
+    is_split = (compiled.feature == f) & (compiled.left != compiled.right)
+    splits = compiled.threshold[is_split]
+    low, high = (splits.min(), splits.max()) if len(splits) > 0 else (0, 1)
+    X[:, f] = rng.uniform(low - 1, high + 1, size=len(X))
+expected = clf.predict_proba(X)
+actual = compiled.predict_proba(X)
+if not np.array_equal(expected, actual):
+    err = "Compiled predictions differ, max error: {}"
+    raise ValueError(err.format(np.abs(expected - actual).max()))
+print("\tPredictions are identical on {:,} samples.".format(len(X)))
+
+# Write compiled forest and report speed up.
+save_compiled_forest(compiled, outfile, source_sha256=get_file_sha256(infile))
+X_match = X[:100]
+start_time = time.time()
+clf.predict_proba(X_match)
+sklearn_secs = time.time() - start_time
+start_time = time.time()
+compiled.predict_proba(X_match)
+compiled_secs = time.time() - start_time
+print("\tpredict_proba on 100 kicks: {:.1f} ms (sklearn) vs. {:.1f} ms (compiled)".format(
+    1000 * sklearn_secs,
+    1000 * compiled_secs
+))
+print("Wrote compiled model ({:,} bytes, pickle is {:,} bytes) to file: {}".format(
+    os.path.getsize(outfile),
+    os.path.getsize(infile),
+    outfile
+))
@@ -0,0 +1,72 @@
+import sys
+sys.path.append("./")
+
+from haxml.prediction import (
+    FEATURES_DEMO
+)
+from haxml.surface import (
+    SURFACE_STEP,
+    compile_surface,
+    get_position_features,
+    get_surface_path,
+    measure_surface_error,
+    save_surface
+)
+from haxml.utils import (
+    get_opposing_goalpost,
+    get_stadiums
+)
+import joblib
+import numpy as np
+import os
+import pandas as pd
+import time
+
+
+# Get command line arguments.
+if len(sys.argv) <= 1:
+    raise IOError("Missing parameter: infile")
+infile = sys.argv[1]
+stadium_file = sys.argv[2] if len(sys.argv) > 2 else "data/stadiums.json"
+step = float(sys.argv[3]) if len(sys.argv) > 3 else SURFACE_STEP
+outfile = sys.argv[4] if len(sys.argv) > 4 else get_surface_path(infile)
+
+# Evaluate the model on a grid over each stadium.
+print("Compiling lookup surface: {}".format(infile))
+clf = joblib.load(infile)
+stadiums = get_stadiums(stadium_file)
+start_time = time.time()
+surface = compile_surface(clf, stadiums, step=step)
+print("\tEvaluated {} grids in {:.1f} secs".format(len(surface.tables), time.time() - start_time))
+
+# Report the error against the real model, worst grids first.
+errors = measure_surface_error(surface, clf, stadiums)
+for (stadium_name, team), error in sorted(errors.items(), key=lambda item: -item[1])[:10]:
+    print("\tMax error {:.5f}: {} ({})".format(error, stadium_name, team))
+print("\tMax error over all grids: {}".format(surface.max_error))
+
+# Write surface and report speed up for 100 kicks in one stadium.
+save_surface(surface, outfile)
+if len(surface.tables) > 0:
+    stadium_name, team = next(iter(surface.tables))
+    bounds = stadiums[stadium_name]["bounds"]
+    gp = get_opposing_goalpost(stadiums[stadium_name], team)
+    rng = np.random.default_rng(0)
+    x = rng.uniform(bounds["minX"], bounds["maxX"], size=100)
+    y = rng.uniform(bounds["minY"], bounds["maxY"], size=100)
+    start_time = time.time()
+    dist, angle = get_position_features(x, y, gp["mid"]["x"], gp["mid"]["y"])
+    clf.predict_proba(pd.DataFrame({"goal_distance": dist, "goal_angle": angle})[FEATURES_DEMO])
+    sklearn_secs = time.time() - start_time
+    start_time = time.time()
+    surface.predict(stadium_name, team, x, y)
+    surface_secs = time.time() - start_time
+    print("\tXG for 100 kicks: {:.2f} ms (sklearn) vs. {:.2f} ms (surface)".format(
+        1000 * sklearn_secs,
+        1000 * surface_secs
+    ))
+print("Wrote lookup surface ({:,} bytes, pickle is {:,} bytes) to file: {}".format(
+    os.path.getsize(outfile),
+    os.path.getsize(infile),
+    outfile
+))
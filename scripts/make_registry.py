@@ -0,0 +1,26 @@
+import sys
+sys.path.append("./")
+
+from haxml.registry import (
+    make_model_versions,
+    write_manifest
+)
+import server
+
+
+# Get command line arguments.
+outfile = sys.argv[1] if len(sys.argv) > 1 else server.MODEL_REGISTRY
+default_name = sys.argv[2] if len(sys.argv) > 2 else server.DEFAULT_MODEL
+
+# Hash each model file in the server's model configs and write the manifest.
+# The server swaps in any model whose hash changed on its next poll.
+models = make_model_versions(server.MODEL_CONFIGS)
+missing = [model.path for model in models if model.sha256 is None]
+if len(missing) > 0:
+    raise IOError("Missing model files: {}".format(", ".join(missing)))
+if default_name not in [model.name for model in models]:
+    raise KeyError("No model named: {}".format(default_name))
+write_manifest(models, default_name, outfile)
+for model in models:
+    print("{}: {}".format(model.key, model.path))
+print("Wrote manifest with default {} to: {}".format(default_name, outfile))
@@ -0,0 +1,13 @@
+import sys
+sys.path.append("./")
+
+import server
+
+
+# Score recent matches ahead of requests and write them to the XG store that
+# the server reads first. Models are configured in the .env file, see the
+# make_precompute_worker method in the server.
+worker = server.make_precompute_worker()
+print("Precomputing XG for models: {}".format(", ".join(worker.list_models())))
+print("Writing results to: {}".format(server.xg_store.path))
+worker.run_forever()
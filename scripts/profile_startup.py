@@ -0,0 +1,52 @@
+import sys
+sys.path.append("./")
+
+import subprocess
+
+
+# Get command line arguments.
+budget_secs = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+top_n = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+
+# Import the server and make the app in a fresh interpreter, with the startup
+# warm up done before returning so that it is included in the total.
+code = "import server; server.FAST_BOOT = False; server.create_app()"
+print("Profiling server startup...")
+proc = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", code],
+    capture_output=True,
+    text=True
+)
+if proc.returncode != 0:
+    print(proc.stderr)
+    raise RuntimeError("Server startup failed.")
+
+# Each line of the import time report is: self [us] | cumulative [us] | name,
+# where the name is indented by its depth in the import tree. Add up the self
+# time of every module by its root package, e.g. pandas.core.frame -> pandas.
+packages = {}
+for line in proc.stderr.split("\n"):
+    if not line.startswith("import time:") or "self [us]" in line:
+        continue
+    self_us, cumulative_us, name = line[len("import time:"):].split("|")
+    package = name.strip().split(".")[0]
+    packages[package] = packages.get(package, 0) + int(self_us) / 1e6
+import_secs = sum(packages.values())
+
+print("Import time by package (top {}):".format(top_n))
+for package, secs in sorted(packages.items(), key=lambda p: -p[1])[:top_n]:
+    print("\t{:<24} {:.3f} secs".format(package, secs))
+print("Total import time: {:.3f} secs".format(import_secs))
+
+# The server prints its own startup stages and time until ready.
+print("Server startup log:")
+for line in proc.stdout.strip().split("\n"):
+    print("\t{}".format(line))
+ready_lines = [line for line in proc.stdout.split("\n") if line.startswith("Ready in")]
+if len(ready_lines) == 0:
+    raise RuntimeError("Server did not report being ready.")
+ready_secs = float(ready_lines[-1].split()[2])
+if ready_secs > budget_secs:
+    print("Over budget: ready in {:.1f} secs, budget is {:.1f} secs.".format(ready_secs, budget_secs))
+    sys.exit(1)
+print("Within budget: ready in {:.1f} secs, budget is {:.1f} secs.".format(ready_secs, budget_secs))
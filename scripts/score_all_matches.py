@@ -0,0 +1,59 @@
+import sys
+sys.path.append("./")
+
+from haxml.bulk import (
+    BulkOutput,
+    score_all
+)
+from haxml.forest import (
+    load_classifier
+)
+from haxml.utils import (
+    get_matches_metadata
+)
+import os
+import server
+
+
+# Get command line arguments.
+if len(sys.argv) <= 1:
+    raise IOError("Missing parameter: infile")
+infile = sys.argv[1]
+if len(sys.argv) <= 2:
+    raise IOError("Missing parameter: model")
+model_name = sys.argv[2]
+if len(sys.argv) <= 3:
+    raise IOError("Missing parameter: outpath")
+outpath = sys.argv[3]
+n_jobs = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count()
+chunk_size = int(sys.argv[5]) if len(sys.argv) > 5 else 50
+
+# Score every match in the metadata file with the current version of the model
+# in the server's registry, reading matches from the server's match source
+# (match_source_dir in .env file, otherwise Firebase). Running again with the
+# same output path resumes, skipping matches that were already scored.
+model = server.get_model(model_name)
+metadata = get_matches_metadata(infile)
+output = BulkOutput(outpath, model.key)
+print("Scoring {:,} matches with {} in {} processes...".format(len(metadata), model.key, n_jobs))
+report = score_all(
+    [meta["match_id"] for meta in metadata],
+    model,
+    load_classifier,
+    server.get_match_packed,
+    server.get_stadium_dict(),
+    output,
+    n_jobs=n_jobs,
+    chunk_size=chunk_size
+)
+
+# Report throughput and any matches that could not be scored.
+print("Scored {:,} kicks in {:,} matches in {:.1f} secs: {:,.0f} kicks/sec".format(
+    report["kicks"], report["matches"], report["secs"], report["kicks_per_sec"]
+))
+print("Skipped {:,} matches scored in an earlier run.".format(report["skipped"]))
+if report["failed"] > 0:
+    print("Failed to score {:,} matches, run again to retry them:".format(report["failed"]))
+    for mid, message in report["errors"][:10]:
+        print("\t{}: {}".format(mid, message))
+print("Wrote XG to: {}".format(outpath))
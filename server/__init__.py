@@ -2,185 +2,426 @@
 Server to produce on-demand XG predictions.
 """
 
+import time
+BOOT_TIME = time.perf_counter()
+
 import sys
 sys.path.append("./")
 
 from decouple import config
-from flask import (
-    Flask,
-    jsonify,
-    request,
-    Response,
-    send_file
-)
-from flask_cors import CORS
-from haxml.prediction import (
-    generate_rows_demo,
-    predict_xg_demo,
-    generate_rows_edwin,
-    predict_xg_edwin,
-    generate_rows_lynn,
-    predict_xg_lynn_both,
-    predict_xg_lynn_weighted
+from haxml.metrics import (
+    Metrics,
+    format_server_timing
 )
-from haxml.utils import (
-    get_stadiums,
-    inflate_match
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    TimeoutError as FutureTimeoutError
 )
-from haxml.viz import (
-    plot_xg_time_series
+from concurrent.futures.process import (
+    BrokenProcessPool
 )
-import io
-import joblib
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+import multiprocessing
 import os
-import pyrebase
-import time
+import threading
+import traceback
 
 
-print("Connecting to database...")
-start_time = time.time()
-# Load Firebase credentials from .env file.
-firebase_config = {
-    "apiKey": config("firebase_apiKey"),
-    "authDomain": config("firebase_authDomain"),
-    "databaseURL": config("firebase_databaseURL"),
-    "projectId": config("firebase_projectId"),
-    "storageBucket": config("firebase_storageBucket"),
-    "messagingSenderId": config("firebase_messagingSenderId"),
-    "appId": config("firebase_appId")
-}
-# Open connection to Firebase.
-firebase = pyrebase.initialize_app(firebase_config)
-db = firebase.database()
-print("\tDone in {:.1f} secs".format(time.time() - start_time))
+# Latency instrumentation, disable with metrics_enabled=False in .env file.
+metrics = Metrics(enabled=config("metrics_enabled", default=True, cast=bool))
 
-# Initialize Flask app and enable CORS.
-app = Flask(__name__)
+# Time the heavy imports for the startup report. Importing this module has no
+# other side effects: the app is made by create_app, and the database, stadiums,
+# and models are loaded when first needed. Matplotlib and pyrebase are only
+# imported by the routes and methods that use them.
+with metrics.startup_span("import_flask"):
+    from flask import (
+        Blueprint,
+        Flask,
+        g,
+        jsonify,
+        request,
+        Response
+    )
+    from flask_cors import CORS
+with metrics.startup_span("import_haxml"):
+    from haxml.admission import (
+        BoundedExecutor,
+        Deadline,
+        Overloaded
+    )
+    from haxml.batching import (
+        MicroBatcher
+    )
+    from haxml.cache import (
+        LRUCache
+    )
+    from haxml.coalesce import (
+        SingleFlight
+    )
+    from haxml.cost import (
+        CostModel,
+        get_match_size
+    )
+    from haxml.forest import (
+        load_classifier
+    )
+    from haxml.live import (
+        LiveMatch,
+        LiveMatchCache
+    )
+    from haxml.precompute import (
+        PrecomputeWorker
+    )
+    from haxml.sources import (
+        DirectoryMatchSource,
+        FirebaseMatchSource
+    )
+    from haxml.serialize import (
+        MATCH_SECTIONS,
+        compact_match,
+        dumps
+    )
+    from haxml.shadow import (
+        ShadowWorker,
+        make_shadow_records
+    )
+    from haxml.store import (
+        XGStore
+    )
+    from haxml.surface import (
+        get_surface_path,
+        load_surface
+    )
+    from haxml.prediction import (
+        FEATURES_DEMO,
+        FEATURES_EDWIN,
+        FEATURES_LYNN_BOTH,
+        FEATURES_LYNN_WEIGHTED,
+        predict_xg_models
+    )
+    from haxml.registry import (
+        ModelRegistry,
+        get_artifact_sha256,
+        make_model_versions,
+        read_manifest
+    )
+    from haxml.utils import (
+        get_stadiums,
+        inflate_match
+    )
+    import numpy as np
+    import pandas as pd
+
+# Directory of packed match files to read instead of Firebase, if set.
+MATCH_SOURCE_DIR = config("match_source_dir", default="")
+# Whether to load the database, stadiums, and default model in a background
+# thread after the app is made, instead of before.
+FAST_BOOT = config("fast_boot", default=True, cast=bool)
+# Target for seconds from process start until the server is ready.
+STARTUP_BUDGET_SECS = config("startup_budget_secs", default=5.0, cast=float)
+# Origins allowed to make cross-origin requests.
 allow_list = [
     "http://localhost:2000",
     "https://vingkan.github.io"
 ]
-cors = CORS(app, resource={"/*": {"origins": allow_list}})
 
-print("Loading models...")
-start_time = time.time()
-# Define the models to load in production.
+# Define the models to serve in production, with generators named as in
+# haxml.registry.GENERATORS. Used when there is no model registry manifest.
+# Costs are prior latencies for the latency budget, see CostModel. Demo
+# features only look at each kick, while Edwin and Lynn features scan the
+# positions.
 DEFAULT_MODEL = "lynn_rf_weighted"
 MODEL_CONFIGS = [
     {
         "name": "demo_logit",
         "path": "models/demo_logistic_regression.pkl",
-        "generator": generate_rows_demo,
-        "predictor": predict_xg_demo
+        "generator": "demo",
+        "features": FEATURES_DEMO,
+        "costs": {"ms_per_kick": 0.05, "ms_per_scan": 0.0}
     },
     {
         "name": "demo_tree",
         "path": "models/demo_DecisionTree.pkl",
-        "generator": generate_rows_demo,
-        "predictor": predict_xg_demo
+        "generator": "demo",
+        "features": FEATURES_DEMO,
+        "costs": {"ms_per_kick": 0.05, "ms_per_scan": 0.0}
     },
     {
         "name": "demo_knn5",
         "path": "models/demo_knn5.pkl",
-        "generator": generate_rows_demo,
-        "predictor": predict_xg_demo
+        "generator": "demo",
+        "features": FEATURES_DEMO,
+        "costs": {"ms_per_kick": 0.05, "ms_per_scan": 0.0}
     },
     {
         "name": "edwin_classic_rf_12",
         "path": "models/edwin_classic_random_forest_max_depth_12.pkl",
-        "generator": generate_rows_edwin,
-        "predictor": predict_xg_edwin
+        "generator": "edwin",
+        "features": FEATURES_EDWIN,
+        "costs": {"ms_per_kick": 0.2, "ms_per_scan": 0.0004}
     },
     {
         "name": "edwin_classic_rf_8",
         "path": "models/edwin_classic_random_forest_max_depth_8.pkl",
-        "generator": generate_rows_edwin,
-        "predictor": predict_xg_edwin
+        "generator": "edwin",
+        "features": FEATURES_EDWIN,
+        "costs": {"ms_per_kick": 0.2, "ms_per_scan": 0.0004}
     },
     {
         "name": "edwin_rf_12",
         "path": "models/edwin_random_forest_max_depth_12.pkl",
-        "generator": generate_rows_edwin,
-        "predictor": predict_xg_edwin
+        "generator": "edwin",
+        "features": FEATURES_EDWIN,
+        "costs": {"ms_per_kick": 0.2, "ms_per_scan": 0.0004}
     },
     {
         "name": "edwin_rf_8",
         "path": "models/edwin_random_forest_max_depth_8.pkl",
-        "generator": generate_rows_edwin,
-        "predictor": predict_xg_edwin
+        "generator": "edwin",
+        "features": FEATURES_EDWIN,
+        "costs": {"ms_per_kick": 0.2, "ms_per_scan": 0.0004}
     },
     {
         "name": "lynn_rf_weighted",
         "path": "models/lynn_random_forest_max_depth_15_only_weighted_dist.pkl",
-        "generator": generate_rows_lynn,
-        "predictor": predict_xg_lynn_weighted
+        "generator": "lynn",
+        "features": FEATURES_LYNN_WEIGHTED,
+        "costs": {"ms_per_kick": 0.3, "ms_per_scan": 0.0005}
     },
     {
         "name": "lynn_rf_both",
         "path": "models/lynn_random_forest_max_depth_15_both_def_dist.pkl",
-        "generator": generate_rows_lynn,
-        "predictor": predict_xg_lynn_both
+        "generator": "lynn",
+        "features": FEATURES_LYNN_BOTH,
+        "costs": {"ms_per_kick": 0.3, "ms_per_scan": 0.0005}
     }
 ]
-# Dict of production models, key: model name, value: tuple (clf, generator_fn, predictor_fn, path).
-# Changed to just load the defualt model
-production_models = {}
-for model_config in MODEL_CONFIGS:
-    print("Putting in dictionary: " + model_config["name"])
-    gen = model_config["generator"]
-    pred = model_config["predictor"]
-    path = model_config["path"]
-    if model_config["name"] == DEFAULT_MODEL:
-        print("Loading: " + model_config["name"])
-        clf = joblib.load(path)
-        production_models[model_config["name"]] = (clf, gen, pred, path)
-    else:
-        production_models[model_config["name"]] = (None, gen, pred, path)
-print("\tDone in {:.1f} secs".format(time.time() - start_time))
+# Cheaper models to try in order when a model would miss a request's latency
+# budget. Models without fallbacks are used regardless of the budget.
+MODEL_FALLBACKS = {
+    "lynn_rf_weighted": ["edwin_rf_8", "demo_logit"],
+    "lynn_rf_both": ["edwin_rf_8", "demo_logit"],
+    "edwin_classic_rf_12": ["edwin_classic_rf_8", "demo_logit"],
+    "edwin_classic_rf_8": ["demo_logit"],
+    "edwin_rf_12": ["edwin_rf_8", "demo_logit"],
+    "edwin_rf_8": ["demo_logit"]
+}
+# Manifest of model versions, see scripts/make_registry.py. If it exists, it
+# replaces MODEL_CONFIGS, and the server swaps in new versions when it changes.
+MODEL_REGISTRY = config("model_registry", default="models/registry.json")
+REGISTRY_POLL_SECS = config("registry_poll_secs", default=10.0, cast=float)
+# Registry of production models, made on first use, see get_registry.
+# Models are loaded when first needed, the default model is loaded on startup.
+registry = None
+registry_watcher = None
+# Held while the registry is made, which hashes the model files, so only
+# requests that need a model wait for it.
+registry_lock = threading.Lock()
+cost_model = CostModel(MODEL_CONFIGS)
+# Milliseconds to wait for concurrent predictions to batch with, or 0 to
+# predict each request on its own. See MicroBatcher.
+BATCH_WINDOW_MS = config("batch_window_ms", default=0.0, cast=float)
+BATCH_MAX_ROWS = config("batch_max_rows", default=1000, cast=int)
+# Batchers and lookup surfaces of loaded models, key: model key (name@version).
+batchers = {}
+surfaces = {}
+surface_lock = threading.Lock()
+# Surfaces with a larger max error than this are not used, see get_surface.
+SURFACE_MAX_ERROR = config("surface_max_error", default=0.01, cast=float)
 
-#Load the called model function
 
-def load_model(name):
-    print("Loading: " + name)
-    clf, gen, pred, path = production_models[name]
-    if clf is None:
-        clf = joblib.load(path)
-    production_models[name] = (clf,gen, pred,path)
+def load_model(model):
+    """
+    Loads the classifier of a model version, checking the model file against
+    its hash. Called by the registry, use get_classifier instead.
+    """
+    print("Loading: " + model.key)
+    with metrics.span("load", model.name):
+        if model.sha256 is not None and get_artifact_sha256(model.path) != model.sha256:
+            raise ValueError("Model file does not match its hash: {}".format(model.path))
+        clf = load_classifier(model.path)
+    if BATCH_WINDOW_MS > 0:
+        clf = MicroBatcher(clf, window_ms=BATCH_WINDOW_MS, max_rows=BATCH_MAX_ROWS)
+        batchers[model.key] = clf
     return clf
 
-# Load stadium data.
-print("Loading stadiums...")
-start_time = time.time()
-stadiums = get_stadiums("data/stadiums.json")
-print("\tDone in {:.1f} secs".format(time.time() - start_time))
+
+def unload_model(model):
+    """
+    Drops the batcher and lookup surface of a model version that the registry
+    swapped out or removed. Called by the registry.
+    """
+    with surface_lock:
+        surfaces.pop(model.key, None)
+        batchers.pop(model.key, None)
+
+
+# Lazily loaded match source and stadium data, see get_match_source and
+# get_stadium_dict.
+match_source = None
+stadiums = None
+resource_lock = threading.Lock()
+# Set when the startup warm up has loaded the database, stadiums, and default model.
+ready_event = threading.Event()
+startup_report = {}
+
+
+def connect_match_source():
+    """
+    Opens the match source: a local directory if match_source_dir is set in
+    .env file, otherwise Firebase.
+    """
+    if MATCH_SOURCE_DIR:
+        return DirectoryMatchSource(MATCH_SOURCE_DIR)
+    import pyrebase
+    # Load Firebase credentials from .env file.
+    firebase_config = {
+        "apiKey": config("firebase_apiKey"),
+        "authDomain": config("firebase_authDomain"),
+        "databaseURL": config("firebase_databaseURL"),
+        "projectId": config("firebase_projectId"),
+        "storageBucket": config("firebase_storageBucket"),
+        "messagingSenderId": config("firebase_messagingSenderId"),
+        "appId": config("firebase_appId")
+    }
+    # Open connection to Firebase.
+    firebase = pyrebase.initialize_app(firebase_config)
+    db = firebase.database()
+    return FirebaseMatchSource(db)
+
+
+def get_match_source():
+    """
+    Gets the match source, connecting to it on first use.
+    """
+    global match_source
+    with resource_lock:
+        if match_source is None:
+            match_source = connect_match_source()
+    return match_source
+
+
+def get_registry():
+    """
+    Gets the model registry, reading the manifest (or MODEL_CONFIGS if there
+    is no manifest) on first use.
+    """
+    global registry
+    if registry is not None:
+        return registry
+    with registry_lock:
+        if registry is None:
+            if os.path.exists(MODEL_REGISTRY):
+                models, default_name = read_manifest(MODEL_REGISTRY)
+                new_registry = ModelRegistry(models, default_name, load_model, unload=unload_model)
+                new_registry.manifest_mtime = os.path.getmtime(MODEL_REGISTRY)
+            else:
+                models = make_model_versions(MODEL_CONFIGS)
+                new_registry = ModelRegistry(models, DEFAULT_MODEL, load_model, unload=unload_model)
+            registry = new_registry
+    return registry
+
+
+def warm_model(model):
+    """
+    Loads a model version and runs one prediction, so that the first request
+    to use it does not pay for loading.
+    """
+    clf = get_registry().load(model)
+    get_surface(model)
+    X = pd.DataFrame([[0.0] * len(model.features)], columns=model.features)
+    clf.predict_proba(X)
+
+
+def get_stadium_dict():
+    """
+    Gets the dict of stadium data, reading it on first use.
+    """
+    global stadiums
+    with resource_lock:
+        if stadiums is None:
+            stadiums = get_stadiums("data/stadiums.json")
+    return stadiums
+
+
+# Limits for live XG streams and long polls.
+LIVE_MAX_STREAMS = config("live_max_streams", default=4, cast=int)
+LIVE_MAX_MATCHES = config("live_max_matches", default=50, cast=int)
+LIVE_POLL_SECS = config("live_poll_secs", default=5.0, cast=float)
+LIVE_MAX_STREAM_SECS = config("live_max_stream_secs", default=600.0, cast=float)
+LIVE_MAX_WAIT_SECS = 25.0
+# Bounded per-match state for live XG, key: tuple (mid, model key).
+live_matches = LiveMatchCache(max_size=LIVE_MAX_MATCHES)
+# Each open stream or long poll holds one slot.
+live_slots = threading.BoundedSemaphore(LIVE_MAX_STREAMS)
+
+
+# Limits for rendering XG time plots.
+PLOT_WORKERS = config("plot_workers", default=2, cast=int)
+PLOT_MAX_PENDING = config("plot_max_pending", default=8, cast=int)
+PLOT_TIMEOUT_SECS = config("plot_timeout_secs", default=20.0, cast=float)
+PLOT_MIN_PIXELS = 200
+PLOT_MAX_PIXELS = 2000
+# Rendered plots, key: tuple (mid, model key, width, height, format).
+plot_cache = LRUCache(
+    max_size=config("plot_cache_size", default=100, cast=int),
+    ttl_secs=config("plot_cache_secs", default=60.0, cast=float)
+)
+# Each plot being computed or rendered holds one slot.
+plot_slots = threading.BoundedSemaphore(PLOT_MAX_PENDING)
+# Process pool for rendering PNGs, made on first use, see get_plot_pool.
+plot_pool = None
+# Figures are reused between renders, so renders in this process take turns.
+render_lock = threading.Lock()
+
+
+# Limits for scoring matches (inflate, features, and predict) in requests.
+SCORE_WORKERS = config("score_workers", default=2, cast=int)
+SCORE_MAX_QUEUE = config("score_max_queue", default=8, cast=int)
+# Kept below the 30 second Heroku router timeout.
+REQUEST_DEADLINE_SECS = config("request_deadline_secs", default=25.0, cast=float)
+score_executor = BoundedExecutor(n_workers=SCORE_WORKERS, max_queue=SCORE_MAX_QUEUE)
+
+# Concurrent requests for the same match and model share one computation.
+score_flight = SingleFlight()
+COALESCE_TIMEOUT_SECS = config("coalesce_timeout_secs", default=30.0, cast=float)
+
+# Candidate model to score in the background on the same kicks as the baseline
+# model (the default model if not set), or empty to turn shadow mode off.
+SHADOW_MODEL = config("shadow_model", default="")
+SHADOW_BASELINE = config("shadow_baseline", default="")
+SHADOW_LOG = config("shadow_log", default="data/shadow/shadow.jsonl")
+SHADOW_MAX_QUEUE = config("shadow_max_queue", default=20, cast=int)
+# Shadow worker, made by create_app if shadow mode is on, see submit_shadow.
+shadow_worker = None
+
+# Precomputed XG results, read before computing XG in a request.
+xg_store = XGStore(config("xg_store_dir", default="data/xg_store"))
 
 
 def get_match_packed(mid):
     """
-    Fetch packed match data from Firebase.
+    Fetch packed match data from the match source (Firebase by default).
     """
-    r = db.child("match/{}".format(mid)).get()
-    packed = r.val()
-    if packed is None:
-        raise ValueError("Match data not found for: {}".format(mid))
-    return packed
+    return get_match_source().get_packed(mid)
 
 
 def get_stadium_data(stadium_name):
     """
     Checks if stadium data is available.
     """
-    if stadium_name not in stadiums:
+    stadium_dict = get_stadium_dict()
+    if stadium_name not in stadium_dict:
         raise ValueError("No stadium data for: {}".format(stadium_name))
-    return stadiums[stadium_name]
+    return stadium_dict[stadium_name]
 
 
 def get_match_and_stadium(mid):
     """
     Helper method to get packed match data and stadium.
     """
-    packed = get_match_packed(mid)
+    with metrics.span("fetch"):
+        packed = get_match_packed(mid)
     stadium = get_stadium_data(packed["stadium"])
     return packed, stadium
 
@@ -190,26 +431,535 @@ def get_model_name(request):
     Helper method to get model name from request args.
     """
     model_name = request.args.get("clf")
-    return model_name if model_name is not None else DEFAULT_MODEL
+    return model_name if model_name is not None else get_registry().default_name
+
+
+def get_model(model_name):
+    """
+    Gets the current version of the model with the given name. Requests look
+    up each model once and pass the version along, so a model swapped in
+    during a request does not mix versions.
+    Raises KeyError if there is no model with the name.
+    Returns:
+        ModelVersion.
+    """
+    return get_registry().get(model_name)
+
+
+def get_classifier(model):
+    """
+    Gets the classifier of a model version, loading it on first use.
+    """
+    return get_registry().load(model)
+
+
+def get_surface(model):
+    """
+    Gets the lookup surface of a model that only uses FEATURES_DEMO, loading
+    it on first use. See scripts/compile_surface.py.
+    Args:
+        model: Model version (ModelVersion).
+    Returns:
+        XGSurface, or None if the model has no surface or its max error is
+        above surface_max_error.
+    """
+    with surface_lock:
+        if model.key not in surfaces:
+            surface_path = get_surface_path(model.path)
+            surface = None
+            if model.features == FEATURES_DEMO and os.path.exists(surface_path):
+                with metrics.span("load", model.name):
+                    surface = load_surface(surface_path)
+                if surface.max_error is None or surface.max_error > SURFACE_MAX_ERROR:
+                    print("Not using surface for {} with max error: {}".format(model.key, surface.max_error))
+                    surface = None
+            surfaces[model.key] = surface
+        return surfaces[model.key]
+
+
+def get_stored_result(mid, model):
+    """
+    Reads the precomputed result for the match and model version, if any.
+    """
+    with metrics.span("store"):
+        result = xg_store.read(mid, model.key)
+    metrics.increment("store_hits" if result is not None else "store_misses")
+    return result
+
+
+def score_match(mid, packed, stadium, model, deadline=None, stored=None):
+    """
+    Inflates the match and predicts XG for each kick, timing each stage.
+    Uses the precomputed XG from the store if it covers every kick, or the
+    model's lookup surface if it has one for the stadium.
+    Args:
+        mid: Match ID (str).
+        packed: Packed match data (dict).
+        stadium: Stadium data (dict).
+        model: Model version (ModelVersion).
+        deadline: Deadline checked between stages, if any.
+        stored: Result for the match and model read from the store, if any
+            (via get_stored_result).
+    Returns:
+        Tuple (match, xg) of inflated match data (dict) and XG for each kick,
+        in the same order as the match kick list (NumPy array).
+    """
+    surface = get_surface(model)
+    start = time.perf_counter()
+    with metrics.span("inflate"):
+        match = inflate_match(packed)
+    if stored is not None and stored["n_kicks"] == len(match["kicks"]):
+        return match, np.array(stored["xg"], dtype=float)
+    if surface is not None and surface.has_stadium(match["stadium"]):
+        with metrics.span("lookup", model.name):
+            xg = surface.predict_match(match)
+        ms = 1000 * (time.perf_counter() - start)
+        cost_model.observe(model, len(match["kicks"]), len(match["positions"]), ms)
+        return match, xg
+    clf = get_classifier(model)
+    if deadline is not None:
+        deadline.check("features")
+    with metrics.span("features", model.name):
+        d_kicks = pd.DataFrame(model.generate_rows(match, stadium))
+    xg = np.full(len(match["kicks"]), np.nan)
+    if len(d_kicks) == 0:
+        return match, xg
+    if deadline is not None:
+        deadline.check("predict")
+    with metrics.span("predict", model.name):
+        xg[d_kicks["index"].values] = clf.predict_proba(d_kicks[model.features])[:,1]
+    ms = 1000 * (time.perf_counter() - start)
+    cost_model.observe(model, len(match["kicks"]), len(match["positions"]), ms)
+    submit_shadow(mid, match, stadium, model, d_kicks, xg)
+    return match, xg
+
 
+def submit_shadow(mid, match, stadium, model, d_kicks, xg):
+    """
+    Queues the kicks of a match scored with the shadow baseline model to be
+    scored with the candidate model in the background. Work is dropped when
+    the shadow queue is full or requests are waiting for the score executor.
+    Args:
+        mid: Match ID (str).
+        match: Inflated match data (dict).
+        stadium: Stadium data (dict).
+        model: Model version the match was scored with (ModelVersion).
+        d_kicks: Feature rows of the kicks (DataFrame).
+        xg: XG for each kick (NumPy array).
+    """
+    if shadow_worker is None:
+        return
+    if model.name != (SHADOW_BASELINE or get_registry().default_name):
+        return
+    if score_executor.get_stats()["waiting"] > 0:
+        shadow_worker.drop()
+        return
+    shadow_worker.submit({
+        "mid": mid,
+        "match": match,
+        "stadium": stadium,
+        "model": model,
+        "rows": d_kicks,
+        "xg": xg
+    })
+
+
+def score_shadow(task):
+    """
+    Scores a shadow task with the current version of the candidate model,
+    reusing the baseline's feature rows if both models use the same generator.
+    Returns:
+        Paired predictions for each kick to log (list of dicts).
+    """
+    candidate = get_model(SHADOW_MODEL)
+    rows = task["rows"]
+    if candidate.generator != task["model"].generator:
+        with metrics.span("shadow_features", candidate.name):
+            rows = pd.DataFrame(candidate.generate_rows(task["match"], task["stadium"]))
+    if len(rows) == 0:
+        return []
+    clf = get_classifier(candidate)
+    with metrics.span("shadow_predict", candidate.name):
+        candidate_xg = clf.predict_proba(rows[candidate.features])[:,1]
+    baseline_xg = task["xg"][rows["index"].values]
+    return make_shadow_records(task["mid"], rows, task["model"].key, baseline_xg, candidate.key, candidate_xg)
+
+
+def run_scoring(fn, deadline):
+    """
+    Runs CPU-heavy scoring work on the bounded score executor, keeping its
+    spans in the request trace.
+    Args:
+        fn: function(deadline) that does the work.
+        deadline: Deadline for the work.
+    Raises Overloaded if the executor queue is full, or DeadlineExceeded.
+    """
+    trace = metrics.get_trace()
+    submitted = time.perf_counter()
+
+    def task(deadline):
+        metrics.set_trace(trace)
+        try:
+            metrics.record_span("queue", 1000 * (time.perf_counter() - submitted))
+            return fn(deadline)
+        finally:
+            metrics.set_trace(None)
+    try:
+        return score_executor.run(task, deadline)
+    except Overloaded:
+        metrics.increment("score_rejected")
+        raise
+
+
+def get_request_deadline():
+    """
+    Gets the deadline of the current request.
+    """
+    return g.deadline
+
+
+def get_budget_ms(request):
+    """
+    Helper method to get the latency budget in milliseconds from request args.
+    Raises ValueError if the budget is not a number.
+    Returns:
+        Budget (float), or None if there is no budget.
+    """
+    budget_ms = request.args.get("budget_ms")
+    if budget_ms is None:
+        return None
+    try:
+        return float(budget_ms)
+    except ValueError:
+        raise ValueError("Invalid budget_ms: {}".format(budget_ms))
+
+
+def choose_model(mid, packed, model, budget):
+    """
+    Picks the model to score the match with in the latency budget: the
+    requested model if its estimated cost fits in the time left, otherwise the
+    first of its MODEL_FALLBACKS that fits, otherwise the cheapest fallback.
+    Models with a stored result for the match fit any budget.
+    Args:
+        mid: Match ID (str).
+        packed: Packed match data (dict).
+        model: Requested model version (ModelVersion).
+        budget: Deadline for the latency budget, or None for no budget.
+    Returns:
+        Model version to use (ModelVersion).
+    """
+    if budget is None or budget.remaining() is None:
+        return model
+    remaining_ms = 1000 * budget.remaining()
+    n_kicks, n_positions = get_match_size(packed)
+    candidates = [model]
+    for fallback_name in MODEL_FALLBACKS.get(model.name, []):
+        try:
+            candidates.append(get_model(fallback_name))
+        except KeyError:
+            continue
+    for candidate in candidates:
+        if xg_store.has(mid, candidate.key):
+            return candidate
+        cost_ms = cost_model.estimate(candidate, n_kicks, n_positions)
+        if cost_ms <= remaining_ms:
+            return candidate
+    return candidates[-1]
+
+
+def get_match_xg(mid, model, deadline=None, budget_ms=None, stored=None, read_store=True):
+    """
+    Fetches and scores the match, or waits for the thread already doing so for
+    the same match, model, and budget. The result may be shared with other
+    threads, so callers should only add the same XG to it.
+    With a deadline, scoring runs on the bounded score executor, as for
+    requests. Without one, it runs in this thread, as for background work.
+    With a latency budget, a cheaper model may be used, see choose_model.
+    Raises ValueError or KeyError like get_match_and_stadium and score_match,
+    Overloaded if the score executor is full, or TimeoutError if the shared
+    computation took too long or missed the deadline.
+    Args:
+        mid: Match ID (str).
+        model: Requested model version (ModelVersion).
+        deadline: Deadline of the request, if any.
+        budget_ms: Latency budget in milliseconds, if any (float).
+        stored: Result for the match and model already read from the store,
+            if any.
+        read_store: Whether to read the store for the model, False if the
+            caller already did and passed what it read as stored (bool).
+            Fallback models are always read.
+    Returns:
+        Tuple (match, xg, model_used) of the results from score_match and the
+        model version that scored the match.
+    """
+    budget = Deadline(budget_ms / 1000) if budget_ms is not None else None
+
+    def compute():
+        packed, stadium = get_match_and_stadium(mid)
+        model_used = choose_model(mid, packed, model, budget)
+        if model_used is not model:
+            metrics.increment("fallbacks")
+        result = stored
+        if read_store or model_used is not model:
+            result = get_stored_result(mid, model_used)
+        if deadline is None:
+            match, xg = score_match(mid, packed, stadium, model_used, stored=result)
+        else:
+            match, xg = run_scoring(
+                lambda deadline: score_match(mid, packed, stadium, model_used, deadline, stored=result),
+                deadline
+            )
+        return match, xg, model_used
+    timeout = COALESCE_TIMEOUT_SECS
+    if deadline is not None and deadline.remaining() is not None:
+        timeout = min(timeout, deadline.remaining())
+    with metrics.span("coalesce"):
+        (match, xg, model_used), shared = score_flight.do(
+            (mid, model.key, budget_ms),
+            compute,
+            timeout=timeout
+        )
+    if shared:
+        metrics.increment("coalesced")
+    return match, xg, model_used
+
+
+def precompute_result(mid, model_key):
+    """
+    Scores a match with a model for the precompute worker.
+    Raises ValueError if the model version was swapped out since the task was
+    queued, so the stale task fails and the next poll queues the new version.
+    Returns:
+        Result to store (dict) with "n_kicks", "xg", and the compact "match"
+        payload returned by /xg.
+    """
+    model = get_model(model_key.split("@")[0])
+    if model.key != model_key:
+        raise ValueError("Model version changed: {} is now {}".format(model_key, model.key))
+    match, xg, model_used = get_match_xg(mid, model)
+    return make_store_result(match, xg, compact_match(match, xg))
 
-def get_model_by_name(model_name=DEFAULT_MODEL):
+
+def make_store_result(match, xg, payload):
     """
-    Gets the classifier and generator function based on the given name.
+    Makes the result to store for a match, see XGStore.
     Args:
-        model_name: Name of the model in MODEL_CONFIGS (str).
+        match: Inflated match data (dict).
+        xg: XG for each kick (NumPy array).
+        payload: Compact match payload returned by /xg (dict).
+    Returns:
+        Result (dict) with "n_kicks", "xg", and the compact "match" payload.
+    """
+    return {
+        "n_kicks": len(match["kicks"]),
+        "xg": xg,
+        "match": payload
+    }
+
+
+def add_xg_to_kicks(match, xg):
+    """
+    Adds "xg" field to each kick of the inflated match data.
+    """
+    for kick, p in zip(match["kicks"], xg.tolist()):
+        kick["xg"] = p
+    return match
+
+
+def get_response_sections(request):
+    """
+    Helper method to get the match sections to include in a compact response,
+    from the comma-separated fields request arg.
+    Raises ValueError if a section is not in MATCH_SECTIONS.
+    """
+    fields = request.args.get("fields")
+    if fields is None:
+        return []
+    sections = [field for field in fields.split(",") if len(field) > 0]
+    for section in sections:
+        if section not in MATCH_SECTIONS:
+            raise ValueError("Unknown match section: {}".format(section))
+    return sections
+
+
+def is_full_response(request):
+    """
+    Helper method to check if the request opts in to the full match payload.
+    """
+    return request.args.get("full", "false").lower() == "true"
+
+
+def to_json_response(res):
+    """
+    Serializes a response dict to JSON, timing the serialization.
+    """
+    with metrics.span("serialize"):
+        return Response(dumps(res), mimetype="application/json")
+
+
+def get_live_match(mid, model, packed, stadium):
+    """
+    Gets the live XG state for a match and model version, and updates it with
+    the latest packed match data.
+    """
+    clf = get_classifier(model)
+    make_state = lambda: LiveMatch(stadium, model.generate_rows, model.features, clf)
+    state = live_matches.get((mid, model.key), make_state)
+    with metrics.span("live", model.name):
+        state.update(packed)
+    return state
+
+
+def get_live_start(request):
+    """
+    Helper method to get the index of the first kick the client has not seen,
+    from the after arg or the Last-Event-ID header of a reconnecting stream.
+    """
+    after = request.args.get("after", request.headers.get("Last-Event-ID"))
+    try:
+        return max(0, int(after)) if after is not None else 0
+    except ValueError:
+        return 0
+
+
+def overloaded_response(message, retry_secs):
+    """
+    Response with status 503 for when the server is too busy for a request.
+    """
+    res = jsonify({
+        "success": False,
+        "message": message
+    })
+    res.status_code = 503
+    res.headers["Retry-After"] = str(max(1, int(retry_secs)))
+    return res
+
+
+def live_overloaded_response():
+    """
+    Response for when all live stream slots are taken.
+    """
+    return overloaded_response("Too many live streams, try again later.", LIVE_POLL_SECS)
+
+
+def get_plot_pool():
+    """
+    Gets the process pool for rendering plots, starting it on first use.
+    Workers are spawned rather than forked, since the server runs threads.
+    Returns None if plot_workers is 0, to render in the request thread.
+    """
+    global plot_pool
+    with resource_lock:
+        if plot_pool is None and PLOT_WORKERS > 0:
+            context = multiprocessing.get_context("spawn")
+            plot_pool = ProcessPoolExecutor(max_workers=PLOT_WORKERS, mp_context=context)
+    return plot_pool
+
+
+def replace_plot_pool(pool):
+    """
+    Replaces a broken plot pool, e.g. after a worker crashed, so the next
+    render starts a new pool. Does nothing if the pool was already replaced.
+    """
+    global plot_pool
+    with resource_lock:
+        if plot_pool is not pool:
+            return
+        plot_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+    metrics.increment("plot_pool_restarts")
+
+
+def get_plot_size(request):
+    """
+    Helper method to get plot width and height in pixels from request args.
+    """
+    def get_pixels(name, default):
+        try:
+            pixels = int(request.args.get(name, default))
+        except ValueError:
+            pixels = default
+        return min(max(pixels, PLOT_MIN_PIXELS), PLOT_MAX_PIXELS)
+    return get_pixels("width", 1000), get_pixels("height", 600)
+
+
+def get_plot_data(mid, model):
+    """
+    Scores the match and gets the data for its XG time plot.
     Returns:
-        Tuple (clf, generator_fn, predictor_fn).
+        Tuple (xg_time_ser, title).
+    """
+    from haxml.viz import get_xg_time_plot_title, get_xg_time_series
+    match, xg, model_used = get_match_xg(mid, model, get_request_deadline())
+    match_xg = add_xg_to_kicks(match, xg)
+    # Add model name to a line in the chart title.
+    title = "{}\nXG Model: {}".format(get_xg_time_plot_title(match_xg), model_used.name)
+    return get_xg_time_series(match_xg), title
+
+
+def render_png(xg_time_ser, title, width, height):
+    """
+    Renders the XG time plot as PNG in the process pool, or in this thread if
+    there is no pool. If a worker crashed, the pool is replaced and Overloaded
+    is raised, so the client retries on the new pool.
+    """
+    from haxml.viz import render_xg_time_plot
+    pool = get_plot_pool()
+    args = (xg_time_ser, title, width, height)
+    if pool is None:
+        with render_lock:
+            return render_xg_time_plot(*args)
+    try:
+        return pool.submit(render_xg_time_plot, *args).result(timeout=PLOT_TIMEOUT_SECS)
+    except BrokenProcessPool:
+        replace_plot_pool(pool)
+        raise Overloaded("Plot renderer restarted, try again later.")
+
+
+# Routes are registered on the app made by create_app.
+routes = Blueprint("xg", __name__)
+
+
+@routes.before_app_request
+def start_request_trace():
+    metrics.start_trace()
+
+
+@routes.before_app_request
+def start_request_deadline():
+    g.deadline = Deadline(REQUEST_DEADLINE_SECS)
+
+
+@routes.after_app_request
+def end_request_trace(response):
+    """
+    Records request latency and payload size, and reports the timed stages in
+    the Server-Timing header.
+    """
+    route = request.url_rule.rule if request.url_rule else "unknown"
+    size = None if response.is_streamed else response.calculate_content_length()
+    trace = metrics.end_trace(route, response.status_code, size)
+    if len(trace) > 0:
+        response.headers["Server-Timing"] = format_server_timing(trace)
+    return response
+
+
+def get_model_names(request):
+    """
+    Helper method to get a list of model names from request args.
+    Model names are comma-separated, defaults to all models whose files exist,
+    or the default model if none do.
     """
-    if model_name not in production_models:
-        raise KeyError("No model named: {}".format(model_name))
-    clf, gen, pred, path = production_models[model_name]
-    if clf is None:
-        clf = load_model(model_name)
-    return clf, gen, pred
-    
+    model_names = request.args.get("clf")
+    if model_names is None:
+        registry = get_registry()
+        models = [registry.get(name) for name in registry.names()]
+        names = [model.name for model in models if os.path.exists(model.path)]
+        return names if len(names) > 0 else [registry.default_name]
+    return [name for name in model_names.split(",") if len(name) > 0]
 
-@app.route("/hello")
+
+@routes.route("/hello")
 def hello():
     """
     Basic hello world route to check if server is running.
@@ -217,10 +967,90 @@ def hello():
     return "Welcome to HaxML."
 
 
-@app.route("/xg/<mid>")
+@routes.route("/xg/<mid>")
 def get_xg(mid):
     """
     Fetch the match data for a given ID and then augment it with expected goals.
+    By default, returns XG and kick fields as column arrays, with any match
+    sections listed in the fields arg. Set full=true to get the whole inflated
+    match with XG added to each kick.
+    With a budget_ms arg, falls back to a cheaper model if the requested one
+    would take longer, and model_name in the response is the model used.
+    """
+    model_name = get_model_name(request)
+    try:
+        model = get_model(model_name)
+        budget_ms = get_budget_ms(request)
+        sections = get_response_sections(request)
+    except (ValueError, KeyError) as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        })
+    is_compact = not is_full_response(request) and len(sections) == 0
+    is_stale = False
+    stored = None
+    if is_compact:
+        # Return the precomputed payload without fetching or scoring the
+        # match, if it covers every kick, which only needs the kick count. A
+        # match stored while it was still being played has fewer kicks, so it
+        # is scored again and replaced.
+        stored = get_stored_result(mid, model)
+        if stored is not None:
+            with metrics.span("count"):
+                n_kicks = get_match_source().count_kicks(mid)
+            if stored["n_kicks"] == n_kicks:
+                return to_json_response({
+                    "success": True,
+                    "mid": mid,
+                    "model_name": model.name,
+                    "model_version": model.version,
+                    "requested_model_name": model_name,
+                    "match": stored["match"]
+                })
+            metrics.increment("store_stale")
+            is_stale = True
+    try:
+        match, xg, model_used = get_match_xg(
+            mid,
+            model,
+            get_request_deadline(),
+            budget_ms,
+            stored=stored,
+            read_store=not is_compact
+        )
+    except (ValueError, KeyError) as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        })
+    except Overloaded as e:
+        return overloaded_response(str(e), 1)
+    except TimeoutError:
+        return overloaded_response("Match took too long to score.", 1)
+    res = {
+        "success": True,
+        "mid": mid,
+        "model_name": model_used.name,
+        "model_version": model_used.version,
+        "requested_model_name": model_name
+    }
+    if is_full_response(request):
+        # Return inflated match data with XG as JSON.
+        res["match"] = add_xg_to_kicks(match, xg)
+    else:
+        res["match"] = compact_match(match, xg, sections)
+        if is_stale and model_used.key == model.key:
+            xg_store.write(mid, model.key, make_store_result(match, xg, res["match"]))
+    return to_json_response(res)
+
+
+@routes.route("/xgmodels/<mid>")
+def get_xg_models(mid):
+    """
+    Fetch the match data for a given ID and compute XG with several models,
+    generating features once for all models that share a generator. Models
+    that fail to load are skipped and listed under model_errors.
     """
     try:
         packed, stadium = get_match_and_stadium(mid)
@@ -229,57 +1059,367 @@ def get_xg(mid):
             "success": False,
             "message": str(e)
         })
-    model_name = get_model_name(request)
+    model_names = get_model_names(request)
+    models = []
+    model_versions = {}
+    model_errors = {}
     try:
-        clf, gen, pred = get_model_by_name(model_name)
+        for model_name in model_names:
+            model = get_model(model_name)
+            try:
+                clf = get_classifier(model)
+            except Exception as e:
+                traceback.print_exc()
+                model_errors[model_name] = "{}: {}".format(type(e).__name__, e)
+                continue
+            models.append((model_name, clf, model.generate_rows, model.features))
+            model_versions[model_name] = model.version
     except KeyError as e:
         return jsonify({
             "success": False,
             "message": str(e)
         })
-    match_xg = pred(inflate_match(packed), stadium, gen, clf)
-    # Return inflated match data with XG as JSON.
+    if len(models) == 0:
+        return jsonify({
+            "success": False,
+            "message": "No models could be loaded.",
+            "model_errors": model_errors
+        })
+    model_names = [name for name in model_names if name not in model_errors]
+    def score_models(deadline):
+        with metrics.span("inflate"):
+            match = inflate_match(packed)
+        deadline.check("models")
+        with metrics.span("models"):
+            return match, predict_xg_models(match, stadium, models)
+    try:
+        match, xg_by_model = run_scoring(score_models, get_request_deadline())
+    except Overloaded as e:
+        return overloaded_response(str(e), 1)
+    except TimeoutError:
+        return overloaded_response("Match took too long to score.", 1)
+    # Return XG for each model, in the same order as the match kicks.
     res = {
         "success": True,
         "mid": mid,
-        "model_name": model_name,
-        "match": match_xg
+        "model_names": model_names,
+        "model_versions": model_versions,
+        "model_errors": model_errors,
+        "kicks": [
+            {
+                "index": i,
+                "time": kick["time"],
+                "type": kick["type"],
+                "team": kick["fromTeam"],
+                "xg": {name: xg[i] for name, xg in xg_by_model.items()}
+            }
+            for i, kick in enumerate(match["kicks"])
+        ]
     }
-    return jsonify(res)
+    return to_json_response(res)
 
 
-@app.route("/xgtimeplot/<mid>.png")
+@routes.route("/xgtimeplot/<mid>.png")
 def get_xg_time_plot(mid):
     """
     Create and serve XG time plot for the given match.
+    Optional width and height args set the size in pixels. Plots are rendered
+    in a process pool and cached by match, model, and size.
     """
     try:
-        packed, stadium = get_match_and_stadium(mid)
-    except ValueError as e:
+        model = get_model(get_model_name(request))
+    except KeyError as e:
         return jsonify({
             "success": False,
             "message": str(e)
         })
-    model_name = get_model_name(request)
+    width, height = get_plot_size(request)
+    key = (mid, model.key, width, height, "png")
+    png = plot_cache.get(key)
+    if png is not None:
+        return Response(png, mimetype="image/png")
+    if not plot_slots.acquire(blocking=False):
+        return overloaded_response("Too many plots rendering, try again later.", 1)
+    try:
+        xg_time_ser, title = get_plot_data(mid, model)
+        with metrics.span("render"):
+            png = render_png(xg_time_ser, title, width, height)
+    except (ValueError, KeyError) as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        })
+    except Overloaded as e:
+        return overloaded_response(str(e), 1)
+    except (FutureTimeoutError, TimeoutError):
+        return overloaded_response("Plot took too long to render.", 1)
+    finally:
+        plot_slots.release()
+    plot_cache.put(key, png)
+    return Response(png, mimetype="image/png")
+
+
+@routes.route("/xgtimeplot/<mid>.svg")
+def get_xg_time_plot_svg(mid):
+    """
+    Create and serve XG time plot for the given match as a lightweight SVG,
+    drawn without matplotlib. Takes the same args as the PNG plot.
+    """
+    from haxml.viz import xg_time_plot_svg
     try:
-        clf, gen, pred = get_model_by_name(model_name)
+        model = get_model(get_model_name(request))
     except KeyError as e:
         return jsonify({
             "success": False,
             "message": str(e)
         })
-    match_xg = pred(inflate_match(packed), stadium, gen, clf)
-    # Create and save XG time plot.
-    fig, ax = plot_xg_time_series(match_xg)
-    # Add model name to a line in the chart title.
-    ax.set_title("{}\nXG Model: {}".format(ax.title.get_text(), model_name))
-    fig.set_size_inches(10, 6)
-    output = io.BytesIO()
-    FigureCanvas(fig).print_png(output)
-    return Response(output.getvalue(), mimetype="image/png")
+    width, height = get_plot_size(request)
+    key = (mid, model.key, width, height, "svg")
+    svg = plot_cache.get(key)
+    if svg is not None:
+        return Response(svg, mimetype="image/svg+xml")
+    if not plot_slots.acquire(blocking=False):
+        return overloaded_response("Too many plots rendering, try again later.", 1)
+    try:
+        xg_time_ser, title = get_plot_data(mid, model)
+        with metrics.span("render"):
+            svg = xg_time_plot_svg(xg_time_ser, title, width, height)
+    except (ValueError, KeyError) as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        })
+    except Overloaded as e:
+        return overloaded_response(str(e), 1)
+    except TimeoutError:
+        return overloaded_response("Plot took too long to render.", 1)
+    finally:
+        plot_slots.release()
+    plot_cache.put(key, svg)
+    return Response(svg, mimetype="image/svg+xml")
+
+
+@routes.route("/xgstream/<mid>")
+def get_xg_stream(mid):
+    """
+    Stream XG for new kicks in a live match as Server-Sent Events.
+    Each "kicks" event has kick fields and XG as columns, and its event ID is
+    the number of kicks sent so far, so reconnecting clients resume from there.
+    """
+    if not live_slots.acquire(blocking=False):
+        return live_overloaded_response()
+    try:
+        packed, stadium = get_match_and_stadium(mid)
+        model = get_model(get_model_name(request))
+        state = get_live_match(mid, model, packed, stadium)
+    except (ValueError, KeyError) as e:
+        live_slots.release()
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        })
+    start = get_live_start(request)
+    metrics.increment("live_streams")
+
+    def stream():
+        sent = start
+        end_time = time.time() + LIVE_MAX_STREAM_SECS
+        yield "retry: {}\n\n".format(int(1000 * LIVE_POLL_SECS))
+        while True:
+            if state.n_kicks > sent:
+                data = state.get_kicks(sent)
+                sent = data["n_kicks"]
+                event = "id: {}\nevent: kicks\ndata: {}\n\n"
+                yield event.format(sent, dumps(data).decode("utf-8"))
+            else:
+                yield ": keep-alive\n\n"
+            if time.time() >= end_time:
+                break
+            time.sleep(LIVE_POLL_SECS)
+            try:
+                packed = get_match_packed(mid)
+            except ValueError:
+                break
+            with metrics.span("live", model.name):
+                state.update(packed)
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    }
+    response = Response(stream(), mimetype="text/event-stream", headers=headers)
+    # The server closes the response when the stream ends, fails, or the
+    # client disconnects, even if the stream never started, so the slot is
+    # always released once.
+    response.call_on_close(live_slots.release)
+    return response
+
+
+@routes.route("/xgpoll/<mid>")
+def get_xg_poll(mid):
+    """
+    Long poll fallback for live XG. Waits up to the wait arg (in seconds) for
+    kicks after the index in the after arg, then returns them as columns.
+    """
+    if not live_slots.acquire(blocking=False):
+        return live_overloaded_response()
+    try:
+        packed, stadium = get_match_and_stadium(mid)
+        model = get_model(get_model_name(request))
+        state = get_live_match(mid, model, packed, stadium)
+        start = get_live_start(request)
+        wait = min(float(request.args.get("wait", 0)), LIVE_MAX_WAIT_SECS)
+        end_time = time.time() + wait
+        while state.n_kicks <= start and time.time() + LIVE_POLL_SECS <= end_time:
+            time.sleep(LIVE_POLL_SECS)
+            packed = get_match_packed(mid)
+            with metrics.span("live", model.name):
+                state.update(packed)
+    except (ValueError, KeyError) as e:
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        })
+    finally:
+        live_slots.release()
+    res = {
+        "success": True,
+        "mid": mid,
+        "model_name": model.name,
+        "model_version": model.version
+    }
+    res.update(state.get_kicks(start))
+    return to_json_response(res)
+
+
+@routes.route("/metrics")
+def get_metrics():
+    """
+    Latency histograms per route, stage, and model, with counters, payload
+    sizes, and startup time.
+    """
+    res = metrics.to_dict()
+    if precompute_worker is not None:
+        res["precompute"] = precompute_worker.get_stats()
+    res["ready"] = ready_event.is_set()
+    res["plot_cache"] = plot_cache.get_stats()
+    res["coalesce"] = score_flight.get_stats()
+    res["score_executor"] = score_executor.get_stats()
+    res["model_costs"] = cost_model.get_stats()
+    res["batching"] = {key: batcher.get_stats() for key, batcher in list(batchers.items())}
+    res["registry"] = get_registry().get_stats()
+    if shadow_worker is not None:
+        res["shadow"] = shadow_worker.get_stats()
+    return jsonify(res)
+
+
+@routes.route("/ready")
+def get_ready():
+    """
+    Readiness check, with status 503 until the database, stadiums, and default
+    model are loaded. Reports the time spent in each startup stage against the
+    startup budget.
+    """
+    res = dict(startup_report)
+    res["ready"] = ready_event.is_set()
+    res["startup_secs"] = dict(metrics.startup)
+    res["budget_secs"] = STARTUP_BUDGET_SECS
+    res = jsonify(res)
+    if not ready_event.is_set():
+        res.status_code = 503
+        res.headers["Retry-After"] = "1"
+    return res
+
+
+def make_precompute_worker():
+    """
+    Makes a worker that scores recent matches from the match source with the
+    default model and any models listed in precompute_models in .env file.
+    Each poll scores the current version of each model in the registry.
+    """
+    registry = get_registry()
+    model_names = [registry.default_name]
+    for model_name in config("precompute_models", default="").split(","):
+        if len(model_name) > 0 and model_name not in model_names:
+            registry.get(model_name)
+            model_names.append(model_name)
+    n_recent = config("precompute_recent", default=20, cast=int)
+    return PrecomputeWorker(
+        list_ids=lambda: get_match_source().list_ids(limit=n_recent),
+        score=precompute_result,
+        store=xg_store,
+        list_models=lambda: [get_model(model_name).key for model_name in model_names],
+        max_queue=config("precompute_max_queue", default=100, cast=int),
+        max_attempts=config("precompute_max_attempts", default=3, cast=int),
+        poll_secs=config("precompute_poll_secs", default=30.0, cast=float)
+    )
+
+
+# Precompute worker running in the server process, if enabled in .env file.
+precompute_worker = None
+
+
+def warm_up():
+    """
+    Loads the database, stadiums, and default model, then marks the server as
+    ready and reports the startup time against the budget.
+    """
+    try:
+        with metrics.startup_span("database", "Connecting to database"):
+            get_match_source()
+        with metrics.startup_span("stadiums", "Loading stadiums"):
+            get_stadium_dict()
+        with metrics.startup_span("models", "Loading models"):
+            registry = get_registry()
+            warm_model(registry.get(registry.default_name))
+    except Exception as e:
+        traceback.print_exc()
+        startup_report["error"] = str(e)
+        return
+    ready_secs = time.perf_counter() - BOOT_TIME
+    startup_report["ready_secs"] = ready_secs
+    startup_report["within_budget"] = ready_secs <= STARTUP_BUDGET_SECS
+    ready_event.set()
+    print("Ready in {:.1f} secs (budget: {:.1f} secs)".format(ready_secs, STARTUP_BUDGET_SECS))
+
+
+def create_app():
+    """
+    App factory for the prediction server.
+    With fast_boot (the default), the app is returned right away and the
+    database, stadiums, and default model load in a background thread, while
+    /ready reports whether they are done. Requests that arrive sooner load
+    what they need on demand.
+    Returns:
+        Flask app.
+    """
+    global precompute_worker, registry_watcher, shadow_worker
+    with metrics.startup_span("app"):
+        # Initialize Flask app and enable CORS.
+        app = Flask(__name__)
+        CORS(app, resource={"/*": {"origins": allow_list}})
+        app.register_blueprint(routes)
+    startup_report["boot_secs"] = time.perf_counter() - BOOT_TIME
+    if FAST_BOOT:
+        threading.Thread(target=warm_up, daemon=True).start()
+    else:
+        warm_up()
+    # Swap in new model versions when the registry manifest changes.
+    if registry_watcher is None:
+        registry_watcher = get_registry().watch(MODEL_REGISTRY, warm=warm_model, poll_secs=REGISTRY_POLL_SECS)
+    # Score the shadow candidate model in the background, if set in .env file.
+    if SHADOW_MODEL and shadow_worker is None:
+        get_registry().get(SHADOW_MODEL)
+        shadow_worker = ShadowWorker(score_shadow, SHADOW_LOG, max_queue=SHADOW_MAX_QUEUE)
+        shadow_worker.start()
+    # Run the precompute worker in the server process, if enabled in .env file.
+    if config("precompute_enabled", default=False, cast=bool) and precompute_worker is None:
+        precompute_worker = make_precompute_worker()
+        precompute_worker.start()
+    return app
 
 
 # Start the server on the default host.
 if __name__ == "__main__":
     print("Starting server...")
-    app.run(host="0.0.0.0", port=int(config("PORT")))
+    create_app().run(host="0.0.0.0", port=int(config("PORT")))
@@ -0,0 +1,11 @@
+"""
+WSGI entry point for gunicorn, see Procfile.
+"""
+
+import sys
+sys.path.append("./")
+
+from server import create_app
+
+
+app = create_app()
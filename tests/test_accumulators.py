@@ -0,0 +1,54 @@
+import sys
+sys.path.append("./")
+
+from haxml.accumulators import (
+    MetricAccumulator
+)
+from sklearn.metrics import roc_auc_score
+import numpy as np
+import pytest
+
+
+def make_kicks(n, xg, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.random(n) < np.clip(xg / xg.max() * 0.6, 0, 1)
+    match = np.array(["m{}".format(i // 40) for i in range(n)])
+    return match, y, xg
+
+
+def test_merge_matches_single_pass():
+    rng = np.random.default_rng(0)
+    match, y, xg = make_kicks(5000, rng.beta(0.5, 8, 5000))
+    single = MetricAccumulator()
+    single.update(match, y, xg)
+    merged = MetricAccumulator()
+    # Split so that some matches are in several batches.
+    for start in range(0, 5000, 730):
+        part = MetricAccumulator()
+        part.update(match[start:start + 730], y[start:start + 730], xg[start:start + 730])
+        merged.merge(part)
+    expected = single.result()
+    actual = merged.result()
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        assert actual[key] == pytest.approx(expected[key], rel=1e-9, nan_ok=True)
+
+
+def test_roc_auc_is_exact():
+    rng = np.random.default_rng(1)
+    match, y, xg = make_kicks(5000, rng.uniform(0, 1, 5000))
+    acc = MetricAccumulator()
+    acc.update(match, y, xg)
+    assert acc.result()["roc_auc"] == pytest.approx(roc_auc_score(y, xg > 0.5))
+
+
+@pytest.mark.parametrize("xg", [
+    np.random.default_rng(2).uniform(0, 0.0012, 20000),
+    np.random.default_rng(3).beta(0.5, 8, 20000),
+    np.random.default_rng(4).uniform(0, 1, 20000)
+])
+def test_roc_auc_xg_is_close_to_exact(xg):
+    match, y, xg = make_kicks(len(xg), xg)
+    acc = MetricAccumulator()
+    acc.update(match, y, xg)
+    assert acc.result()["roc_auc_xg"] == pytest.approx(roc_auc_score(y, xg), abs=0.002)
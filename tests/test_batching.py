@@ -0,0 +1,61 @@
+import sys
+sys.path.append("./")
+
+from haxml.batching import (
+    MicroBatcher
+)
+import numpy as np
+import threading
+
+
+class SumClassifier:
+    """
+    Predicts from the sum of each row, and counts its calls.
+    """
+    classes_ = np.array([0, 1])
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def predict_proba(self, X):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        p = np.asarray(X).sum(axis=1) / 100
+        return np.column_stack([1 - p, p])
+
+
+def run_concurrent(batcher, inputs):
+    outcomes = [None] * len(inputs)
+
+    def call(i):
+        try:
+            outcomes[i] = batcher.predict_proba(inputs[i])
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_each_caller_gets_its_own_rows():
+    clf = SumClassifier()
+    batcher = MicroBatcher(clf, window_ms=200)
+    inputs = [np.full((i + 1, 2), float(i)) for i in range(5)]
+    outcomes = run_concurrent(batcher, inputs)
+    for X, proba in zip(inputs, outcomes):
+        assert np.allclose(proba, clf.predict_proba(X))
+    assert batcher.n_calls == 5
+    assert batcher.n_batches < 5
+
+
+def test_each_caller_raises_its_own_copy_of_the_error():
+    batcher = MicroBatcher(SumClassifier(error=ValueError("bad rows")), window_ms=200)
+    errors = run_concurrent(batcher, [np.zeros((2, 2)) for _ in range(4)])
+    assert all(isinstance(e, ValueError) and str(e) == "bad rows" for e in errors)
+    assert len({id(e) for e in errors}) == 4
@@ -0,0 +1,80 @@
+import sys
+sys.path.append("./")
+
+from haxml.coalesce import (
+    SingleFlight
+)
+import pytest
+import threading
+import time
+
+
+def run_callers(flight, fn, n_callers):
+    """
+    Calls flight.do from several threads while fn blocks, so all but the
+    first thread wait for it. Returns the result or error of each thread.
+    """
+    outcomes = [None] * n_callers
+
+    def call(i):
+        try:
+            outcomes[i] = flight.do("key", fn, timeout=5)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n_callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def wait_for_followers(flight, n_followers):
+    while flight.get_stats()["followers"] < n_followers:
+        time.sleep(0.001)
+
+
+def test_followers_share_result():
+    flight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        wait_for_followers(flight, 3)
+        return "xg"
+
+    outcomes = run_callers(flight, fn, 4)
+    assert len(calls) == 1
+    assert sorted(shared for result, shared in outcomes) == [False, True, True, True]
+    assert all(result == "xg" for result, shared in outcomes)
+    assert flight.get_stats()["in_flight"] == 0
+
+
+def test_followers_raise_their_own_copy_of_the_error():
+    flight = SingleFlight()
+
+    def fn():
+        wait_for_followers(flight, 3)
+        raise ValueError("bad match")
+
+    errors = run_callers(flight, fn, 4)
+    assert all(isinstance(e, ValueError) and str(e) == "bad match" for e in errors)
+    assert len({id(e) for e in errors}) == 4
+    leaders = [e for e in errors if e.__cause__ is None]
+    assert len(leaders) == 1
+    assert all(e.__cause__ is leaders[0] for e in errors if e is not leaders[0])
+    assert flight.get_stats()["errors"] == 1
+
+
+def test_follower_times_out():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("key", release.wait))
+    leader.start()
+    while flight.get_stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    with pytest.raises(TimeoutError):
+        flight.do("key", lambda: None, timeout=0.01)
+    release.set()
+    leader.join()
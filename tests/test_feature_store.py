@@ -0,0 +1,85 @@
+import sys
+sys.path.append("./")
+
+from haxml.feature_store import (
+    FeatureStore
+)
+import copy
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+
+def make_rows(match_ids, stadium, date, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for mid in match_ids:
+        for i in range(10):
+            rows.append({
+                "match": mid,
+                "index": i,
+                "time": float(i * 30),
+                "goal_distance": float(rng.uniform(0, 500)),
+                "ag": int(i % 4 == 0),
+                "stadium": stadium,
+                "date": date,
+                "type": "goal" if i % 4 == 0 else "kick"
+            })
+    d = pd.DataFrame(rows)
+    for col in ["match", "stadium", "date", "type"]:
+        d[col] = d[col].astype("category")
+    return d
+
+
+def sort_rows(d):
+    d = d[sorted(d.columns)].copy()
+    for col in d.select_dtypes(include="category").columns:
+        d[col] = d[col].astype(str)
+    return d.sort_values(["match", "index"]).reset_index(drop=True)
+
+
+def test_append_read_round_trip(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    d1 = make_rows(["a", "b"], "NAFL Official Map v1", "2021-01-07")
+    d2 = make_rows(["c"], "Big Easy", "2021-01-08", seed=1)
+    store.append(d1, ["a", "b"])
+    store.append(d2, ["c", "empty"])
+    # Reopen, so the rows come from disk.
+    store = FeatureStore(str(tmp_path))
+    assert store.match_ids() == {"a", "b", "c", "empty"}
+    d_all = pd.concat([d1, d2], ignore_index=True)
+    pd.testing.assert_frame_equal(sort_rows(store.read()), sort_rows(d_all), check_dtype=False)
+    batches = list(store.iter_batches(batch_size=7))
+    assert sum(len(d) for d in batches) == len(d_all)
+
+
+def test_read_filters(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    store.append(make_rows(["a"], "NAFL Official Map v1", "2021-01-07"), ["a"])
+    store.append(make_rows(["b"], "Big Easy", "2021-01-08"), ["b"])
+    d = store.read(columns=["match", "time"], stadiums=["Big Easy"], max_time=60.0)
+    assert list(d["match"].astype(str).unique()) == ["b"]
+    assert d["time"].max() == 60.0
+    d = store.read(start_date="2021-01-08", types=["goal"])
+    assert set(d["match"].astype(str)) == {"b"}
+    assert set(d["type"].astype(str)) == {"goal"}
+
+
+def test_read_ignores_files_not_in_manifest(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    d = make_rows(["a"], "Big Easy", "2021-01-07")
+    store.append(d, ["a"])
+    manifest = copy.deepcopy(store.manifest)
+    # Append again, as if the process crashed before writing the manifest.
+    store.append(d, ["a"])
+    store.manifest = manifest
+    store.write_manifest()
+    assert len(FeatureStore(str(tmp_path)).read()) == len(d)
+
+
+def test_read_empty_store(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    assert len(store.read(columns=["match"])) == 0
+    assert list(store.iter_batches()) == []
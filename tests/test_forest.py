@@ -0,0 +1,62 @@
+import sys
+sys.path.append("./")
+
+from haxml.forest import (
+    compile_forest,
+    get_compiled_path,
+    load_classifier,
+    load_compiled_forest,
+    save_compiled_forest
+)
+from haxml.utils import (
+    get_file_sha256
+)
+from sklearn.ensemble import (
+    ExtraTreesClassifier,
+    RandomForestClassifier
+)
+from sklearn.tree import DecisionTreeClassifier
+import joblib
+import numpy as np
+import pytest
+
+
+def make_data(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 4))
+    y = (X[:, 0] + 0.5 * X[:, 1] + rng.normal(size=n) > 1).astype(int)
+    return X, y
+
+
+@pytest.mark.parametrize("clf", [
+    RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0),
+    ExtraTreesClassifier(n_estimators=20, min_samples_leaf=5, random_state=0),
+    DecisionTreeClassifier(max_depth=6, random_state=0)
+])
+def test_compiled_forest_matches_sklearn(clf):
+    X, y = make_data()
+    clf.fit(X, y)
+    X_test, _ = make_data(500, seed=1)
+    compiled = compile_forest(clf)
+    assert np.allclose(compiled.predict_proba(X_test), clf.predict_proba(X_test))
+    assert np.array_equal(compiled.predict(X_test), clf.predict(X_test))
+
+
+def test_saved_forest_matches_sklearn(tmp_path):
+    X, y = make_data()
+    clf = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    outfile = str(tmp_path / "forest.npz")
+    save_compiled_forest(compile_forest(clf), outfile)
+    assert np.allclose(load_compiled_forest(outfile).predict_proba(X), clf.predict_proba(X))
+
+
+def test_load_classifier_ignores_stale_compiled_forest(tmp_path):
+    X, y = make_data()
+    path = str(tmp_path / "model.pkl")
+    clf = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    joblib.dump(clf, path)
+    save_compiled_forest(compile_forest(clf), get_compiled_path(path), source_sha256=get_file_sha256(path))
+    assert type(load_classifier(path)).__name__ == "CompiledForest"
+    # Retrain without recompiling.
+    joblib.dump(RandomForestClassifier(n_estimators=5, random_state=1).fit(X, y), path)
+    assert isinstance(load_classifier(path), RandomForestClassifier)
@@ -0,0 +1,58 @@
+import sys
+sys.path.append("./")
+
+from haxml.forest import (
+    compile_forest,
+    get_compiled_path,
+    save_compiled_forest
+)
+from haxml.prediction import (
+    FEATURES_DEMO
+)
+from haxml.registry import (
+    ModelRegistry,
+    ModelVersion,
+    get_artifact_sha256
+)
+from sklearn.ensemble import RandomForestClassifier
+import joblib
+import numpy as np
+import pytest
+import server
+
+
+def make_model(tmp_path, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(0, 500, size=(200, 2))
+    y = X[:, 0] < 100
+    path = str(tmp_path / "model.pkl")
+    clf = RandomForestClassifier(n_estimators=3, random_state=seed).fit(X, y)
+    joblib.dump(clf, path)
+    return path, clf
+
+
+def test_artifact_hash_covers_compiled_forest(tmp_path):
+    path, clf = make_model(tmp_path)
+    sha256 = get_artifact_sha256(path)
+    save_compiled_forest(compile_forest(clf), get_compiled_path(path))
+    assert get_artifact_sha256(path) != sha256
+    assert get_artifact_sha256(str(tmp_path / "missing.pkl")) is None
+
+
+def test_load_rejects_hash_mismatch(tmp_path):
+    path, clf = make_model(tmp_path)
+    model = ModelVersion("rf", path, "demo", FEATURES_DEMO, sha256=get_artifact_sha256(path))
+    # Replace the model file after it was hashed.
+    make_model(tmp_path, seed=1)
+    registry = ModelRegistry([model], "rf", load=server.load_model)
+    with pytest.raises(ValueError, match="does not match its hash"):
+        registry.load(registry.get("rf"))
+    assert model.clf is None
+
+
+def test_load_accepts_matching_hash(tmp_path):
+    path, clf = make_model(tmp_path)
+    model = ModelVersion("rf", path, "demo", FEATURES_DEMO, sha256=get_artifact_sha256(path))
+    registry = ModelRegistry([model], "rf", load=server.load_model)
+    X = np.array([[50.0, 1.0], [400.0, 1.0]])
+    assert np.allclose(registry.load(model).predict_proba(X), clf.predict_proba(X))
@@ -0,0 +1,43 @@
+import sys
+sys.path.append("./")
+
+from haxml.utils import (
+    kfold_split_matches,
+    total_scored_goals
+)
+import random
+
+
+def make_metadata(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "match_id": "m{}".format(i),
+            "scored_goals_red": rng.randint(0, 5),
+            "scored_goals_blue": rng.randint(0, 5)
+        }
+        for i in range(n)
+    ]
+
+
+def test_kfold_split_matches_is_a_partition():
+    metadata = make_metadata(103)
+    folds = kfold_split_matches(metadata, n_folds=5, seed=1)
+    assert len(folds) == 5
+    ids = [meta["match_id"] for fold in folds for meta in fold]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == {meta["match_id"] for meta in metadata}
+    sizes = [len(fold) for fold in folds]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_kfold_split_matches_balances_goals():
+    metadata = make_metadata(500)
+    folds = kfold_split_matches(metadata, n_folds=5)
+    means = [sum(total_scored_goals(meta) for meta in fold) / len(fold) for fold in folds]
+    assert max(means) - min(means) < 0.1
+
+
+def test_kfold_split_matches_is_seeded():
+    metadata = make_metadata(50)
+    assert kfold_split_matches(metadata, seed=3) == kfold_split_matches(metadata, seed=3)